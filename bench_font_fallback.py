@@ -0,0 +1,101 @@
+"""
+Benchmark for per-glyph font fallback on mixed-script veil text.
+
+Builds a corpus of Latin / Arabic / Devanagari messages (single-script and
+mixed) and times three ways of picking a font per character and measuring the
+result across the card's font-size fit loop (56 → 26 px):
+
+  trial     render each character in each font until one draws a glyph
+  coverage  cmap bitmaps + run segmentation, caches cleared per pass
+  warm      the same with the run/width caches already populated
+
+  python bench_font_fallback.py --messages 200 --runs 3
+"""
+import argparse
+import random
+import statistics
+import time
+
+from PIL import Image, ImageDraw, ImageFont
+
+import fontfallback
+from fontfallback import get_fallback_font
+
+CHAIN = ("ariblk.ttf", "arabic2.ttf", "indian.ttf", "NotoSans-Regular.ttf")
+SIZES = range(56, 24, -2)
+
+WORDS = {
+    "latin": "the veil hides who said this guess wisely friends never tell secret message tonight".split(),
+    "arabic": "مرحبا بالعالم من قال هذا السر الليلة صديق رسالة خمن بحكمة".split(),
+    "devanagari": "नमस्ते दुनिया किसने कहा यह रहस्य आज रात दोस्त संदेश अनुमान".split(),
+}
+
+def build_corpus(n: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    scripts = list(WORDS)
+    corpus = []
+    for i in range(n):
+        # a third single-script, the rest mixing two or three scripts
+        pool = [scripts[i % 3]] if i % 3 == 0 else rng.sample(scripts, rng.choice((2, 3)))
+        corpus.append(" ".join(rng.choice(WORDS[rng.choice(pool)]) for _ in range(rng.randint(4, 24))))
+    return corpus
+
+def trial_pass(corpus: list[str]):
+    fonts = {size: [ImageFont.truetype(p, size) for p in CHAIN] for size in SIZES}
+    draw = ImageDraw.Draw(Image.new("RGBA", (1, 1)))
+    for text in corpus:
+        for size in SIZES:
+            width = 0.0
+            for ch in text:
+                font = fonts[size][0]
+                for candidate in fonts[size]:
+                    # a glyph that isn't .notdef renders differently from an unassigned codepoint
+                    if candidate.getmask(ch).getbbox() != candidate.getmask("\U0010FFFD").getbbox():
+                        font = candidate
+                        break
+                width += draw.textlength(ch, font=font)
+
+def coverage_pass(corpus: list[str], cold: bool):
+    if cold:
+        fontfallback.segment_runs.cache_clear()
+        fontfallback.run_width.cache_clear()
+        get_fallback_font.cache_clear()
+    for text in corpus:
+        for size in SIZES:
+            get_fallback_font(CHAIN[0], size, CHAIN).getlength(text)
+
+def report(name: str, samples: list[float], chars: int):
+    print(f"{name:<9} median {statistics.median(samples):9.2f} ms   "
+          f"{statistics.median(samples) * 1000 / chars:7.2f} µs/char")
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--messages", type=int, default=200)
+    ap.add_argument("--runs", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--skip-trial", action="store_true", help="trial rendering is slow on big corpora")
+    args = ap.parse_args()
+
+    corpus = build_corpus(args.messages, args.seed)
+    chars = sum(map(len, corpus)) * len(SIZES)
+
+    t0 = time.perf_counter()
+    fontfallback.font_chain(CHAIN)
+    print(f"🔤 Loaded cmap coverage for {len(CHAIN)} fonts in {(time.perf_counter() - t0) * 1000:.1f} ms")
+    print(f"📝 {len(corpus)} messages, {chars:,} characters measured per pass\n")
+
+    passes = {"coverage": lambda: coverage_pass(corpus, cold=True),
+              "warm": lambda: coverage_pass(corpus, cold=False)}
+    if not args.skip_trial:
+        passes = {"trial": lambda: trial_pass(corpus), **passes}
+
+    for name, fn in passes.items():
+        samples = []
+        for _ in range(args.runs):
+            t0 = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - t0) * 1000)
+        report(name, samples, chars)
+
+if __name__ == "__main__":
+    main()
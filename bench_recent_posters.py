@@ -0,0 +1,141 @@
+"""
+Benchmark for the Unveil dropdown's "recent posters" lookup.
+
+Seeds a scratch schema with a veil_messages table (default 1M rows, one busy
+channel holding a large share of them) plus the channel_recent_authors table
+the bot now maintains, then times the old GROUP BY query against the new
+bounded index scan.
+
+  python bench_recent_posters.py --rows 1000000 --runs 50
+
+Env: BENCH_DATABASE_URL (falls back to DATABASE_URL). Everything lives in the
+schema `veil_bench`, which is dropped afterwards unless --keep is given.
+"""
+import argparse
+import os
+import statistics
+import time
+
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SCHEMA = "veil_bench"
+HOT_CHANNEL = 1
+
+OLD_QUERY = """
+    SELECT author_id
+    FROM veil_messages
+    WHERE channel_id = %s
+    GROUP BY author_id
+    ORDER BY MAX(timestamp) DESC
+    LIMIT 50
+"""
+
+NEW_QUERY = """
+    SELECT author_id
+    FROM channel_recent_authors
+    WHERE channel_id = %s
+    ORDER BY last_posted_at DESC
+    LIMIT 50
+"""
+
+def seed(cur, rows: int, channels: int, authors: int, hot_share: float):
+    cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    cur.execute(f"CREATE SCHEMA {SCHEMA}")
+    cur.execute(f"SET search_path TO {SCHEMA}")
+    cur.execute("""
+        CREATE TABLE veil_messages (
+            id SERIAL PRIMARY KEY,
+            message_id BIGINT UNIQUE NOT NULL,
+            channel_id BIGINT NOT NULL,
+            author_id BIGINT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp TIMESTAMPTZ DEFAULT NOW()
+        )
+    """)
+    # hot_share of rows land in HOT_CHANNEL, the rest spread over the others
+    cur.execute("""
+        INSERT INTO veil_messages (message_id, channel_id, author_id, content, timestamp)
+        SELECT g,
+               CASE WHEN random() < %s THEN %s ELSE 2 + (random() * (%s - 2))::bigint END,
+               (random() * %s)::bigint,
+               'x',
+               NOW() - (random() * interval '365 days')
+        FROM generate_series(1, %s) AS g
+    """, (hot_share, HOT_CHANNEL, channels, authors, rows))
+    cur.execute("""
+        CREATE TABLE channel_recent_authors (
+            channel_id     BIGINT NOT NULL,
+            author_id      BIGINT NOT NULL,
+            last_posted_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (channel_id, author_id)
+        )
+    """)
+    cur.execute("CREATE INDEX idx_cra_channel_recent ON channel_recent_authors(channel_id, last_posted_at DESC)")
+    cur.execute("""
+        INSERT INTO channel_recent_authors (channel_id, author_id, last_posted_at)
+        SELECT channel_id, author_id, MAX(timestamp)
+        FROM veil_messages
+        GROUP BY channel_id, author_id
+    """)
+    cur.execute("ANALYZE veil_messages")
+    cur.execute("ANALYZE channel_recent_authors")
+
+def time_query(cur, query: str, runs: int) -> list[float]:
+    cur.execute(query, (HOT_CHANNEL,))   # warm the cache
+    cur.fetchall()
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        cur.execute(query, (HOT_CHANNEL,))
+        cur.fetchall()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+def plan(cur, query: str) -> str:
+    cur.execute("EXPLAIN (ANALYZE, BUFFERS) " + query, (HOT_CHANNEL,))
+    return "\n".join("    " + row[0] for row in cur.fetchall())
+
+def report(name: str, samples: list[float]):
+    samples = sorted(samples)
+    p95 = samples[max(0, int(len(samples) * 0.95) - 1)]
+    print(f"{name:<10} median {statistics.median(samples):8.2f} ms   p95 {p95:8.2f} ms")
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--channels", type=int, default=500)
+    ap.add_argument("--authors", type=int, default=20_000)
+    ap.add_argument("--hot-share", type=float, default=0.1, help="fraction of rows in the busy channel")
+    ap.add_argument("--runs", type=int, default=50)
+    ap.add_argument("--keep", action="store_true", help="keep the veil_bench schema")
+    ap.add_argument("--plans", action="store_true", help="print EXPLAIN ANALYZE for both queries")
+    args = ap.parse_args()
+
+    dsn = os.getenv("BENCH_DATABASE_URL") or os.getenv("DATABASE_URL")
+    if not dsn:
+        raise SystemExit("BENCH_DATABASE_URL / DATABASE_URL is not set")
+
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    cur = conn.cursor()
+    try:
+        t0 = time.perf_counter()
+        seed(cur, args.rows, args.channels, args.authors, args.hot_share)
+        print(f"🌱 Seeded {args.rows:,} veils in {time.perf_counter() - t0:.1f}s")
+
+        report("group by", time_query(cur, OLD_QUERY, args.runs))
+        report("recent", time_query(cur, NEW_QUERY, args.runs))
+        if args.plans:
+            print("\nGROUP BY plan:\n" + plan(cur, OLD_QUERY))
+            print("\nchannel_recent_authors plan:\n" + plan(cur, NEW_QUERY))
+    finally:
+        if not args.keep:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cur.close()
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Per-glyph font fallback for the card renderer.
+
+Each font's cmap is read once into a codepoint bitmap. Text is cut into runs
+by the first font in the chain that covers each character, and run widths are
+cached per (font, size, run), so mixed-script text is laid out without trial
+rendering. Font files that are missing or unreadable are skipped.
+
+`layout` picks Pillow's engine per call: "basic" for text that is already
+shaped and in visual order (reshaped Arabic), "raqm" to let libraqm shape
+complex scripts such as Devanagari when Pillow was built with it.
+
+FreeType faces are not safe to share between threads, so font objects are
+cached per thread; coverage, runs and widths are plain data and shared.
+"""
+import os
+import threading
+import unicodedata
+from functools import lru_cache
+
+from fontTools.ttLib import TTFont
+from PIL import Image, ImageDraw, ImageFont, features
+
+MAX_CODEPOINT = 0x110000
+RAQM = features.check("raqm")
+LAYOUT_ENGINES = {"basic": ImageFont.Layout.BASIC, "raqm": ImageFont.Layout.RAQM}
+
+# never pick a font on their own; they stay in the run they appear in
+JOINERS = {0x20, 0x200C, 0x200D, 0xFE0E, 0xFE0F}
+
+_local = threading.local()   # per-thread font objects + measuring canvas
+
+class FontCoverage:
+    """Codepoints a font has glyphs for, as a bitmap (~140 KB per font)."""
+    __slots__ = ("path", "bits", "count")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.bits = bytearray(MAX_CODEPOINT >> 3)
+        with TTFont(path, lazy=True) as tt:
+            cmap = tt.getBestCmap() or {}
+        for cp in cmap:
+            if cp < MAX_CODEPOINT:
+                self.bits[cp >> 3] |= 1 << (cp & 7)
+        self.count = len(cmap)
+
+    def covers(self, cp: int) -> bool:
+        return bool(self.bits[cp >> 3] & (1 << (cp & 7)))
+
+@lru_cache(maxsize=None)
+def load_coverage(path: str) -> FontCoverage | None:
+    if not os.path.isfile(path):
+        print(f"⚠️ Font {path} not found; skipped in fallback chain")
+        return None
+    try:
+        return FontCoverage(path)
+    except Exception as e:
+        print(f"⚠️ Could not read cmap of {path}: {e}")
+        return None
+
+@lru_cache(maxsize=64)
+def font_chain(paths: tuple[str, ...]) -> tuple[FontCoverage, ...]:
+    """Usable fonts of `paths`, de-duplicated, in order."""
+    return tuple(c for c in map(load_coverage, dict.fromkeys(paths)) if c)
+
+@lru_cache(maxsize=4096)
+def segment_runs(text: str, paths: tuple[str, ...]) -> tuple[tuple[str, str], ...]:
+    """Split text into (font_path, run) pairs; uncovered characters go to the primary font."""
+    fonts = font_chain(paths)
+    if not fonts:
+        raise OSError(f"no usable font in {paths}")
+    primary = fonts[0].path
+
+    runs, current, start = [], None, 0
+    for i, ch in enumerate(text):
+        cp = ord(ch)
+        if current and (cp in JOINERS or unicodedata.category(ch)[0] == "M"):
+            continue    # spaces and combining marks stay with their base
+        path = next((f.path for f in fonts if f.covers(cp)), primary)
+        if path != current:
+            if current:
+                runs.append((current, text[start:i]))
+            current, start = path, i
+    if text:
+        runs.append((current or primary, text[start:]))
+    return tuple(runs)
+
+def load_font(path: str, size: int, layout: str = "basic") -> ImageFont.FreeTypeFont:
+    fonts = getattr(_local, "fonts", None)
+    if fonts is None:
+        fonts = _local.fonts = {}
+    key = (path, size, layout)
+    font = fonts.get(key)
+    if font is None:
+        if len(fonts) >= 256:
+            fonts.clear()
+        # explicit engine: Pillow defaults to raqm when present, which would re-order pre-shaped text
+        font = fonts[key] = ImageFont.truetype(path, size, layout_engine=LAYOUT_ENGINES[layout])
+    return font
+
+@lru_cache(maxsize=16384)
+def run_width(path: str, size: int, run: str, layout: str = "basic") -> float:
+    measure = getattr(_local, "measure", None)
+    if measure is None:
+        measure = _local.measure = ImageDraw.Draw(Image.new("RGBA", (1, 1)))
+    return measure.textlength(run, font=load_font(path, size, layout))
+
+class FallbackFont:
+    """
+    Stands in for a FreeTypeFont in the card layout: metrics come from the
+    primary font, width and drawing go run by run.
+    """
+    def __init__(self, paths: tuple[str, ...], size: int, layout: str = "basic"):
+        self.paths = tuple(c.path for c in font_chain(paths))
+        if not self.paths:
+            raise OSError(f"no usable font in {paths}")
+        self.size = size
+        self.layout = layout if RAQM else "basic"
+
+    @property
+    def primary(self) -> ImageFont.FreeTypeFont:
+        return load_font(self.paths[0], self.size, self.layout)
+
+    def getmetrics(self):
+        return self.primary.getmetrics()
+
+    def runs(self, text: str):
+        return segment_runs(text, self.paths)
+
+    def getlength(self, text: str) -> float:
+        return sum(run_width(path, self.size, run, self.layout) for path, run in self.runs(text))
+
+    def draw(self, draw: ImageDraw.ImageDraw, xy, text: str, fill):
+        # runs share the primary font's baseline
+        x, y = xy
+        baseline = y + self.primary.getmetrics()[0]
+        for path, run in self.runs(text):
+            draw.text((x, baseline), run, font=load_font(path, self.size, self.layout), fill=fill, anchor="ls")
+            x += run_width(path, self.size, run, self.layout)
+
+@lru_cache(maxsize=256)
+def get_fallback_font(primary: str, size: int, chain: tuple[str, ...] = (), layout: str = "basic") -> FallbackFont:
+    return FallbackFont((primary, *chain), size, layout)
@@ -0,0 +1,136 @@
+"""
+Cluster launcher for VeilBot.
+
+Runs veilbot.py in CLUSTER_COUNT worker processes, each owning a contiguous
+block of shards (SHARD_IDS out of SHARD_COUNT), so rendering and event handling
+spread over several cores instead of one GIL. A crashed cluster is restarted
+with backoff; SIGTERM/SIGINT (e.g. a Heroku restart) stops every cluster.
+
+Env:
+  CLUSTER_COUNT          number of worker processes (default 1)
+  SHARD_COUNT            total shards (default: Discord's recommendation)
+  CLUSTER_IPC_BASE_PORT  cluster N serves stats on 127.0.0.1:(base + N)
+  PORT                   set on a Heroku web dyno; handed to the clusters as
+                         WEBHOOK_PORT (unless that is set) so cluster 0's payment
+                         webhook receiver gets the dyno's HTTP ingress. Needs
+                         VEIL_WEBHOOK_SECRET, or nothing binds and the dyno fails
+                         to boot — without a receiver run this as a worker instead.
+"""
+import asyncio
+import contextlib
+import os
+import secrets
+import signal
+import sys
+import time
+
+import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TOKEN = os.getenv("DISCORD_TOKEN")
+DISCORD_API_BASE = "https://discord.com/api/v10"
+BOT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "veilbot.py")
+
+RESTART_MIN_DELAY = 5      # seconds before the first restart
+RESTART_MAX_DELAY = 300    # backoff cap
+STABLE_AFTER      = 600    # a cluster up this long resets its backoff
+IDENTIFY_GAP      = 5.5    # Discord allows ~1 IDENTIFY per 5s (max_concurrency=1)
+
+def recommended_shard_count() -> int:
+    forced = int(os.getenv("SHARD_COUNT", "0"))
+    if forced:
+        return forced
+    r = requests.get(
+        f"{DISCORD_API_BASE}/gateway/bot",
+        headers={"Authorization": f"Bot {TOKEN}"},
+        timeout=10,
+    )
+    r.raise_for_status()
+    return int(r.json()["shards"])
+
+def split_shards(shard_count: int, cluster_count: int) -> list[list[int]]:
+    """Contiguous shard ranges, sizes differing by at most one."""
+    base, extra = divmod(shard_count, cluster_count)
+    ranges, start = [], 0
+    for i in range(cluster_count):
+        n = base + (1 if i < extra else 0)
+        ranges.append(list(range(start, start + n)))
+        start += n
+    return ranges
+
+class Supervisor:
+    def __init__(self, shard_count: int, cluster_count: int):
+        self.shard_count = shard_count
+        self.ranges = split_shards(shard_count, cluster_count)
+        self.procs: dict[int, asyncio.subprocess.Process] = {}
+        self.stopping = asyncio.Event()
+        self.env = {
+            **os.environ,
+            "CLUSTER_COUNT": str(cluster_count),
+            "SHARD_COUNT": str(shard_count),
+            "CLUSTER_IPC_SECRET": os.getenv("CLUSTER_IPC_SECRET") or secrets.token_hex(16),
+        }
+        if os.getenv("PORT") and not os.getenv("WEBHOOK_PORT"):
+            self.env["WEBHOOK_PORT"] = os.environ["PORT"]
+
+    async def run_cluster(self, cluster_id: int, shard_ids: list[int], start_delay: float):
+        if start_delay:
+            await self._sleep(start_delay)
+        delay = RESTART_MIN_DELAY
+        while not self.stopping.is_set():
+            env = {**self.env, "CLUSTER_ID": str(cluster_id), "SHARD_IDS": ",".join(map(str, shard_ids))}
+            started = time.monotonic()
+            proc = await asyncio.create_subprocess_exec(sys.executable, "-u", BOT_FILE, env=env)
+            self.procs[cluster_id] = proc
+            print(f"🚀 Cluster {cluster_id} started (pid {proc.pid}, shards {shard_ids[0]}–{shard_ids[-1]})")
+
+            code = await proc.wait()
+            self.procs.pop(cluster_id, None)
+            if self.stopping.is_set():
+                break
+
+            if time.monotonic() - started >= STABLE_AFTER:
+                delay = RESTART_MIN_DELAY
+            print(f"💥 Cluster {cluster_id} exited with code {code}; restarting in {delay}s")
+            await self._sleep(delay)
+            delay = min(delay * 2, RESTART_MAX_DELAY)
+
+    async def _sleep(self, seconds: float):
+        # returns early if we're shutting down
+        try:
+            await asyncio.wait_for(self.stopping.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    def stop(self):
+        if self.stopping.is_set():
+            return
+        print("🛑 Stopping clusters…")
+        self.stopping.set()
+        for proc in list(self.procs.values()):
+            if proc.returncode is None:
+                proc.terminate()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            with contextlib.suppress(NotImplementedError):   # not on Windows loops
+                loop.add_signal_handler(sig, self.stop)
+
+        print(f"✅ Launching {len(self.ranges)} cluster(s) for {self.shard_count} shard(s)")
+        # Stagger launches so clusters don't IDENTIFY at the same time
+        tasks, offset = [], 0.0
+        for cid, shard_ids in enumerate(self.ranges):
+            tasks.append(asyncio.create_task(self.run_cluster(cid, shard_ids, offset)))
+            offset += IDENTIFY_GAP * len(shard_ids)
+        await asyncio.gather(*tasks)
+
+def main():
+    shard_count = recommended_shard_count()
+    cluster_count = max(1, min(int(os.getenv("CLUSTER_COUNT", "1")), shard_count))
+    asyncio.run(Supervisor(shard_count, cluster_count).run())
+
+if __name__ == "__main__":
+    main()
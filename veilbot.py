@@ -4,14 +4,19 @@ from discord.ui import Modal, TextInput, Button, View, Select
 from discord.app_commands import AppCommandError, CheckFailure
 from PIL import Image, ImageDraw, ImageFont, ImageFilter, ImageOps, ImageChops
 from datetime import datetime, timedelta, timezone
-from collections import Counter
+from collections import Counter, OrderedDict, deque
+from array import array
 from dotenv import load_dotenv
 from psycopg2 import sql
+from psycopg2.pool import ThreadedConnectionPool
 from copy import deepcopy
+from functools import lru_cache, partial
+from concurrent.futures import ThreadPoolExecutor
 from discord import PartialEmoji
 from typing import Optional, Literal, Union
 from discord.errors import HTTPException
 from bidi.algorithm import get_display
+from fontfallback import RAQM, FallbackFont, get_fallback_font
 from io import BytesIO
 import io
 import os
@@ -22,10 +27,19 @@ import string
 import stripe
 import requests
 import asyncio
+import bisect
+import random
+import threading
+import time
 import emoji
 import regex
 import contextlib
+import hashlib
+import hmac
+import json
 import arabic_reshaper
+import aiohttp
+from aiohttp import web
 
 load_dotenv()
 
@@ -34,9 +48,53 @@ stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
 # Load database URL from environment
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "8"))   # connections for worker threads
+
+_db_pool = None
+_db_pool_lock = threading.Lock()
+_db_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX)   # getconn() raises instead of waiting
+
+def get_db_pool() -> ThreadedConnectionPool:
+    global _db_pool
+    with _db_pool_lock:
+        if _db_pool is None:
+            _db_pool = ThreadedConnectionPool(0, DB_POOL_MAX, DATABASE_URL, sslmode='require')
+        return _db_pool
+
+@contextlib.contextmanager
+def pooled_cursor():
+    """Like get_safe_cursor, on a pooled connection of its own: commit/rollback only touch this block."""
+    pool = get_db_pool()
+    with _db_pool_slots:
+        db = pool.getconn()
+        try:
+            with db.cursor() as ping:
+                ping.execute("SELECT 1")
+        except (psycopg2.InterfaceError, psycopg2.OperationalError):
+            pool.putconn(db, close=True)
+            db = pool.getconn()
+
+        cur = db.cursor()
+        try:
+            yield cur
+            db.commit()
+        except Exception:
+            with contextlib.suppress(Exception):
+                db.rollback()
+            raise
+        finally:
+            cur.close()
+            pool.putconn(db, close=bool(db.closed))
+
 @contextlib.contextmanager
 def get_safe_cursor():
     global conn
+    # `conn` belongs to the event-loop thread; code in asyncio.to_thread gets a pooled one
+    if threading.current_thread() is not threading.main_thread():
+        with pooled_cursor() as cur:
+            yield cur
+        return
+
     try:
         # ping to detect a dead connection
         with conn.cursor() as ping:
@@ -56,10 +114,15 @@ def get_safe_cursor():
     finally:
         cur.close()
 
+SCHEMA_LOCK_KEY = 0x5645494C0001   # advisory lock: one cluster at a time runs the DDL + backfills
+
 def init_db():
     try:
         conn = psycopg2.connect(DATABASE_URL, sslmode='require')
         cursor = conn.cursor()
+        # every cluster calls this at startup; the rest wait here and then find
+        # the schema current (held until the commit below)
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", (SCHEMA_LOCK_KEY,))
 
         # ─── veil_messages ─────────────────────────────────────────────────────
         cursor.execute('''
@@ -236,6 +299,75 @@ def init_db():
         sub_cols = {row[0] for row in cursor.fetchall()}
         if 'subscription_id' not in sub_cols:
             cursor.execute("ALTER TABLE veil_subscriptions ADD COLUMN subscription_id TEXT")
+        # per-guild /veil rate overrides (veils per minute; NULL = tier default)
+        if 'veil_rate_user' not in sub_cols:
+            cursor.execute("ALTER TABLE veil_subscriptions ADD COLUMN veil_rate_user INTEGER")
+        if 'veil_rate_guild' not in sub_cols:
+            cursor.execute("ALTER TABLE veil_subscriptions ADD COLUMN veil_rate_guild INTEGER")
+
+        # ─── veil_rate_buckets (per-user token buckets shared by clusters) ──
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS veil_rate_buckets (
+                bucket     TEXT PRIMARY KEY,
+                tokens     DOUBLE PRECISION NOT NULL,
+                updated_at TIMESTAMPTZ NOT NULL
+            )
+        """)
+
+        # ─── payment_failed_notices (queue fed by a trigger, drained by the bot) ──
+        # The Stripe webhook flips veil_subscriptions.payment_failed; the trigger
+        # turns that into one pending notice per guild + a NOTIFY so the bot can
+        # deliver within seconds instead of polling.
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS payment_failed_notices (
+                guild_id   BIGINT PRIMARY KEY,
+                queued_at  TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                claimed_at TIMESTAMPTZ
+            )
+        """)
+        cursor.execute("""
+            CREATE OR REPLACE FUNCTION veil_queue_payment_failed() RETURNS trigger AS $$
+            BEGIN
+                INSERT INTO payment_failed_notices (guild_id)
+                VALUES (NEW.guild_id)
+                ON CONFLICT (guild_id) DO UPDATE
+                    SET queued_at = NOW(), claimed_at = NULL;
+                PERFORM pg_notify('veil_payment_failed', NEW.guild_id::text);
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql
+        """)
+        cursor.execute("DROP TRIGGER IF EXISTS trg_veil_payment_failed ON veil_subscriptions")
+        cursor.execute("""
+            CREATE TRIGGER trg_veil_payment_failed
+            AFTER INSERT OR UPDATE OF payment_failed ON veil_subscriptions
+            FOR EACH ROW WHEN (NEW.payment_failed)
+            EXECUTE FUNCTION veil_queue_payment_failed()
+        """)
+        # flags raised before the trigger existed
+        cursor.execute("""
+            INSERT INTO payment_failed_notices (guild_id)
+            SELECT guild_id FROM veil_subscriptions WHERE payment_failed = TRUE
+            ON CONFLICT (guild_id) DO NOTHING
+        """)
+
+        # ─── payment_webhook_events (idempotency keys for the receiver) ─────
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS payment_webhook_events (
+                event_id    TEXT PRIMARY KEY,
+                kind        TEXT,
+                received_at TIMESTAMPTZ DEFAULT NOW()
+            )
+        """)
+        cursor.execute("""
+            SELECT column_name
+              FROM information_schema.columns
+             WHERE table_name = 'payment_webhook_events'
+        """)
+        if 'processed_at' not in {row[0] for row in cursor.fetchall()}:
+            # NULL = claimed, still being handled; older keys were all recorded up front
+            cursor.execute("ALTER TABLE payment_webhook_events ADD COLUMN processed_at TIMESTAMPTZ")
+            cursor.execute("UPDATE payment_webhook_events SET processed_at = received_at")
 
         # ─── coin_checkout_sessions (for editing ephemeral after purchase) ───
         cursor.execute('''
@@ -266,6 +398,133 @@ def init_db():
             )
         """)
 
+        # ─── channel_recent_authors (last veil per author per channel) ───────
+        # Feeds the Unveil dropdown with a bounded index scan instead of a
+        # GROUP BY over the whole channel history.
+        cursor.execute("SELECT to_regclass('channel_recent_authors') IS NULL")
+        needs_backfill = cursor.fetchone()[0]
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS channel_recent_authors (
+                channel_id     BIGINT NOT NULL,
+                author_id      BIGINT NOT NULL,
+                last_posted_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                PRIMARY KEY (channel_id, author_id)
+            )
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_cra_channel_recent
+            ON channel_recent_authors(channel_id, last_posted_at DESC)
+        """)
+        if needs_backfill:
+            cursor.execute("""
+                INSERT INTO channel_recent_authors (channel_id, author_id, last_posted_at)
+                SELECT channel_id, author_id, MAX(timestamp)
+                FROM veil_messages
+                GROUP BY channel_id, author_id
+                ON CONFLICT DO NOTHING
+            """)
+
+        # ─── stats counters (bumped in the send/guess transactions) ─────────
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS guild_stats (
+                guild_id       BIGINT PRIMARY KEY,
+                veils_sent     BIGINT NOT NULL DEFAULT 0,
+                veils_unveiled BIGINT NOT NULL DEFAULT 0,
+                backfilled_at  TIMESTAMPTZ
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS guild_user_stats (
+                guild_id   BIGINT NOT NULL,
+                user_id    BIGINT NOT NULL,
+                correct    INTEGER NOT NULL DEFAULT 0,
+                incorrect  INTEGER NOT NULL DEFAULT 0,
+                veils_sent INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (guild_id, user_id)
+            )
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_gus_guild_correct
+            ON guild_user_stats(guild_id, correct DESC)
+        """)
+        cursor.execute("""
+            SELECT column_name
+              FROM information_schema.columns
+             WHERE table_name = 'guild_user_stats'
+        """)
+        stat_cols = {row[0] for row in cursor.fetchall()}
+        needs_votes_backfill = 'votes' not in stat_cols
+        if needs_votes_backfill:
+            cursor.execute("ALTER TABLE guild_user_stats ADD COLUMN votes INTEGER NOT NULL DEFAULT 0")
+
+        # ─── daily rollups (time-windowed leaderboards) ────────────────────
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS unveil_daily (
+                guild_id BIGINT NOT NULL,
+                day      DATE NOT NULL,
+                user_id  BIGINT NOT NULL,
+                unveils  INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (guild_id, day, user_id)
+            )
+        """)
+        cursor.execute("SELECT to_regclass('vote_daily') IS NULL")
+        needs_vote_backfill = cursor.fetchone()[0]
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS vote_daily (
+                guild_id BIGINT NOT NULL,
+                day      DATE NOT NULL,
+                user_id  BIGINT NOT NULL,
+                votes    INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (guild_id, day, user_id)
+            )
+        """)
+        # vote_events is written by the top.gg receiver, not this process, so
+        # the rollups are maintained by a trigger on insert. The trigger goes in
+        # first: CREATE TRIGGER locks out inserts until this transaction commits,
+        # so the backfills below see every earlier vote and the trigger every later one.
+        cursor.execute("""
+            CREATE OR REPLACE FUNCTION veil_vote_rollup() RETURNS trigger AS $$
+            BEGIN
+                INSERT INTO vote_daily (guild_id, day, user_id, votes)
+                VALUES (NEW.guild_id, (NEW.voted_at AT TIME ZONE 'UTC')::date, NEW.user_id, 1)
+                ON CONFLICT (guild_id, day, user_id) DO UPDATE SET votes = vote_daily.votes + 1;
+                INSERT INTO guild_user_stats (guild_id, user_id, votes)
+                VALUES (NEW.guild_id, NEW.user_id, 1)
+                ON CONFLICT (guild_id, user_id) DO UPDATE SET votes = guild_user_stats.votes + 1;
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql
+        """)
+        cursor.execute("DROP TRIGGER IF EXISTS vote_events_rollup ON vote_events")
+        cursor.execute("""
+            CREATE TRIGGER vote_events_rollup
+            AFTER INSERT ON vote_events
+            FOR EACH ROW EXECUTE FUNCTION veil_vote_rollup()
+        """)
+        if needs_vote_backfill:
+            cursor.execute("""
+                INSERT INTO vote_daily (guild_id, day, user_id, votes)
+                SELECT guild_id, (voted_at AT TIME ZONE 'UTC')::date, user_id, COUNT(*)
+                FROM vote_events
+                GROUP BY 1, 2, 3
+                ON CONFLICT (guild_id, day, user_id) DO NOTHING
+            """)
+        if needs_votes_backfill:
+            cursor.execute("""
+                INSERT INTO guild_user_stats (guild_id, user_id, votes)
+                SELECT guild_id, user_id, COUNT(*) FROM vote_events GROUP BY guild_id, user_id
+                ON CONFLICT (guild_id, user_id) DO UPDATE SET votes = EXCLUDED.votes
+            """)
+
+        # ─── bot_meta (small key/value store, e.g. command tree hash) ───────
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS bot_meta (
+                key        TEXT PRIMARY KEY,
+                value      TEXT NOT NULL,
+                updated_at TIMESTAMPTZ DEFAULT NOW()
+            )
+        """)
+
         conn.commit()
         return conn, cursor
 
@@ -297,13 +556,65 @@ APPLICATION_EMOJIS = {
     "10th": 1404977804621123697
 }
 
-intents = discord.Intents.default()
-intents.guilds = True
-intents.members = True   # ✅ Approved and required for dropdown guesses
+OWNER_IDS = {568583831985061918}  # <-- your Discord user ID(s)
+SUPPORT_SERVER_ID = 1394932709394087946  # Your support server ID
+SUPPORT_CHANNEL_ID = 1399973286649008158  # The channel where webhook posts
+DISCORD_API_BASE = "https://discord.com/api/v10"
+UPGRADE_RE = re.compile(
+    r"guild\s+(\d+)\s+upgraded\s+to\s+\*{0,2}([A-Za-z]+)\*{0,2}\s+tier!?",
+    re.IGNORECASE,
+)
+COIN_RE = re.compile(
+    r"^\[COIN_TOPUP\]\s+session_id=(\S+)\s+user_id=(\d+)\s+guild_id=(\d+)\s+coins=(\d+)\s*$"
+)
+
+# Embedded payment webhook receiver (POST /webhooks/payment). 0 = disabled, and
+# payment events only arrive through the relay channel above.
+WEBHOOK_PORT      = int(os.getenv("WEBHOOK_PORT", "0"))
+WEBHOOK_SECRET    = os.getenv("VEIL_WEBHOOK_SECRET", "")
+WEBHOOK_TOLERANCE = 300   # seconds a signed timestamp stays valid
+WEBHOOK_LEASE     = 120   # an unfinished claim older than this was orphaned by a crash
 
 conn, _ = init_db()
 
-client = discord.AutoShardedClient(intents=intents)   # one process, many shards
+# ─── Clustering ───────────────────────────────────────────────────────────
+# launcher.py runs several copies of this file, each owning a contiguous block
+# of shards. Run directly (no env set) and this process owns every shard.
+CLUSTER_ID    = int(os.getenv("CLUSTER_ID", "0"))
+CLUSTER_COUNT = int(os.getenv("CLUSTER_COUNT", "1"))
+SHARD_COUNT   = int(os.getenv("SHARD_COUNT", "0")) or None
+SHARD_IDS     = [int(s) for s in os.getenv("SHARD_IDS", "").split(",") if s.strip()] or None
+IPC_HOST      = "127.0.0.1"
+IPC_BASE_PORT = int(os.getenv("CLUSTER_IPC_BASE_PORT", "8790"))
+IPC_SECRET    = os.getenv("CLUSTER_IPC_SECRET", "")
+
+# ─── Gateway intents ──────────────────────────────────────────────────────
+# Only what we use: guilds (channels/roles), members (UnveilView dropdown).
+# Message events are needed solely for the payment relay channel — not at all
+# once the webhook receiver is on, and only in the cluster owning that guild.
+def _owns_support_guild() -> bool:
+    if not SHARD_IDS:
+        return True
+    return (SUPPORT_SERVER_ID >> 22) % (SHARD_COUNT or 1) in SHARD_IDS
+
+RELAY_ENABLED = not WEBHOOK_PORT and _owns_support_guild()
+
+intents = discord.Intents.none()
+intents.guilds = True
+intents.members = True   # ✅ Approved and required for dropdown guesses
+intents.guild_messages = RELAY_ENABLED
+
+GATEWAY_STATS = os.getenv("GATEWAY_STATS") == "1"   # log events/sec + RSS every minute
+
+client = discord.AutoShardedClient(   # one process, many shards (per cluster)
+    intents=intents,
+    shard_count=SHARD_COUNT,
+    shard_ids=SHARD_IDS,
+    # Don't request every member of every guild on connect; guilds are chunked
+    # lazily (see ensure_guild_chunked) or in the background for veil guilds.
+    chunk_guilds_at_startup=False,
+    enable_debug_events=GATEWAY_STATS,
+)
 tree = app_commands.CommandTree(client)
 # ✅ make the attribute exist before any events fire
 client.app_emojis = {
@@ -311,6 +622,28 @@ client.app_emojis = {
     for name, eid in APPLICATION_EMOJIS.items()
 }
 client.skins = {}
+client.chunking = {}   # guild_id -> lazy member chunk task in flight
+
+@client.event
+async def setup_hook():
+    # Peer clusters ask us for stats over localhost (see gather_cluster_stats)
+    if CLUSTER_COUNT > 1:
+        try:
+            await start_ipc_server()
+            print(f"✅ Cluster {CLUSTER_ID} IPC listening on {IPC_HOST}:{IPC_BASE_PORT + CLUSTER_ID}")
+        except Exception as e:
+            print(f"❌ Failed to start cluster IPC: {e}")
+
+    # Payment webhooks land on cluster 0; upgrades for other clusters are forwarded
+    if WEBHOOK_PORT and CLUSTER_ID == 0:
+        if not WEBHOOK_SECRET:
+            print("⚠️ WEBHOOK_PORT set without VEIL_WEBHOOK_SECRET — receiver not started")
+        else:
+            try:
+                await start_webhook_server()
+                print(f"✅ Payment webhook receiver listening on :{WEBHOOK_PORT}")
+            except Exception as e:
+                print(f"❌ Failed to start webhook receiver: {e}")
 
 @client.event
 async def on_shard_ready(shard_id: int):
@@ -327,7 +660,16 @@ async def on_shard_disconnect(shard_id: int):
 
 @client.event
 async def on_ready():
-    print(f"logged in as {client.user} with {client.shard_count} shard(s)")
+    # on_ready fires again after reconnects — only do startup work once
+    if getattr(client, "booted", False):
+        print(f"🔄 Ready again as {client.user} (reconnect) — startup work skipped")
+        return
+    client.booted = True
+
+    print(
+        f"logged in as {client.user} with {client.shard_count} shard(s)"
+        f" — cluster {CLUSTER_ID + 1}/{CLUSTER_COUNT}, shards {sorted(client.shards)}"
+    )
 
     # Skins (9-slice) — load once
     try:
@@ -345,28 +687,68 @@ async def on_ready():
     print("✅ Loaded application emojis")
 
     # Background tasks
-    client.loop.create_task(notify_failed_payments())
+    client.loop.create_task(payment_failed_listener())
+    client.loop.create_task(chunk_veil_guilds())
+    client.loop.create_task(backfill_stats_counters())
+    if CLUSTER_ID == 0:
+        client.loop.create_task(prune_rolled_up_events())
+    if GATEWAY_STATS:
+        client.loop.create_task(log_gateway_stats())
     
-    # Sync commands
-    await tree.sync()
-    print("✅ Command Tree Synced")
+    # Sync commands (global, so one cluster is enough) — only when they changed
+    if CLUSTER_ID == 0:
+        try:
+            await sync_tree_if_changed()
+        except Exception as e:
+            print(f"❌ Command tree sync failed: {e}")
 
     # Persistent view(s)
     client.add_view(WelcomeView())
     client.add_view(StoreView())
     await hydrate_latest_views()
 
-OWNER_IDS = {568583831985061918}  # <-- your Discord user ID(s)
-SUPPORT_SERVER_ID = 1394932709394087946  # Your support server ID
-SUPPORT_CHANNEL_ID = 1399973286649008158  # The channel where webhook posts
-DISCORD_API_BASE = "https://discord.com/api/v10"
-UPGRADE_RE = re.compile(
-    r"guild\s+(\d+)\s+upgraded\s+to\s+\*{0,2}([A-Za-z]+)\*{0,2}\s+tier!?",
-    re.IGNORECASE,
-)
-COIN_RE = re.compile(
-    r"^\[COIN_TOPUP\]\s+session_id=(\S+)\s+user_id=(\d+)\s+guild_id=(\d+)\s+coins=(\d+)\s*$"
-)
+def command_tree_hash() -> str:
+    """Stable hash of every global command's payload (names, options, descriptions, perms)."""
+    payload = sorted(
+        (cmd.to_dict(tree) for cmd in tree.get_commands()),
+        key=lambda d: (d.get("type", 1), d["name"])
+    )
+    blob = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+def get_bot_meta(key: str) -> str | None:
+    try:
+        with get_safe_cursor() as cur:
+            cur.execute("SELECT value FROM bot_meta WHERE key = %s", (key,))
+            row = cur.fetchone()
+            return row[0] if row else None
+    except Exception as e:
+        print(f"⚠️ bot_meta read failed for {key}: {e}")
+        return None
+
+def set_bot_meta(key: str, value: str):
+    with get_safe_cursor() as cur:
+        cur.execute("""
+            INSERT INTO bot_meta (key, value, updated_at)
+            VALUES (%s, %s, NOW())
+            ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, updated_at = NOW()
+        """, (key, value))
+
+async def sync_tree_if_changed(force: bool = False) -> bool:
+    """Global tree.sync() only when the command tree differs from the last synced one."""
+    current = command_tree_hash()
+    if not force and get_bot_meta("command_tree_hash") == current:
+        print("✅ Command Tree unchanged — sync skipped")
+        return False
+
+    await tree.sync()
+    try:
+        set_bot_meta("command_tree_hash", current)
+    except Exception as e:
+        print(f"⚠️ Could not store command tree hash: {e}")
+    print("✅ Command Tree Synced")
+    return True
+
 
 emoji_patternz = re.compile(r"<a?:([a-zA-Z0-9_]+):(\d+)>")  # matches <:name:id> and <a:name:id>
 emoji_sequence_pattern = regex.compile(r'\X', regex.UNICODE)
@@ -410,9 +792,6 @@ discord_emoji_pattern = re.compile(r"<a?:\w+:(\d+)>", re.IGNORECASE)
 TWEMOJI_BASE = "https://cdn.jsdelivr.net/gh/twitter/twemoji@latest/assets/72x72"
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # folder where veilbot.py is
 PNG_EMOJI_DIR = os.path.join(BASE_DIR, "png")
-ARABIC_RE = re.compile(r'[\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF]')
-CJK_RE = re.compile(r'[\u3400-\u4DBF\u4E00-\u9FFF\uF900-\uFAFF]')
-DEVANAGARI_RE = re.compile(r'[\u0900-\u097F]')
 MENTION_RE = re.compile(r"<(@!?|@&|#)(\d+)>")
 SKINS_ROOT = os.path.join(BASE_DIR, "skins")  # skins/<pack>/{veil,unveil}/...
 VEIL_FRAMES = {
@@ -486,6 +865,20 @@ FONT_MAP = {
     "devanagari": "indian.ttf",   # NotoSansDevanagari
 }
 
+# per-glyph fallback after the message's primary font; missing files are skipped
+FONT_FALLBACK_CHAIN = (
+    FONT_MAP["latin"], FONT_MAP["arabic"], FONT_MAP["devanagari"], FONT_MAP["cjk"],
+    "NotoSans-Regular.ttf",
+)
+
+def card_font(font_file: str, size: int, layout: str = "basic") -> FallbackFont:
+    return get_fallback_font(font_file, size, FONT_FALLBACK_CHAIN, layout)
+
+def text_length(draw, text: str, font) -> float:
+    if isinstance(font, FallbackFont):
+        return font.getlength(text)
+    return draw.textlength(text, font=font)
+
 MAX_SRC_LONG = 1600  # pick your comfort number
 
 def get_max_guesses(guild_id: int) -> int:
@@ -527,35 +920,91 @@ def ensure_settings_row(guild_id: int):
 def _safe_display_name(member):
     return member.display_name if member else None
 
+MENTION_FETCH_CONCURRENCY = 4      # parallel fetch_user calls, bot-wide
+MENTION_NAME_TTL          = 900    # seconds a resolved name is reused
+MENTION_MISS_TTL          = 120    # ... and an unknown/deleted user
+MENTION_DEADLINE          = 1.5    # seconds a veil waits before using user:<id>
+MENTION_CACHE_MAX         = 10_000
+
+client.mention_names = {}      # user_id -> (expires_at, name or None)
+client.mention_fetches = {}    # user_id -> in-flight fetch task
+mention_fetch_sem = asyncio.Semaphore(MENTION_FETCH_CONCURRENCY)
+
+async def _fetch_mention_name(client: discord.Client, user_id: int):
+    try:
+        async with mention_fetch_sem:
+            try:
+                u = await client.fetch_user(user_id)
+            except discord.NotFound:
+                u = None
+            except Exception as e:
+                print(f"⚠️ fetch_user({user_id}) failed: {e}")
+                return None   # transient: don't cache
+        name = (u.global_name or u.name) if u else None
+        if len(client.mention_names) >= MENTION_CACHE_MAX:
+            now = time.monotonic()
+            client.mention_names = {k: v for k, v in client.mention_names.items() if v[0] > now}
+        ttl = MENTION_NAME_TTL if name else MENTION_MISS_TTL
+        client.mention_names[user_id] = (time.monotonic() + ttl, name)
+        return name
+    finally:
+        client.mention_fetches.pop(user_id, None)
+
+async def resolve_mention_names(user_ids, client: discord.Client) -> dict[int, str | None]:
+    """
+    Names for users outside the member cache. Lookups run concurrently and are
+    shared between veils; anything unresolved by MENTION_DEADLINE maps to None
+    (its fetch keeps going and fills the cache for next time).
+    """
+    names, pending = {}, {}
+    now = time.monotonic()
+    for user_id in user_ids:
+        hit = client.mention_names.get(user_id)
+        if hit and hit[0] > now:
+            names[user_id] = hit[1]
+            continue
+        u = client.get_user(user_id)
+        if u:
+            names[user_id] = u.global_name or u.name
+            continue
+        task = client.mention_fetches.get(user_id)
+        if task is None:
+            task = asyncio.create_task(_fetch_mention_name(client, user_id))
+            client.mention_fetches[user_id] = task
+        pending[user_id] = task
+
+    if pending:
+        await asyncio.wait(pending.values(), timeout=MENTION_DEADLINE)
+        for user_id, task in pending.items():
+            names[user_id] = task.result() if task.done() and not task.cancelled() else None
+    return names
+
 async def normalize_mentions(text: str, guild: discord.Guild, client: discord.Client) -> str:
     """Turn <@id>, <@!id>, <@&id>, <#id> into @name / @role / #channel (no pings)."""
     if not text or not guild:
         return text
 
     replacements = {}
+    found = MENTION_RE.findall(text)
+
+    # users outside the member cache are resolved together, not one REST call at a time
+    missing = {
+        int(raw_id) for kind, raw_id in found
+        if kind.startswith("@") and kind != "@&" and not guild.get_member(int(raw_id))
+    }
+    fetched = await resolve_mention_names(missing, client) if missing else {}
 
-    for kind, raw_id in MENTION_RE.findall(text):
+    for kind, raw_id in found:
         full_tag = f"<{kind}{raw_id}>"
         if full_tag in replacements:
             continue
 
         _id = int(raw_id)
 
-        if kind.startswith("@"):  # user mention <@id> or <@!id>
-            name = None
+        if kind.startswith("@") and kind != "@&":  # user mention <@id> or <@!id>
             m = guild.get_member(_id)
-            if m:
-                name = _safe_display_name(m)
-            else:
-                # fallback to global user cache / fetch (non-blocking if cached)
-                u = client.get_user(_id)
-                if not u:
-                    try:
-                        u = await client.fetch_user(_id)
-                    except Exception:
-                        u = None
-                name = (u.global_name or u.name) if u else f"user:{_id}"
-            replacements[full_tag] = f"@{name}"
+            name = _safe_display_name(m) if m else fetched.get(_id)
+            replacements[full_tag] = f"@{name or f'user:{_id}'}"
 
         elif kind == "@&":  # role mention
             role = guild.get_role(_id)
@@ -576,46 +1025,198 @@ async def normalize_mentions(text: str, guild: discord.Guild, client: discord.Cl
     return MENTION_RE.sub(sub_fn, text)
 
 def detect_script(text: str) -> str:
-    if ARABIC_RE.search(text):
-        return "arabic"
-    if CJK_RE.search(text):
-        return "cjk"
-    if DEVANAGARI_RE.search(text):
-        return "devanagari"
-    return "latin"
+    return analyze_text(text).script
 
 def get_render_text_and_font(text: str):
+    """(render_text, font_file, layout) — pass all three to the card painter."""
     script = detect_script(text)
+    render_text, layout = shape_text(text, script)
+    return render_text, FONT_MAP.get(script, FONT_MAP["latin"]), layout
 
+@lru_cache(maxsize=2048)
+def shape_text(text: str, script: str) -> tuple[str, str]:
+    # Arabic is reshaped + reordered once up front and drawn with the basic engine;
+    # with raqm the other complex scripts (Devanagari conjuncts) are shaped by the font engine
     if script == "arabic":
-        render_text = shape_rtl(text)
-        font_file = FONT_MAP["arabic"]
-    elif script == "cjk":
-        render_text = text  # no shaping
-        font_file = FONT_MAP["cjk"]
-    elif script == "devanagari":
-        render_text = text  # no shaping
-        font_file = FONT_MAP["devanagari"]
-    else:
-        render_text = text
-        font_file = FONT_MAP["latin"]
-
-    return render_text, font_file
+        return shape_rtl(text), "basic"
+    return text, "raqm" if RAQM else "basic"
 
 def shape_rtl(s: str) -> str:
     # reshape Arabic letters into contextual forms, then reorder visually (RTL)
     reshaped = arabic_reshaper.reshape(s)
     return get_display(reshaped)
 
-def count_emojis_all(text: str) -> int:
-    custom = len(CUSTOM_EMOJI_RE.findall(text))
-    # emoji.emoji_list finds full emoji sequences (ZWJ, flags, keycaps) like iPhone sends
-    unicode_count = len(emoji.emoji_list(text))
-    return custom + unicode_count
+# ===================== TEXT ANALYSIS =====================
+# One grapheme walk per string; validation, layout and rendering all reuse it.
+GRAPHEME_RE = regex.compile(r"<a?:\w+:\d+>|\X")
+WORD_CHAR_RE = re.compile(r"\w")
+
+class Token(str):
+    """A layout token; `kind` says how to measure/draw it without re-detecting."""
+    kind = "word"
+
+class SpaceToken(Token):
+    kind = "space"
+
+class EmojiToken(Token):
+    kind = "emoji"          # Unicode emoji (single, ZWJ sequence, flag, keycap)
+    sprite = None           # local png path; None → no local sprite, drawn as text
+
+class CustomEmojiToken(Token):
+    kind = "custom"         # <:name:id> / <a:name:id>
+
+def normalize_emoji_seq(seq: str) -> str:
+    # presentation selectors vary by keyboard; ZWJ is structural and stays
+    return seq.replace("\uFE0F", "").replace("\uFE0E", "")
+
+class EmojiIndex:
+    """
+    Twemoji sprites actually present in png/, keyed by normalized codepoint
+    sequence. \\X already cuts text into whole emoji clusters (ZWJ, flags,
+    keycaps, skin tones), so resolving one is a single dict lookup.
+    """
+    def __init__(self, folder: str):
+        self.sprites: dict[str, str] = {}
+        if not os.path.isdir(folder):
+            return
+        for name in os.listdir(folder):
+            stem, ext = os.path.splitext(name)
+            if ext.lower() != ".png":
+                continue
+            try:
+                seq = "".join(chr(int(cp, 16)) for cp in stem.split("-"))
+            except ValueError:
+                continue   # e.g. stray "2b50-fe0f.png.png"
+            if len(seq) == 1 and 0xE000 <= ord(seq) <= 0xF8FF:
+                continue   # private-use easter eggs aren't emoji
+            self.sprites.setdefault(normalize_emoji_seq(seq), os.path.join(folder, name))
+
+    def lookup(self, cluster: str) -> str | None:
+        return self.sprites.get(normalize_emoji_seq(cluster))
+
+EMOJI_INDEX = EmojiIndex(PNG_EMOJI_DIR)
+
+@lru_cache(maxsize=512)
+def load_emoji_sprite(path: str, size: int) -> Image.Image | None:
+    """Decoded + resized sprite; shared, so callers must not draw on it."""
+    try:
+        return Image.open(path).convert("RGBA").resize((size, size), Image.LANCZOS)
+    except Exception as e:
+        print(f"⚠️ local twemoji load error for {path}: {e}")
+        return None
+
+@lru_cache(maxsize=256)
+def load_custom_emoji(emoji_id: str, size: int) -> Image.Image:
+    """
+    Custom emoji from the CDN, resized; shared like load_emoji_sprite. Raises
+    on failure so a miss is retried next time instead of cached.
+    """
+    resp = requests.get(f"https://cdn.discordapp.com/emojis/{emoji_id}.png?size=96", timeout=5)
+    if resp.status_code != 200:
+        raise OSError(f"HTTP {resp.status_code}")
+    return Image.open(io.BytesIO(resp.content)).convert("RGBA").resize((size, size), Image.LANCZOS)
+
+def make_emoji_token(cluster: str, sprite: str | None) -> "EmojiToken":
+    token = EmojiToken(cluster)
+    token.sprite = sprite
+    return token
+
+SPACE = SpaceToken(" ")
+
+def is_emoji_token(token: str) -> bool:
+    kind = getattr(token, "kind", None)
+    if kind is not None:
+        return kind == "emoji" or kind == "custom"
+    # plain strings (badges, ellipsis, split word parts) — detect the slow way
+    return bool(discord_emoji_pattern.fullmatch(token)) or emoji.is_emoji(token.strip())
+
+def script_of(ch: str) -> str | None:
+    cp = ord(ch)
+    if 0x0600 <= cp <= 0x06FF or 0x0750 <= cp <= 0x077F or 0x08A0 <= cp <= 0x08FF:
+        return "arabic"
+    if 0x3400 <= cp <= 0x4DBF or 0x4E00 <= cp <= 0x9FFF or 0xF900 <= cp <= 0xFAFF:
+        return "cjk"
+    if 0x0900 <= cp <= 0x097F:
+        return "devanagari"
+    if ch.isalpha():
+        return "latin"
+    return None   # digits, punctuation, symbols: take the neighbours' script
+
+class TextAnalysis:
+    __slots__ = ("emoji_count", "visual_length", "script", "runs", "tokens")
+
+    def __init__(self, emoji_count: int, visual_length: int, script: str,
+                 runs: tuple[tuple[str, str], ...], tokens: tuple[Token, ...]):
+        self.emoji_count = emoji_count      # custom + unicode emoji
+        self.visual_length = visual_length  # graphemes; an emoji counts as 1
+        self.script = script                # dominant font script (arabic > cjk > devanagari > latin)
+        self.runs = runs                    # ((script, text), ...) consecutive same-script spans
+        self.tokens = tokens                # typed wrap tokens, words upper-cased
+
+@lru_cache(maxsize=1024)
+def analyze_text(text: str) -> TextAnalysis:
+    graphemes = GRAPHEME_RE.findall(text)
+    tokens: list[Token] = []
+    runs: list[list] = []
+    scripts = set()
+    emoji_count = 0
+    word = []
+
+    def flush_word():
+        if word:
+            tokens.append(Token("".join(word).upper()))
+            word.clear()
+
+    def add_run(script: str, g: str):
+        if runs and runs[-1][0] == script:
+            runs[-1][1] += g
+        else:
+            runs.append([script, g])
+
+    for i, g in enumerate(graphemes):
+        if g[0] == "<" and discord_emoji_pattern.fullmatch(g):
+            if CUSTOM_EMOJI_RE.fullmatch(g):
+                emoji_count += 1
+            # keep custom emoji off adjacent words (a space each side)
+            if word and WORD_CHAR_RE.match(word[-1][-1]):
+                flush_word()
+                tokens.append(SPACE)
+            flush_word()
+            tokens.append(CustomEmojiToken(g))
+            if i + 1 < len(graphemes) and WORD_CHAR_RE.match(graphemes[i + 1][0]):
+                tokens.append(SPACE)
+        elif not g.isascii() and ((sprite := EMOJI_INDEX.lookup(g)) or emoji.is_emoji(g)):
+            emoji_count += 1
+            flush_word()
+            tokens.append(make_emoji_token(g, sprite))
+        elif g.isspace():
+            flush_word()
+            tokens.append(SPACE)
+            if runs:
+                runs[-1][1] += g
+        else:
+            word.append(g)
+            script = script_of(g[0])
+            if script:
+                scripts.add(script)
+                add_run(script, g)
+            else:
+                add_run(runs[-1][0] if runs else "latin", g)
+    flush_word()
 
-def visual_length(text: str) -> int:
-    parts = regex.findall(r"(<a?:\w{1,32}:\d{17,20}>|\X)", text)
-    return len(parts)
+    for script in ("arabic", "cjk", "devanagari"):
+        if script in scripts:
+            break
+    else:
+        script = "latin"
+
+    return TextAnalysis(
+        emoji_count=emoji_count,
+        visual_length=len(graphemes),
+        script=script,
+        runs=tuple((s, t) for s, t in runs),
+        tokens=tuple(tokens),
+    )
 
 def _format_price(cents: int) -> str:
     return f"${cents/100:.2f}"
@@ -649,7 +1250,10 @@ def draw_text_with_shadow(image, position, text, font, fill,
     shadow_draw = ImageDraw.Draw(shadow_layer)
 
     # Draw shadow text
-    shadow_draw.text((x + offset[0], y + offset[1]), text, font=font, fill=shadow_color)
+    if isinstance(font, FallbackFont):
+        font.draw(shadow_draw, (x + offset[0], y + offset[1]), text, shadow_color)
+    else:
+        shadow_draw.text((x + offset[0], y + offset[1]), text, font=font, fill=shadow_color)
 
     # Blur the shadow
     blurred_shadow = shadow_layer.filter(ImageFilter.GaussianBlur(blur_radius))
@@ -659,7 +1263,10 @@ def draw_text_with_shadow(image, position, text, font, fill,
 
     # Draw actual text on top
     draw = ImageDraw.Draw(image)
-    draw.text((x, y), text, font=font, fill=fill)
+    if isinstance(font, FallbackFont):
+        font.draw(draw, (x, y), text, fill)
+    else:
+        draw.text((x, y), text, font=font, fill=fill)
 
 def trim_emoji(img: Image.Image) -> Image.Image:
     bbox = img.getbbox()
@@ -676,71 +1283,33 @@ def unicode_to_twemoji_url(cluster: str) -> str:
 
 def tokenize_message_for_wrap(text: str):
     """Tokenize text for wrapping, keeping words intact and handling emojis properly."""
-    tokens = []
-    current_word = ""
-
-    # 1️⃣ Separate Discord custom emojis from words (adds spaces around them)
-    text = re.sub(r'(?<=\w)(<a?:\w+:\d+>)', r' \1', text)  # add space before
-    text = re.sub(r'(<a?:\w+:\d+>)(?=\w)', r'\1 ', text)    # add space after
-
-    # 2️⃣ Capture either a custom emoji OR a grapheme cluster
-    pattern = regex.compile(r"(<a?:\w+:\d+>|\X)", regex.UNICODE)
-    graphemes = pattern.findall(text)
-
-    def flush_word():
-        nonlocal current_word
-        if current_word:
-            tokens.append(current_word.upper())
-            current_word = ""
-
-    for g in graphemes:
-        if discord_emoji_pattern.fullmatch(g):
-            # ✅ Custom emoji <:name:id>
-            flush_word()
-            tokens.append(g)
-        elif emoji.is_emoji(g):
-            # ✅ Unicode emoji (single or ZWJ sequence)
-            flush_word()
-            tokens.append(g)
-        elif g.isspace():
-            # ✅ Space
-            flush_word()
-            tokens.append(" ")
-        else:
-            # ✅ Normal character → build word
-            current_word += g
-
-    flush_word()
-    return tokens
+    return list(analyze_text(text).tokens)
 
-async def render_emojis(draw, image, tokens, x_start, y, font, emoji_size, emoji_padding, color):
+def render_emojis(draw, image, tokens, x_start, y, font, emoji_size, emoji_padding, color, emoji_offset=17):
     for token in tokens:
         raw_token = token
         stripped = token.strip()
         em_img = None
         emoji_offset_y = 0
+        kind = getattr(token, "kind", None)   # typed tokens skip re-detection
 
         # 1) Custom Discord emoji via CDN
-        m = discord_emoji_pattern.fullmatch(stripped)
+        m = discord_emoji_pattern.fullmatch(stripped) if kind in (None, "custom") else None
         if m:
             emoji_id = m.group(1)
-            url = f"https://cdn.discordapp.com/emojis/{emoji_id}.png?size=96"
             try:
-                resp = requests.get(url, timeout=5)
-                if resp.status_code == 200:
-                    em_img = (
-                        Image.open(io.BytesIO(resp.content))
-                        .convert("RGBA")
-                        .resize((emoji_size, emoji_size), Image.LANCZOS)
-                    )
-                    emoji_offset_y = 17
-                else:
-                    print(f"⚠️ custom emoji {emoji_id} returned HTTP {resp.status_code}")
+                em_img = load_custom_emoji(emoji_id, emoji_size)
+                emoji_offset_y = emoji_offset
             except Exception as e:
                 print(f"⚠️ custom emoji fetch error for {emoji_id}: {e}")
 
         # 2) Unicode emoji (iPhone/Twemoji) → local, then CDN
-        if em_img is None and stripped:
+        if kind == "emoji":
+            # resolved at tokenization: sprite path, or None = not drawable locally
+            if token.sprite:
+                em_img = load_emoji_sprite(token.sprite, emoji_size)
+                emoji_offset_y = emoji_offset
+        elif em_img is None and stripped and kind is None:
             parts = emoji.emoji_list(stripped)  # robust: catches ZWJ, flags, keycaps, skin tones
             if parts:
                 # Use the first emoji span inside this token
@@ -764,7 +1333,7 @@ async def render_emojis(draw, image, tokens, x_start, y, font, emoji_size, emoji
                                 .convert("RGBA")
                                 .resize((emoji_size, emoji_size), Image.LANCZOS)
                             )
-                            emoji_offset_y = 17
+                            emoji_offset_y = emoji_offset
                             break
                         except Exception as e:
                             print(f"⚠️ local twemoji load error for {codepoints}: {e}")
@@ -783,7 +1352,7 @@ async def render_emojis(draw, image, tokens, x_start, y, font, emoji_size, emoji
                                     .convert("RGBA")
                                     .resize((emoji_size, emoji_size), Image.LANCZOS)
                                 )
-                                emoji_offset_y = 17
+                                emoji_offset_y = emoji_offset
                                 break
                             else:
                                 tried_cdn.append((resp.status_code, tw_url))
@@ -826,7 +1395,7 @@ async def render_emojis(draw, image, tokens, x_start, y, font, emoji_size, emoji
                 offset=(2, 2),
                 blur_radius=3
             )
-            x_start += draw.textlength(raw_token, font=font)
+            x_start += text_length(draw, raw_token, font)
 
     return x_start
     
@@ -836,9 +1405,9 @@ def build_wrapped_lines(tokens, font, box_width, draw, emoji_size=48, emoji_padd
     current_width = 0
 
     def token_width(token):
-        if discord_emoji_pattern.fullmatch(token) or emoji.is_emoji(token.strip()):
+        if is_emoji_token(token):
             return emoji_size + emoji_padding
-        return draw.textlength(token, font=font)
+        return text_length(draw, token, font)
 
     for token in tokens:
         width = token_width(token)
@@ -859,7 +1428,7 @@ def build_wrapped_lines(tokens, font, box_width, draw, emoji_size=48, emoji_padd
             current_part = ""
             for char in token:
                 test_part = current_part + char
-                if draw.textlength(test_part, font=font) > box_width and current_part:
+                if text_length(draw, test_part, font) > box_width and current_part:
                     split_parts.append(current_part)
                     current_part = char
                 else:
@@ -888,10 +1457,7 @@ def build_wrapped_lines(tokens, font, box_width, draw, emoji_size=48, emoji_padd
 def calculate_line_y(line_tokens, font, base_y):
     """Adjust baseline if line is mostly emoji (iOS/multi-emoji fix)."""
     ascent, _ = font.getmetrics()
-    emoji_count = sum(
-        1 for t in line_tokens
-        if discord_emoji_pattern.fullmatch(t) or emoji.is_emoji(t.strip())
-    )
+    emoji_count = sum(1 for t in line_tokens if is_emoji_token(t))
     if line_tokens and emoji_count >= len(line_tokens) * 0.7:
         return base_y + int(ascent * 0.35)  # shift down for emoji alignment
     return base_y
@@ -1109,6 +1675,7 @@ def set_veil_admin_channel(guild_id, channel_id):
             ON CONFLICT (guild_id) DO UPDATE SET channel_id = EXCLUDED.channel_id
         ''', (guild_id, channel_id))
         conn.commit()
+    forget_admin_log_channel(guild_id)
 
 def get_veil_admin_channel(guild_id):
     with get_safe_cursor() as cur:
@@ -1133,6 +1700,7 @@ def set_subscription_tier(guild_id, tier, renews_at=None):
                 subscribed_at = NOW()
         ''', (guild_id, tier, renews_at))
         conn.commit()
+    forget_admin_log_channel(guild_id)
 
 def refill_user_coins(user_id, guild_id):
     with get_safe_cursor() as cur:
@@ -1239,18 +1807,26 @@ def set_guild_tier_sync(guild_id: int, tier: str):
                 payment_failed  = FALSE
         """, (guild_id, tier))
 
+    forget_admin_log_channel(guild_id)
     print(f"[admin] Forced guild {guild_id} → tier={tier}")
 
+def warm_webhook_dyno():
+    """Wake the Stripe webhook dyno without blocking the caller (or the event loop)."""
+    def _warm():
+        try:
+            res = requests.get("https://veilstripewebhook-5062fc7c0b88.herokuapp.com/", timeout=3)
+            print(f"🟢 Webhook warmed: {res.status_code}")
+        except Exception as e:
+            print("⚠️ Failed to warm webhook:", e)
+    threading.Thread(target=_warm, daemon=True).start()
+
 def create_coin_checkout_session(user_id: int, guild_id: int, coins: int) -> stripe.checkout.Session | None:
     price_id = COIN_PRICE_IDS.get(coins)
     if not price_id:
         return None
 
-    # warm the webhook dyno (optional)
-    try:
-        requests.get("https://veilstripewebhook-5062fc7c0b88.herokuapp.com/", timeout=3)
-    except Exception:
-        pass
+    # warm the webhook dyno (optional, fire-and-forget)
+    warm_webhook_dyno()
 
     # build success/cancel redirect to Veil channel (same as your tier flow)
     with get_safe_cursor() as cur:
@@ -1318,11 +1894,7 @@ def create_checkout_session(user_id, guild_id, tier):
     if not price_id:
         return None  # invalid tier
 
-    try:
-        res = requests.get("https://veilstripewebhook-5062fc7c0b88.herokuapp.com/")
-        print(f"🟢 Webhook warmed: {res.status_code}")
-    except Exception as e:
-        print("⚠️ Failed to warm webhook:", e)
+    warm_webhook_dyno()
 
     try:
         # ✅ Fetch the veil channel from DB
@@ -1359,58 +1931,399 @@ def create_checkout_session(user_id, guild_id, tier):
         print(f"❌ Failed to create Stripe session: {e}")
         return None
 
-async def notify_failed_payments():
-    await client.wait_until_ready()
-    while not client.is_closed():
-        try:
-            conn = psycopg2.connect(DATABASE_URL, sslmode='require')
-            cur = conn.cursor()
-            cur.execute("""
-                SELECT s.guild_id, c.channel_id
-                FROM veil_subscriptions s
-                JOIN veil_channels c ON s.guild_id = c.guild_id
-                WHERE s.payment_failed = TRUE
-            """)
-            rows = cur.fetchall()
-
-            for guild_id, channel_id in rows:
-                channel = client.get_channel(channel_id)
-                if channel:
-                    embed = discord.Embed(
-                        title="❌ Payment Failed",
-                        description="Your guild’s payment failed. You’ve been reverted to the **Free Tier**.",
-                        color=0x992d22
-                    )
-                    await channel.send(embed=embed)
+PAYMENT_FAILED_CHANNEL   = "veil_payment_failed"   # NOTIFY channel (see init_db trigger)
+PAYMENT_NOTICE_BATCH     = 50
+PAYMENT_NOTICE_SENDS     = 5      # concurrent channel.send()s
+PAYMENT_NOTICE_SWEEP     = 300    # safety sweep (seconds) in case a NOTIFY was missed
+PAYMENT_NOTICE_LEASE_MIN = 5      # a claim older than this is considered abandoned
 
-            # Reset the flags
-            cur.execute("UPDATE veil_subscriptions SET payment_failed = FALSE WHERE payment_failed = TRUE")
-            conn.commit()
-            cur.close()
-            conn.close()
+def claim_payment_failed_notices(limit: int = PAYMENT_NOTICE_BATCH) -> list[tuple[int, int | None]]:
+    """
+    Claim pending notices for guilds on OUR shards. SKIP LOCKED keeps other
+    clusters off the same rows; the claim acts as a lease so a crash mid-send
+    only delays the notice instead of losing it.
+    Returns [(guild_id, veil_channel_id | None)].
+    """
+    shard_ids = list((getattr(client, "shards", {}) or {}).keys()) or [0]
+    shard_count = client.shard_count or 1
+    # own connection: the lease must commit on its own, not with whatever the loop has open
+    with pooled_cursor() as cur:
+        cur.execute("""
+            UPDATE payment_failed_notices n
+               SET claimed_at = NOW()
+             WHERE n.guild_id IN (
+                    SELECT guild_id
+                      FROM payment_failed_notices
+                     WHERE ((guild_id >> 22) %% %s) = ANY(%s)
+                       AND (claimed_at IS NULL
+                            OR claimed_at < NOW() - make_interval(mins => %s))
+                     ORDER BY queued_at
+                     LIMIT %s
+                     FOR UPDATE SKIP LOCKED
+             )
+         RETURNING n.guild_id,
+                   (SELECT c.channel_id FROM veil_channels c WHERE c.guild_id = n.guild_id)
+        """, (shard_count, shard_ids, PAYMENT_NOTICE_LEASE_MIN, limit))
+        return cur.fetchall()
+
+def finish_payment_failed_notices(done: list[int], retry: list[int]):
+    with pooled_cursor() as cur:
+        if done:
+            # claimed_at is reset by the trigger if the guild failed AGAIN meanwhile
+            cur.execute("""
+                DELETE FROM payment_failed_notices
+                 WHERE guild_id = ANY(%s) AND claimed_at IS NOT NULL
+             RETURNING guild_id
+            """, (done,))
+            cleared = [r[0] for r in cur.fetchall()]
+            if cleared:
+                cur.execute(
+                    "UPDATE veil_subscriptions SET payment_failed = FALSE WHERE guild_id = ANY(%s)",
+                    (cleared,)
+                )
+        if retry:
+            cur.execute(
+                "UPDATE payment_failed_notices SET claimed_at = NULL WHERE guild_id = ANY(%s)",
+                (retry,)
+            )
 
-        except Exception as e:
-            print("❌ Error notifying failed payments:", e)
+async def drain_payment_failed_notices():
+    sem = asyncio.Semaphore(PAYMENT_NOTICE_SENDS)
 
-        await asyncio.sleep(900)  # every 15 minutes
+    async def deliver(guild_id: int, channel_id: int | None) -> bool:
+        """True = done (sent or undeliverable), False = retry later."""
+        channel = client.get_channel(channel_id) if channel_id else None
+        if not channel:
+            return True
+        embed = discord.Embed(
+            title="❌ Payment Failed",
+            description="Your guild’s payment failed. You’ve been reverted to the **Free Tier**.",
+            color=0x992d22
+        )
+        async with sem:
+            try:
+                await channel.send(embed=embed)
+                return True
+            except (discord.Forbidden, discord.NotFound):
+                return True
+            except Exception as e:
+                print(f"⚠️ Payment-failed notice to guild {guild_id} failed: {e}")
+                return False
 
-def count_incorrect_guesses_for_guild(guesser_id: int, guild: discord.Guild) -> int:
-    """# of incorrect guesses this user made in THIS guild."""
-    channel_ids = tuple(c.id for c in guild.text_channels)
-    if not channel_ids:
-        return 0
+    while True:
+        rows = await asyncio.to_thread(claim_payment_failed_notices)
+        if not rows:
+            return
+        results = await asyncio.gather(*(deliver(g, c) for g, c in rows))
+        done  = [g for (g, _), ok in zip(rows, results) if ok]
+        retry = [g for (g, _), ok in zip(rows, results) if not ok]
+        await asyncio.to_thread(finish_payment_failed_notices, done, retry)
+        for guild_id in done:
+            forget_admin_log_channel(guild_id)   # the payment failure reverted them to free
+        if retry or len(rows) < PAYMENT_NOTICE_BATCH:
+            return
 
-    with get_safe_cursor() as cur:
-        cur.execute("""
-            SELECT COUNT(*)
-            FROM veil_guesses g
-            JOIN veil_messages m ON m.message_id = g.message_id
-            WHERE g.guesser_id = %s
-              AND g.is_correct = FALSE
-              AND m.channel_id IN %s
-        """, (guesser_id, channel_ids))
+async def payment_failed_listener():
+    """LISTEN for failed payments and deliver the notices within seconds."""
+    await client.wait_until_ready()
+    loop = asyncio.get_running_loop()
+    wake = asyncio.Event()
+    wake.set()  # drain whatever queued up while we were offline
+    listen_conn = None
+
+    def close_listener():
+        nonlocal listen_conn
+        if listen_conn is not None:
+            with contextlib.suppress(Exception):
+                loop.remove_reader(listen_conn.fileno())
+            with contextlib.suppress(Exception):
+                listen_conn.close()
+        listen_conn = None
+
+    def on_readable():
+        db = listen_conn
+        if db is None:   # closed by the reconnect path; a callback was still queued
+            return
+        try:
+            db.poll()
+        except Exception:
+            # dead socket — stop watching it; the loop below reconnects
+            with contextlib.suppress(Exception):
+                loop.remove_reader(db.fileno())
+        db.notifies.clear()
+        wake.set()
+
+    while not client.is_closed():
+        try:
+            if listen_conn is None or listen_conn.closed:
+                listen_conn = psycopg2.connect(DATABASE_URL, sslmode='require')
+                listen_conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with listen_conn.cursor() as cur:
+                    cur.execute(f"LISTEN {PAYMENT_FAILED_CHANNEL}")
+                loop.add_reader(listen_conn.fileno(), on_readable)
+                wake.set()  # anything queued while we were reconnecting
+
+            try:
+                await asyncio.wait_for(wake.wait(), timeout=PAYMENT_NOTICE_SWEEP)
+            except asyncio.TimeoutError:
+                pass
+            wake.clear()
+            listen_conn.poll()  # raises if the LISTEN connection died
+            await drain_payment_failed_notices()
+
+        except Exception as e:
+            print("❌ Error notifying failed payments:", e)
+            close_listener()
+            await asyncio.sleep(10)
+
+    close_listener()
+
+# ===================== STATS COUNTERS =====================
+def bump_veil_sent(cur, guild_id: int, author_id: int):
+    """Call inside the veil insert's transaction."""
+    cur.execute("""
+        INSERT INTO guild_stats (guild_id, veils_sent) VALUES (%s, 1)
+        ON CONFLICT (guild_id) DO UPDATE SET veils_sent = guild_stats.veils_sent + 1
+    """, (guild_id,))
+    cur.execute("""
+        INSERT INTO guild_user_stats (guild_id, user_id, veils_sent) VALUES (%s, %s, 1)
+        ON CONFLICT (guild_id, user_id) DO UPDATE SET veils_sent = guild_user_stats.veils_sent + 1
+    """, (guild_id, author_id))
+
+def bump_guess(cur, guild_id: int, guesser_id: int, unveiled: bool):
+    """Call inside the guess transaction; `unveiled` = this guess won the veil."""
+    col = "correct" if unveiled else "incorrect"
+    cur.execute(sql.SQL("""
+        INSERT INTO guild_user_stats (guild_id, user_id, {col}) VALUES (%s, %s, 1)
+        ON CONFLICT (guild_id, user_id) DO UPDATE SET {col} = guild_user_stats.{col} + 1
+    """).format(col=sql.Identifier(col)), (guild_id, guesser_id))
+    if unveiled:
+        cur.execute("""
+            INSERT INTO guild_stats (guild_id, veils_unveiled) VALUES (%s, 1)
+            ON CONFLICT (guild_id) DO UPDATE SET veils_unveiled = guild_stats.veils_unveiled + 1
+        """, (guild_id,))
+        cur.execute("""
+            INSERT INTO unveil_daily (guild_id, day, user_id, unveils)
+            VALUES (%s, (NOW() AT TIME ZONE 'UTC')::date, %s, 1)
+            ON CONFLICT (guild_id, day, user_id) DO UPDATE SET unveils = unveil_daily.unveils + 1
+        """, (guild_id, guesser_id))
+
+def get_guild_stats(guild_id: int) -> tuple[int, int]:
+    """(veils_sent, veils_unveiled)"""
+    with get_safe_cursor() as cur:
+        cur.execute("SELECT veils_sent, veils_unveiled FROM guild_stats WHERE guild_id = %s", (guild_id,))
+        row = cur.fetchone()
+    return (int(row[0]), int(row[1])) if row else (0, 0)
+
+def get_user_guess_stats(guild_id: int, user_id: int) -> tuple[int, int]:
+    """(correct, incorrect) for this user in this guild."""
+    with get_safe_cursor() as cur:
+        cur.execute("""
+            SELECT correct, incorrect FROM guild_user_stats
+            WHERE guild_id = %s AND user_id = %s
+        """, (guild_id, user_id))
         row = cur.fetchone()
-    return int(row[0]) if row else 0
+    return (int(row[0]), int(row[1])) if row else (0, 0)
+
+LEADERBOARD_BOARDS = {
+    # board: (all-time column on guild_user_stats, daily rollup table, its count column)
+    "unveils": ("correct", "unveil_daily", "unveils"),
+    "votes":   ("votes",   "vote_daily",   "votes"),
+}
+
+def period_start(period: str) -> Optional[datetime]:
+    """First UTC day of the window; None for all-time."""
+    today = datetime.now(timezone.utc).date()
+    if period == "week":
+        return today - timedelta(days=today.weekday())
+    if period == "month":
+        return today.replace(day=1)
+    return None
+
+def fetch_leaderboard(guild_id: int, board: str = "unveils", period: str = "all", limit: int = 50) -> list[tuple[int, int]]:
+    total_col, daily_table, daily_col = LEADERBOARD_BOARDS[board]
+    since = period_start(period)
+    with get_safe_cursor() as cur:
+        if since is None:
+            cur.execute(sql.SQL("""
+                SELECT user_id, {col}
+                FROM guild_user_stats
+                WHERE guild_id = %s AND {col} > 0
+                ORDER BY {col} DESC
+                LIMIT %s
+            """).format(col=sql.Identifier(total_col)), (guild_id, limit))
+        else:
+            # PK (guild_id, day, user_id) → range scan over the window's buckets only
+            cur.execute(sql.SQL("""
+                SELECT user_id, SUM({col})::int AS n
+                FROM {table}
+                WHERE guild_id = %s AND day >= %s
+                GROUP BY user_id
+                ORDER BY n DESC
+                LIMIT %s
+            """).format(col=sql.Identifier(daily_col), table=sql.Identifier(daily_table)),
+                (guild_id, since, limit))
+        return cur.fetchall()
+
+def fetch_top_unveilers(guild_id: int, limit: int = 50) -> list[tuple[int, int]]:
+    return fetch_leaderboard(guild_id, "unveils", "all", limit)
+
+def compute_guild_stats_deltas(guild_id: int, channel_ids: tuple[int, ...]):
+    """
+    What one guild's counters are missing, from raw history. Each query reads
+    history and counters in one snapshot and returns their difference, so bumps
+    that land afterwards stay on top when the delta is added. Takes no locks.
+    Returns (guild_delta, user_deltas, daily_deltas).
+    """
+    channel_ids = list(channel_ids)
+    with pooled_cursor() as cur:
+        cur.execute("""
+            SELECT COUNT(*) - COALESCE((SELECT veils_sent FROM guild_stats WHERE guild_id = %s), 0),
+                   COUNT(*) FILTER (WHERE is_unveiled)
+                     - COALESCE((SELECT veils_unveiled FROM guild_stats WHERE guild_id = %s), 0)
+            FROM veil_messages WHERE channel_id = ANY(%s)
+        """, (guild_id, guild_id, channel_ids))
+        guild_delta = tuple(int(n) for n in cur.fetchone())
+        if not channel_ids:
+            return guild_delta, [], []
+
+        cur.execute("""
+            WITH hist AS (
+                SELECT user_id, SUM(correct) AS correct, SUM(incorrect) AS incorrect, SUM(sent) AS sent
+                FROM (
+                    SELECT g.guesser_id AS user_id,
+                           g.is_correct::int AS correct,
+                           (NOT g.is_correct)::int AS incorrect,
+                           0 AS sent
+                    FROM veil_guesses g
+                    JOIN veil_messages m ON m.message_id = g.message_id
+                    WHERE m.channel_id = ANY(%s)
+                    UNION ALL
+                    SELECT author_id, 0, 0, 1
+                    FROM veil_messages
+                    WHERE channel_id = ANY(%s)
+                ) t
+                GROUP BY user_id
+            ), cur AS (
+                SELECT user_id, correct, incorrect, veils_sent AS sent
+                FROM guild_user_stats WHERE guild_id = %s
+            ), d AS (
+                SELECT user_id,
+                       (COALESCE(h.correct, 0) - COALESCE(c.correct, 0))::int AS correct,
+                       (COALESCE(h.incorrect, 0) - COALESCE(c.incorrect, 0))::int AS incorrect,
+                       (COALESCE(h.sent, 0) - COALESCE(c.sent, 0))::int AS sent
+                FROM hist h FULL JOIN cur c USING (user_id)
+            )
+            SELECT user_id, correct, incorrect, sent FROM d
+            WHERE correct <> 0 OR incorrect <> 0 OR sent <> 0
+        """, (channel_ids, channel_ids, guild_id))
+        user_deltas = cur.fetchall()
+
+        cur.execute("""
+            WITH hist AS (
+                SELECT (g.timestamp AT TIME ZONE 'UTC')::date AS day, g.guesser_id AS user_id, COUNT(*) AS n
+                FROM veil_guesses g
+                JOIN veil_messages m ON m.message_id = g.message_id
+                WHERE g.is_correct = TRUE AND m.channel_id = ANY(%s)
+                GROUP BY 1, 2
+            ), cur AS (
+                SELECT day, user_id, unveils AS n FROM unveil_daily WHERE guild_id = %s
+            )
+            SELECT day, user_id, (COALESCE(h.n, 0) - COALESCE(c.n, 0))::int AS n
+            FROM hist h FULL JOIN cur c USING (day, user_id)
+            WHERE COALESCE(h.n, 0) <> COALESCE(c.n, 0)
+        """, (channel_ids, guild_id))
+        daily_deltas = cur.fetchall()
+    return guild_delta, user_deltas, daily_deltas
+
+def apply_guild_stats_deltas(guild_id: int, deltas) -> bool:
+    """
+    Add compute_guild_stats_deltas' result and mark the guild backfilled. Runs
+    on the loop's connection, in line with the bumps, so it never waits on them
+    or they on it. False = another run got there first.
+    """
+    (sent, unveiled), user_deltas, daily_deltas = deltas
+    with get_safe_cursor() as cur:
+        cur.execute("INSERT INTO guild_stats (guild_id) VALUES (%s) ON CONFLICT (guild_id) DO NOTHING", (guild_id,))
+        cur.execute("""
+            UPDATE guild_stats
+               SET veils_sent = veils_sent + %s,
+                   veils_unveiled = veils_unveiled + %s,
+                   backfilled_at = NOW()
+             WHERE guild_id = %s AND backfilled_at IS NULL
+         RETURNING 1
+        """, (sent, unveiled, guild_id))
+        if cur.fetchone() is None:
+            return False
+        if user_deltas:
+            user_ids, correct, incorrect, veils_sent = (list(col) for col in zip(*user_deltas))
+            cur.execute("""
+                INSERT INTO guild_user_stats AS s (guild_id, user_id, correct, incorrect, veils_sent)
+                SELECT %s, * FROM unnest(%s::bigint[], %s::int[], %s::int[], %s::int[])
+                ON CONFLICT (guild_id, user_id) DO UPDATE
+                SET correct = s.correct + EXCLUDED.correct,
+                    incorrect = s.incorrect + EXCLUDED.incorrect,
+                    veils_sent = s.veils_sent + EXCLUDED.veils_sent
+            """, (guild_id, user_ids, correct, incorrect, veils_sent))
+        if daily_deltas:
+            days, user_ids, unveils = (list(col) for col in zip(*daily_deltas))
+            cur.execute("""
+                INSERT INTO unveil_daily AS d (guild_id, day, user_id, unveils)
+                SELECT %s, * FROM unnest(%s::date[], %s::bigint[], %s::int[])
+                ON CONFLICT (guild_id, day, user_id) DO UPDATE SET unveils = d.unveils + EXCLUDED.unveils
+            """, (guild_id, days, user_ids, unveils))
+    return True
+
+VOTE_EVENTS_RETENTION_DAYS = int(os.getenv("VOTE_EVENTS_RETENTION_DAYS", "90"))
+
+async def prune_rolled_up_events(interval: float = 6 * 3600):
+    """Raw vote_events are rolled up on insert; keep only a recent tail for history/debugging."""
+    while not client.is_closed():
+        try:
+            with get_safe_cursor() as cur:
+                cur.execute(
+                    "DELETE FROM vote_events WHERE voted_at < NOW() - make_interval(days => %s)",
+                    (VOTE_EVENTS_RETENTION_DAYS,)
+                )
+                pruned = cur.rowcount
+            if pruned:
+                print(f"🧹 Pruned {pruned} vote event(s) older than {VOTE_EVENTS_RETENTION_DAYS}d")
+            # idle rate buckets have long since refilled
+            with get_safe_cursor() as cur:
+                cur.execute("DELETE FROM veil_rate_buckets WHERE updated_at < NOW() - interval '1 day'")
+        except Exception as e:
+            print(f"❌ vote_events retention failed: {e}")
+        await asyncio.sleep(interval)
+
+async def backfill_stats_counters():
+    """One-off: populate counters for guilds (on this cluster) that predate them."""
+    guild_ids = [g.id for g in client.guilds]
+    if not guild_ids:
+        return
+    try:
+        with get_safe_cursor() as cur:
+            cur.execute("""
+                SELECT guild_id FROM guild_stats
+                WHERE backfilled_at IS NOT NULL AND guild_id = ANY(%s)
+            """, (guild_ids,))
+            done = {row[0] for row in cur.fetchall()}
+    except Exception as e:
+        print(f"❌ Stats backfill check failed: {e}")
+        return
+
+    pending = [g for g in client.guilds if g.id not in done]
+    if not pending:
+        return
+    print(f"📊 Backfilling stats counters for {len(pending)} guild(s)…")
+    for guild in pending:
+        try:
+            channel_ids = tuple(c.id for c in guild.text_channels)
+            deltas = await asyncio.to_thread(compute_guild_stats_deltas, guild.id, channel_ids)
+            apply_guild_stats_deltas(guild.id, deltas)
+        except Exception as e:
+            print(f"❌ Stats backfill failed for {guild.id}: {e}")
+        await asyncio.sleep(0.1)
+    print("✅ Stats counters backfilled")
 
 async def build_bot_info_embed(guild: discord.Guild, tier: str = "free") -> tuple[discord.Embed, Optional[View]]:   
     bot_user = guild.me
@@ -1423,31 +2336,10 @@ async def build_bot_info_embed(guild: discord.Guild, tier: str = "free") -> tupl
         tiername = sub[0] if sub else tier
         renew_date = sub[1].strftime("%B %d, %Y") if sub and sub[1] else "N/A"
 
-        # ✅ Get all text channel IDs in the guild
-        channel_ids = tuple(c.id for c in guild.text_channels)
-        if not channel_ids:
-            veils_sent = 0
-            veils_unveiled = 0
-        else:
-            # Veils sent
-            cur.execute(
-                f"SELECT COUNT(*) FROM veil_messages WHERE channel_id IN %s",
-                (channel_ids,)
-            )
-            veils_sent = cur.fetchone()[0]
-
-            # Veils unveiled
-            cur.execute(f"""
-                SELECT COUNT(*) 
-                FROM veil_guesses 
-                WHERE is_correct = TRUE 
-                AND message_id IN (
-                    SELECT message_id 
-                    FROM veil_messages 
-                    WHERE channel_id IN %s
-                )
-            """, (channel_ids,))
-            veils_unveiled = cur.fetchone()[0]
+        # Counters (kept current by the send/guess paths)
+        cur.execute("SELECT veils_sent, veils_unveiled FROM guild_stats WHERE guild_id = %s", (guild.id,))
+        row = cur.fetchone()
+        veils_sent, veils_unveiled = row if row else (0, 0)
 
         # Bot channel
         cur.execute("SELECT channel_id FROM veil_channels WHERE guild_id = %s", (guild.id,))
@@ -1485,23 +2377,10 @@ def build_store_embed() -> discord.Embed:
     embed.set_thumbnail(url="attachment://veilstore.png")
     return embed
 
-def make_accuracy_bar_image(
-    correct: int,
-    incorrect: int,
-    *,
-    width: int = 180,
-    height: int = 16,
-    pad: int = 0,
-    bar_h: int = 16,
-    top: int = 0,
-    fill: str = "#e5a41a",
-    # semi-neutral outline that works on light & dark; RGBA allowed
-    border=(168, 168, 168, 200),
-    border_w: int = 2,
-):
-    total = max(correct + incorrect, 1)
-    pct = correct / total
-
+@lru_cache(maxsize=512)
+def _accuracy_bar_png(fill_w: int, width: int, height: int, pad: int, bar_h: int, top: int,
+                      fill: str, border: tuple, border_w: int) -> bytes:
+    """Encoded bar for one fill width + style; at most (width - 2*pad + 1) variants per style."""
     img = Image.new("RGBA", (width, height), (0, 0, 0, 0))
     d = ImageDraw.Draw(img)
 
@@ -1519,7 +2398,6 @@ def make_accuracy_bar_image(
     )
 
     # Filled portion
-    fill_w = int((x1 - x0) * pct)
     if fill_w > 0:
         # When very short, shrink radius to avoid weird corners
         fill_radius = min(radius, max(1, min(fill_w // 2, bar_h // 2)))
@@ -1531,8 +2409,28 @@ def make_accuracy_bar_image(
 
     bio = BytesIO()
     img.save(bio, "PNG")
-    bio.seek(0)
-    return discord.File(bio, filename="accuracy.png")
+    return bio.getvalue()
+
+def make_accuracy_bar_image(
+    correct: int,
+    incorrect: int,
+    *,
+    width: int = 180,
+    height: int = 16,
+    pad: int = 0,
+    bar_h: int = 16,
+    top: int = 0,
+    fill: str = "#e5a41a",
+    # semi-neutral outline that works on light & dark; RGBA allowed
+    border=(168, 168, 168, 200),
+    border_w: int = 2,
+):
+    total = max(correct + incorrect, 1)
+    pct = correct / total
+    fill_w = int((width - 2 * pad) * pct)
+
+    png = _accuracy_bar_png(fill_w, width, height, pad, bar_h, top, fill, tuple(border), border_w)
+    return discord.File(BytesIO(png), filename="accuracy.png")
 
 def build_user_stats_embed_and_file(guild: discord.Guild, user: discord.Member) -> tuple[discord.Embed, discord.File | None]:
     user_id = user.id
@@ -1545,20 +2443,19 @@ def build_user_stats_embed_and_file(guild: discord.Guild, user: discord.Member)
     tier = (get_subscription_tier(guild_id) or "free").lower()
     coins = get_user_coins(user_id, guild_id) or 0
 
-    # Pull cached unveil count + last_refill (FAST)
+    # Counters + last_refill in one round-trip
     with get_safe_cursor() as cur:
         cur.execute("""
-            SELECT veils_unveiled, last_refill
-            FROM veil_users
-            WHERE user_id=%s AND guild_id=%s
+            SELECT COALESCE(s.correct, 0), COALESCE(s.incorrect, 0), u.last_refill
+            FROM veil_users u
+            LEFT JOIN guild_user_stats s ON s.guild_id = u.guild_id AND s.user_id = u.user_id
+            WHERE u.user_id=%s AND u.guild_id=%s
         """, (user_id, guild_id))
         row = cur.fetchone()
 
-    unveiled_count = (row[0] if row else 0) or 0
-    last_refill    = row[1] if row else None  # TIMESTAMPTZ or None
-
-    # Incorrect guesses (scoped to this guild via channel_id)
-    incorrect_count = count_incorrect_guesses_for_guild(user_id, guild)
+    unveiled_count  = row[0] if row else 0
+    incorrect_count = row[1] if row else 0
+    last_refill     = row[2] if row else None  # TIMESTAMPTZ or None
 
     # Monthly refill amounts by tier
     REFILL_BY_TIER = {
@@ -1826,6 +2723,365 @@ async def hydrate_latest_views():
         except discord.HTTPException as e:
             print(f"⚠️ Failed to restore latest veil {latest_id}: {e}")
 
+# ────────────────────────── INTERACTION ACK WATCHDOG ──────────────────────────
+ACK_WINDOW      = 3.0    # Discord fails an interaction not acked within this
+ACK_DEFER_AFTER = 2.2    # opted-in handlers still silent by now get deferred for them
+
+# Handlers the watchdog may defer, and how. "update": a component that later edits
+# its own message; "ephemeral" / "public": a "thinking…" reply the handler's
+# follow-up replaces. Anything that opens a modal must never be listed here.
+# A handler can change its own policy through interaction.extras["ack_policy"]
+# once it knows which way its answer goes (e.g. past a private error path).
+ACK_AUTO_DEFER = {
+    "guess_btn":       "ephemeral",
+    "unveil_pick":     "update",
+    "leaderboard_btn": "ephemeral",
+    "/leaderboard":    "ephemeral",   # send_leaderboard goes public after the Premium gate
+}
+
+AUTO_CUSTOM_ID_RE = re.compile(r"[0-9a-f]{32}")   # discord.py's random ids for unnamed components
+
+class AckStats:
+    __slots__ = ("count", "late", "auto_deferred", "expired", "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.late = 0               # acked after ACK_WINDOW (the user saw "interaction failed")
+        self.auto_deferred = 0
+        self.expired = 0            # never acked, or the defer came too late
+        self.samples = deque(maxlen=256)   # recent time-to-ack, seconds
+
+    def record(self, seconds: float | None, auto: bool):
+        """seconds=None: acked in time, but not through the reply helpers, so the moment is unknown."""
+        self.count += 1
+        self.auto_deferred += auto
+        if seconds is not None:
+            self.late += seconds > ACK_WINDOW
+            self.samples.append(seconds)
+
+    def as_dict(self) -> dict:
+        s = sorted(self.samples)
+        p95 = s[max(0, int(len(s) * 0.95) - 1)] if s else 0.0
+        return {"count": self.count, "late": self.late, "auto_deferred": self.auto_deferred,
+                "expired": self.expired, "p95_ms": int(p95 * 1000)}
+
+client.ack_stats = {}   # interaction key -> AckStats
+client.ack_watchers = set()   # running auto-defer tasks (the loop only keeps weak refs)
+
+def interaction_key(interaction: discord.Interaction) -> str | None:
+    data = interaction.data or {}
+    if interaction.type == discord.InteractionType.application_command:
+        return "/" + str(data.get("name", "?"))
+    if interaction.type == discord.InteractionType.modal_submit:
+        return "modal"
+    cid = (data.get("custom_id") or "").strip()
+    if not cid:
+        return None
+    if AUTO_CUSTOM_ID_RE.fullmatch(cid):
+        return "component"
+    return cid.split(":", 1)[0]
+
+def _already_acked(e: Exception) -> bool:
+    return isinstance(e, discord.InteractionResponded) or (
+        isinstance(e, discord.HTTPException) and e.code == 40060   # acknowledged by someone else
+    )
+
+def watch_ack(interaction: discord.Interaction, key: str):
+    """Arm one timer at ACK_DEFER_AFTER; the reply helpers disarm it through note_ack()."""
+    # count the gateway delay too (clamped: our clock and Discord's can disagree)
+    age = (discord.utils.utcnow() - interaction.created_at).total_seconds()
+    started = time.monotonic() - max(0.0, min(age, ACK_WINDOW))
+    handle = asyncio.get_running_loop().call_later(
+        max(0.0, started + ACK_DEFER_AFTER - time.monotonic()), _ack_deadline, interaction, False
+    )
+    interaction.extras["ack_watch"] = (key, started, handle)
+
+def note_ack(interaction: discord.Interaction, auto: bool = False):
+    """The first response went out: cancel the timer and record the time-to-ack."""
+    watch = interaction.extras.pop("ack_watch", None)
+    if not watch:
+        return
+    key, started, handle = watch
+    handle.cancel()
+    waited = time.monotonic() - started
+    client.ack_stats.setdefault(key, AckStats()).record(waited, auto)
+    if auto:
+        print(f"⏱️ auto-deferred {key} after {waited:.2f}s")
+
+def _ack_deadline(interaction: discord.Interaction, final: bool):
+    watch = interaction.extras.get("ack_watch")
+    if not watch:
+        return
+    key, started, _ = watch
+    stats = client.ack_stats.setdefault(key, AckStats())
+    if interaction.response.is_done():
+        interaction.extras.pop("ack_watch", None)
+        stats.record(None, False)
+        return
+    if final:
+        interaction.extras.pop("ack_watch", None)
+        stats.expired += 1
+        return
+
+    policy = interaction.extras.get("ack_policy") or ACK_AUTO_DEFER.get(key)
+    if policy:
+        task = asyncio.create_task(_auto_defer(interaction, key, policy))
+        client.ack_watchers.add(task)
+        task.add_done_callback(client.ack_watchers.discard)
+    else:
+        # nothing to do for it; one last look once the token is surely dead
+        handle = asyncio.get_running_loop().call_later(
+            max(0.0, started + ACK_WINDOW * 2 - time.monotonic()), _ack_deadline, interaction, True
+        )
+        interaction.extras["ack_watch"] = (key, started, handle)
+
+async def _auto_defer(interaction: discord.Interaction, key: str, policy: str):
+    try:
+        if policy == "update":
+            await interaction.response.defer()
+        else:
+            await interaction.response.defer(ephemeral=(policy == "ephemeral"), thinking=True)
+    except discord.NotFound:
+        if interaction.extras.pop("ack_watch", None):
+            client.ack_stats.setdefault(key, AckStats()).expired += 1
+        return
+    except Exception as e:
+        if _already_acked(e):
+            note_ack(interaction)   # the handler won the race
+        else:
+            interaction.extras.pop("ack_watch", None)
+            print(f"⚠️ auto-defer failed for {key}: {e}")
+        return
+    note_ack(interaction, auto=True)
+
+async def reply(interaction: discord.Interaction, **kwargs):
+    """Send the first answer, or a follow-up if the interaction was already acked (e.g. auto-deferred)."""
+    if not interaction.response.is_done():
+        try:
+            resp = await interaction.response.send_message(**kwargs)
+            note_ack(interaction)
+            return resp
+        except Exception as e:
+            if not _already_acked(e):
+                raise
+    return await interaction.followup.send(**kwargs)
+
+async def reply_edit(interaction: discord.Interaction, **kwargs):
+    """Edit the component's message, through the original response once acked."""
+    if not interaction.response.is_done():
+        try:
+            resp = await interaction.response.edit_message(**kwargs)
+            note_ack(interaction)
+            return resp
+        except Exception as e:
+            if not _already_acked(e):
+                raise
+    return await interaction.edit_original_response(**kwargs)
+
+async def defer_once(interaction: discord.Interaction, **kwargs):
+    if interaction.response.is_done():
+        return
+    try:
+        await interaction.response.defer(**kwargs)
+        note_ack(interaction)
+    except Exception as e:
+        if not _already_acked(e):
+            raise
+
+# ────────────────────────── CLUSTER IPC ──────────────────────────
+def local_cluster_stats() -> dict:
+    """Shard + guild snapshot for THIS process (JSON-safe)."""
+    per_shard_guilds = Counter()
+    per_shard_members = Counter()
+    for g in client.guilds:
+        sid = g.shard_id if g.shard_id is not None else 0
+        per_shard_guilds[sid] += 1
+        per_shard_members[sid] += (getattr(g, "member_count", 0) or 0)
+
+    shard_info = getattr(client, "shards", {}) or {}
+    shards = [
+        {
+            "id": sid,
+            "latency_ms": int((getattr(info, "latency", client.latency) or 0) * 1000),
+            "guilds": per_shard_guilds.get(sid, 0),
+            "members": per_shard_members.get(sid, 0),
+        }
+        for sid, info in sorted(shard_info.items())
+    ]
+    return {
+        "cluster_id": CLUSTER_ID,
+        "shard_count": client.shard_count or len(shards) or 1,
+        "rss_mb": round(resident_memory_mb()),
+        "render_cache": text_card_cache.stats(),
+        "render_queue": render_queue.stats(),
+        "admin_logs": admin_logs.stats(),
+        "acks": {key: st.as_dict() for key, st in client.ack_stats.items()},
+        "shards": shards,
+        "guilds": [[g.id, g.name, g.member_count or 0] for g in client.guilds],
+    }
+
+async def _ipc_stats(request: web.Request) -> web.Response:
+    if request.headers.get("X-IPC-Secret", "") != IPC_SECRET:
+        return web.Response(status=403)
+    return web.json_response(local_cluster_stats())
+
+async def _ipc_upgrade(request: web.Request) -> web.Response:
+    if request.headers.get("X-IPC-Secret", "") != IPC_SECRET:
+        return web.Response(status=403)
+    data = await request.json()
+    guild_id = int(data["guild_id"])
+    if not client.get_guild(guild_id):
+        return web.json_response({"handled": False, "owner": False})
+    handled = await handle_guild_upgrade(guild_id, str(data["tier"]).lower())
+    return web.json_response({"handled": handled, "owner": True})
+
+async def start_ipc_server():
+    app = web.Application()
+    app.router.add_get("/ipc/stats", _ipc_stats)
+    app.router.add_post("/ipc/upgrade", _ipc_upgrade)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, IPC_HOST, IPC_BASE_PORT + CLUSTER_ID).start()
+    client.ipc_runner = runner
+
+async def gather_cluster_stats(timeout: float = 2.5) -> list[dict]:
+    """
+    Stats from every cluster, ours included. A cluster that doesn't answer
+    in time comes back as {"cluster_id": n, "offline": True}.
+    """
+    results = [local_cluster_stats()]
+    if CLUSTER_COUNT <= 1:
+        return results
+
+    async def fetch(session: aiohttp.ClientSession, cid: int) -> dict:
+        url = f"http://{IPC_HOST}:{IPC_BASE_PORT + cid}/ipc/stats"
+        try:
+            async with session.get(url, headers={"X-IPC-Secret": IPC_SECRET}) as resp:
+                if resp.status == 200:
+                    return await resp.json()
+                print(f"⚠️ cluster {cid} IPC returned HTTP {resp.status}")
+        except Exception as e:
+            print(f"⚠️ cluster {cid} IPC unreachable: {e}")
+        return {"cluster_id": cid, "offline": True, "shards": [], "guilds": []}
+
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        peers = await asyncio.gather(*(
+            fetch(session, cid) for cid in range(CLUSTER_COUNT) if cid != CLUSTER_ID
+        ))
+    results.extend(peers)
+    return sorted(results, key=lambda r: r["cluster_id"])
+
+async def forward_upgrade_to_peers(guild_id: int, tier: str, timeout: float = 10) -> bool | None:
+    """Ask every other cluster to post the upgrade embed; only the guild's owner will. None = no owner found."""
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        for cid in range(CLUSTER_COUNT):
+            if cid == CLUSTER_ID:
+                continue
+            url = f"http://{IPC_HOST}:{IPC_BASE_PORT + cid}/ipc/upgrade"
+            try:
+                async with session.post(url, json={"guild_id": guild_id, "tier": tier},
+                                        headers={"X-IPC-Secret": IPC_SECRET}) as resp:
+                    data = await resp.json() if resp.status == 200 else {}
+            except Exception as e:
+                print(f"⚠️ cluster {cid} IPC unreachable: {e}")
+                continue
+            if data.get("owner"):
+                return bool(data.get("handled"))
+    print(f"[upgrade] no cluster owns guild {guild_id}")
+    return None
+
+# ────────────────────────── MEMBER CACHE / GATEWAY STATS ──────────────────────────
+CHUNK_BACKGROUND_DELAY = 1.0   # seconds between background guild chunks
+CHUNK_GUESS_WAIT       = 3.0   # seconds a guess click waits on its guild's in-flight chunk
+
+def ensure_guild_chunked(guild: discord.Guild | None) -> asyncio.Task | None:
+    """Start (once) a member chunk for a guild we skipped at startup; returns the in-flight task."""
+    if guild is None or guild.chunked:
+        return None
+    task = client.chunking.get(guild.id)
+    if task is None:
+        async def _chunk():
+            try:
+                await guild.chunk(cache=True)
+            except Exception as e:
+                print(f"⚠️ chunk failed for guild {guild.id}: {e}")
+            finally:
+                client.chunking.pop(guild.id, None)
+
+        task = client.chunking[guild.id] = client.loop.create_task(_chunk())
+    return task
+
+async def resolve_veil_author(guild: discord.Guild, author_id: int) -> discord.abc.User | None:
+    """The veil's author for the dropdown: cache, then the API (authors who left resolve as users)."""
+    member = guild.get_member(author_id)
+    if member:
+        return member
+    try:
+        return await guild.fetch_member(author_id)
+    except discord.NotFound:
+        pass
+    except discord.HTTPException as e:
+        print(f"⚠️ could not fetch veil author {author_id}: {e}")
+        return None
+    try:
+        return client.get_user(author_id) or await client.fetch_user(author_id)
+    except discord.HTTPException as e:
+        print(f"⚠️ could not fetch veil author {author_id}: {e}")
+        return None
+
+async def chunk_veil_guilds():
+    """After startup, slowly chunk just the guilds that have a Veil channel linked."""
+    await client.wait_until_ready()
+    try:
+        with get_safe_cursor() as cur:
+            cur.execute("SELECT guild_id FROM veil_channels")
+            guild_ids = [row[0] for row in cur.fetchall()]
+    except Exception as e:
+        print(f"⚠️ Could not list veil guilds for chunking: {e}")
+        return
+
+    done = 0
+    for gid in guild_ids:
+        # shares the task with guess clicks that are already waiting on this guild
+        task = ensure_guild_chunked(client.get_guild(gid))
+        if not task:
+            continue
+        await task
+        done += 1
+        await asyncio.sleep(CHUNK_BACKGROUND_DELAY)
+    print(f"✅ Chunked {done} veil guild(s) in the background")
+
+def resident_memory_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource  # non-Linux fallback: peak, not current
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+client.gateway_events = Counter()
+
+@client.event
+async def on_socket_event_type(event_type: str):
+    # only dispatched with enable_debug_events (GATEWAY_STATS=1)
+    client.gateway_events[event_type] += 1
+
+async def log_gateway_stats(interval: int = 60):
+    await client.wait_until_ready()
+    while not client.is_closed():
+        await asyncio.sleep(interval)
+        counts = client.gateway_events
+        client.gateway_events = Counter()
+        total = sum(counts.values())
+        top = ", ".join(f"{k}={v}" for k, v in counts.most_common(5)) or "—"
+        print(
+            f"📈 [cluster {CLUSTER_ID}] {total / interval:.1f} gateway events/s "
+            f"({top}) • RSS {resident_memory_mb():.0f} MB • {len(client.guilds)} guilds"
+        )
+
 # ────────────────────────── 9-SLICE SKINS ──────────────────────────
 class NineSliceSkin:
     """
@@ -2230,6 +3486,327 @@ async def read_attachment_image(att: discord.Attachment) -> Image.Image | None:
     except Exception:
         return None
 
+# ===================== UNVEIL AVATAR OVERLAY =====================
+AVATAR_OVERLAY_SIZE = (492, 482)
+AVATAR_CACHE_SIZE   = 32    # ~1 MB per processed overlay
+
+def _build_avatar_overlay_alpha(size=AVATAR_OVERLAY_SIZE, corner_radius=40, opacity=0.2) -> Image.Image:
+    """Rounded bottom-left corner × left-to-right fade × 20% opacity, as one L mask."""
+    w, h = size
+    mask = Image.new("L", size, 255)
+    corner = Image.new("L", (corner_radius*2, corner_radius*2), 0)
+    ImageDraw.Draw(corner).ellipse((0, 0, corner_radius*2, corner_radius*2), fill=255)
+    mask.paste(
+        corner.crop((0, corner_radius, corner_radius, corner_radius*2)),
+        (0, h - corner_radius)
+    )
+
+    # one row of the fade, stretched to full height
+    ramp = Image.frombytes("L", (w, 1), bytes(int(255 * (1 - x / w)) for x in range(w)))
+    gradient = ramp.resize(size, Image.NEAREST)
+
+    alpha = ImageChops.multiply(mask, gradient)
+    return alpha.point(lambda v: int(v * opacity))
+
+AVATAR_OVERLAY_ALPHA = _build_avatar_overlay_alpha()
+client.avatar_overlays = OrderedDict()   # avatar hash -> faded RGBA overlay
+avatar_overlays_lock = threading.Lock()  # filled from render threads
+
+def get_avatar_overlay(user) -> Image.Image:
+    """Grayscale, faded avatar for unveiled cards; cached by avatar hash (treat as read-only)."""
+    key = user.display_avatar.key
+    with avatar_overlays_lock:
+        cached = client.avatar_overlays.get(key)
+        if cached is not None:
+            client.avatar_overlays.move_to_end(key)
+            return cached
+
+    try:
+        avatar_url = str(user.display_avatar.with_size(512))
+        resp = requests.get(avatar_url, timeout=8)
+        resp.raise_for_status()
+        pfp = Image.open(io.BytesIO(resp.content)).convert("RGBA")
+    except Exception as e:
+        print(f"⚠️ Avatar fetch failed, using transparent fill: {e}")
+        return Image.new("RGBA", AVATAR_OVERLAY_SIZE, (0, 0, 0, 0))
+
+    # Resize & grayscale, then apply the precomputed corner + fade
+    pfp = pfp.resize(AVATAR_OVERLAY_SIZE, Image.LANCZOS)
+    pfp = ImageOps.grayscale(pfp).convert("RGBA")
+    pfp.putalpha(AVATAR_OVERLAY_ALPHA)
+
+    with avatar_overlays_lock:
+        client.avatar_overlays[key] = pfp
+        if len(client.avatar_overlays) > AVATAR_CACHE_SIZE:
+            client.avatar_overlays.popitem(last=False)
+    return pfp
+
+# ===================== RENDER QUEUE =====================
+# Blocking Pillow work runs on a small thread pool behind one queue per priority.
+# Higher classes always go first; inside a class guilds take turns one job at a
+# time, and no guild holds more than RENDER_GUILD_MAX_RUNNING workers at once.
+# unveils/previews, new veils, leaderboard cards, admin-log copies
+RENDER_UNVEIL, RENDER_VEIL, RENDER_LEADERBOARD, RENDER_ADMIN_LOG = 0, 1, 2, 3
+RENDER_PRIORITY_NAMES = ("unveil", "veil", "leaderboard", "admin_log")
+RENDER_WORKERS = max(1, int(os.getenv("RENDER_WORKERS", "2")))
+RENDER_GUILD_MAX_RUNNING = max(1, RENDER_WORKERS // 2)
+
+class RenderJob:
+    __slots__ = ("guild_id", "fn", "future", "queued_at")
+
+    def __init__(self, guild_id: int, fn, future: asyncio.Future):
+        self.guild_id = guild_id
+        self.fn = fn
+        self.future = future
+        self.queued_at = time.monotonic()
+
+class RenderScheduler:
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.queues = [OrderedDict() for _ in RENDER_PRIORITY_NAMES]   # guild_id -> deque[RenderJob]
+        self.running = Counter()                                        # guild_id -> jobs on a worker
+        self.waits = [deque(maxlen=256) for _ in RENDER_PRIORITY_NAMES]  # recent queue waits, seconds
+        self.done = [0] * len(RENDER_PRIORITY_NAMES)
+        self.executor = None
+        self.cond = None
+        self.tasks = []
+
+    def _start(self):
+        self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix="render")
+        self.cond = asyncio.Condition()
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def _next(self) -> tuple[int, RenderJob] | None:
+        for prio, queue in enumerate(self.queues):
+            for guild_id in list(queue):
+                if self.running[guild_id] >= RENDER_GUILD_MAX_RUNNING:
+                    continue
+                jobs = queue[guild_id]
+                job = jobs.popleft()
+                if jobs:
+                    queue.move_to_end(guild_id)   # back of the line for this class
+                else:
+                    del queue[guild_id]
+                if job.future.done():             # caller gave up while queued
+                    continue
+                return prio, job
+        return None
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            async with self.cond:
+                while (picked := self._next()) is None:
+                    await self.cond.wait()
+                prio, job = picked
+                self.running[job.guild_id] += 1
+            self.waits[prio].append(time.monotonic() - job.queued_at)
+            try:
+                result = await loop.run_in_executor(self.executor, job.fn)
+                if not job.future.done():
+                    job.future.set_result(result)
+            except Exception as e:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            finally:
+                self.done[prio] += 1
+                async with self.cond:
+                    self.running[job.guild_id] -= 1
+                    if not self.running[job.guild_id]:
+                        del self.running[job.guild_id]
+                    self.cond.notify_all()
+
+    async def run(self, guild_id: int, priority: int, fn, *args):
+        """Queue a blocking fn(*args) and wait for its result."""
+        if not self.tasks:
+            self._start()
+        future = asyncio.get_running_loop().create_future()
+        async with self.cond:
+            self.queues[priority].setdefault(guild_id, deque()).append(
+                RenderJob(guild_id, partial(fn, *args), future)
+            )
+            self.cond.notify()
+        return await future
+
+    def stats(self) -> dict:
+        def p95(samples):
+            s = sorted(samples)
+            return int(s[max(0, int(len(s) * 0.95) - 1)] * 1000) if s else 0
+        return {
+            "workers": self.workers,
+            "running": sum(self.running.values()),
+            "depth": {name: sum(map(len, q.values())) for name, q in zip(RENDER_PRIORITY_NAMES, self.queues)},
+            "wait_p95_ms": {name: p95(w) for name, w in zip(RENDER_PRIORITY_NAMES, self.waits)},
+            "done": dict(zip(RENDER_PRIORITY_NAMES, self.done)),
+        }
+
+render_queue = RenderScheduler(RENDER_WORKERS)
+
+def encode_png(img: Image.Image) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+# ===================== TEXT CARD RENDER CACHE =====================
+RENDER_VERSION = 2   # bump when card layout changes so old cache entries miss
+
+class RenderCache:
+    """
+    Content-addressed LRU for rendered PNGs.
+    - memory tier capped by total bytes; optional disk tier (dir) survives restarts
+    - concurrent requests for the same key share one render (single-flight)
+    """
+    def __init__(self, max_bytes: int, disk_dir: str | None = None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.entries: OrderedDict[str, bytes] = OrderedDict()
+        self.size = 0
+        self.inflight: dict[str, asyncio.Future] = {}
+        self.hits = self.shared = self.disk_hits = self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def key(*parts) -> str:
+        blob = json.dumps([RENDER_VERSION, *parts], ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old)
+        self.entries[key] = data
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.png")
+
+    def _read_disk(self, key: str) -> bytes | None:
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_disk(self, key: str, data: bytes):
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)   # atomic: other clusters never see half a file
+        except OSError as e:
+            print(f"⚠️ render cache disk write failed: {e}")
+
+    async def get_or_render(self, key: str, render) -> bytes:
+        data = self.entries.get(key)
+        if data is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+        pending = self.inflight.get(key)
+        if pending is not None:
+            self.shared += 1
+            return await asyncio.shield(pending)
+
+        fut = asyncio.get_running_loop().create_future()
+        self.inflight[key] = fut
+        try:
+            data = await asyncio.to_thread(self._read_disk, key) if self.disk_dir else None
+            if data is not None:
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+                data = await render()
+                if self.disk_dir:
+                    await asyncio.to_thread(self._write_disk, key, data)
+            self._remember(key, data)
+            fut.set_result(data)
+            return data
+        except BaseException as e:
+            fut.set_exception(e)
+            fut.exception()   # waiters re-raise it; don't warn if there are none
+            raise
+        finally:
+            self.inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.shared + self.disk_hits + self.misses
+        return {
+            "lookups": lookups,
+            "hits": lookups - self.misses,
+            "hit_rate": round((lookups - self.misses) / lookups, 4) if lookups else 0.0,
+            "entries": len(self.entries),
+            "bytes": self.size,
+        }
+
+text_card_cache = RenderCache(
+    max_bytes=int(os.getenv("RENDER_CACHE_MB", "64")) * 1024 * 1024,
+    disk_dir=os.getenv("RENDER_CACHE_DIR") or None,
+)
+
+def paint_text_card(render_text: str, font_file: str, layout: str, base_img: str, color: str, author_user=None) -> bytes:
+    """Draw a text veil card; author_user (unveiled cards) adds the faded avatar. Blocking — run on the render queue."""
+    image = Image.open(base_img).convert("RGBA")
+    draw = ImageDraw.Draw(image)
+
+    # 🔹 Handle unveiled overlay with avatar fade
+    if author_user is not None:
+        pfp = get_avatar_overlay(author_user)
+
+        # Paste to box area
+        inner_x, inner_y = 30, 156
+        image.paste(pfp, (inner_x, inner_y), pfp)
+
+    # Text box settings
+    box_x, box_y = 45, 145
+    box_width, box_height = 1200, 440
+    line_spacing = 10
+    emoji_size = 48
+    emoji_padding = 4
+
+    tokens = tokenize_message_for_wrap(render_text)
+
+    for font_size in range(56, 24, -2):
+        font = card_font(font_file, font_size, layout)
+        ascent, descent = font.getmetrics()
+        line_height = max(emoji_size, ascent + descent)
+        lines = build_wrapped_lines(tokens, font, box_width, draw, emoji_size, emoji_padding)
+        total_height = len(lines) * line_height + line_spacing * (len(lines) - 1)
+        if total_height <= box_height:
+            break
+
+    # Vertical centering
+    y = box_y + (box_height - total_height) // 2 + 50
+
+    # Center single-line emoji messages perfectly
+    total_emoji_count = sum(1 for t in tokens if is_emoji_token(t))
+    if len(lines) == 1 and total_emoji_count == len(tokens):
+        y = box_y + (box_height - emoji_size) // 2
+
+    # Render each line centered
+    for line_tokens in lines:
+        line_width = sum(
+            emoji_size + emoji_padding if is_emoji_token(t) else text_length(draw, t, font)
+            for t in line_tokens
+        )
+        x_start = box_x + (box_width - line_width) // 2
+        line_y = calculate_line_y(line_tokens, font, y)
+        render_emojis(draw, image, line_tokens, x_start, line_y, font, emoji_size, emoji_padding, color)
+        y += line_height + line_spacing
+
+    # Save buffer
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
 async def send_veil_message(
     interaction,
     text,
@@ -2284,12 +3861,12 @@ async def send_veil_message(
             return
         skin = pack.veil
 
-        # compose final card with the nine-slice frame
-        veiled_img = compose_around_photo(user_img, skin)
-        buf = io.BytesIO(); veiled_img.save(buf, format="PNG"); img_bytes = buf.getvalue()
-
-        # also keep the ORIGINAL user image bytes so we can re-frame on unveil
-        raw_buf = io.BytesIO(); user_img.save(raw_buf, format="PNG"); image_raw = raw_buf.getvalue()
+        # compose final card with the nine-slice frame; also keep the ORIGINAL
+        # user image bytes so we can re-frame on unveil
+        def _compose():
+            return encode_png(compose_around_photo(user_img, skin)), encode_png(user_img)
+        priority = RENDER_UNVEIL if return_file else RENDER_VEIL
+        img_bytes, image_raw = await render_queue.run(interaction.guild.id, priority, _compose)
 
         # If we're only returning a file (preview/export), stop here.
         if return_file:
@@ -2351,43 +3928,15 @@ async def send_veil_message(
                         """,
                         (channel_obj.id, msg.id)
                     )
+                    touch_recent_author(cur, channel_obj.id, interaction.user.id)
+                    bump_veil_sent(cur, interaction.guild.id, interaction.user.id)
                     conn.commit()
         except Exception as e:
             print(f"❌ DB insert failed (image veil): {e}")
+        note_veil_posted(interaction.guild, channel_obj.id, interaction.user.id)
 
-        # elite admin copy (unchanged)
-        try:
-            with get_safe_cursor() as cur:
-                cur.execute("SELECT tier FROM veil_subscriptions WHERE guild_id = %s", (interaction.guild.id,))
-                tier_row = cur.fetchone()
-
-            if tier_row and tier_row[0] == "elite":
-                with get_safe_cursor() as cur:
-                    cur.execute("SELECT channel_id FROM veil_admin_channels WHERE guild_id = %s", (interaction.guild.id,))
-                    log_row = cur.fetchone()
-
-                if log_row:
-                    log_chan = interaction.guild.get_channel(log_row[0])
-                    if log_chan:
-                        author_member = interaction.guild.get_member(interaction.user.id)
-                        display_name = get_display_name_safe(author_member).capitalize()
-
-                        embed = discord.Embed(title="🗃️ New Veil Submitted")
-                        embed.set_image(url="attachment://veil.png")
-
-                        admin_view = discord.ui.View(timeout=None)
-                        submitted_btn = discord.ui.Button(
-                            label=f"Submitted by {display_name}",
-                            style=discord.ButtonStyle.secondary,
-                            custom_id="submitted_by_admin",
-                            disabled=True
-                        )
-                        admin_view.add_item(submitted_btn)
-
-                        file_log = discord.File(io.BytesIO(img_bytes), filename="veil.png")
-                        await log_chan.send(embed=embed, file=file_log, view=admin_view)
-        except Exception as e:
-            print(f"⚠️ Admin log failed (image veil): {e}")
+        # elite admin copy, delivered in the background
+        admin_logs.enqueue(interaction.guild, interaction.user.id, img_bytes)
 
         return msg
 
@@ -2395,14 +3944,8 @@ async def send_veil_message(
     base_img = "unveilfinal_black2.png" if unveiled else "veilfinal_gold2.png"
     color = "#e5a41a" if unveiled else "#a65e00"
 
-    # Load base image
-    image = Image.open(base_img).convert("RGBA")
-    draw = ImageDraw.Draw(image)
-
     # Author fallback
     author_user = interaction.user
-
-    # 🔹 Handle unveiled overlay with avatar fade
     if unveiled:
         target_msg_id = veil_msg_id or (interaction.message.id if interaction.message else None)
         if target_msg_id:
@@ -2414,95 +3957,24 @@ async def send_veil_message(
                 if member:
                     author_user = member
 
-        try:
-            avatar_url = str(author_user.display_avatar.with_size(512))
-            resp = requests.get(avatar_url, timeout=8)
-            resp.raise_for_status()
-            pfp = Image.open(io.BytesIO(resp.content)).convert("RGBA")
-        except Exception as e:
-            print(f"⚠️ Avatar fetch failed, using transparent fill: {e}")
-            pfp = Image.new("RGBA", (492, 482), (0, 0, 0, 0))
-        # Resize & grayscale
-        pfp = pfp.resize((492, 482), Image.LANCZOS)
-        pfp = ImageOps.grayscale(pfp).convert("RGBA")
-
-        # Round bottom-left corner
-        corner_radius = 40
-        mask = Image.new("L", pfp.size, 255)
-        corner = Image.new("L", (corner_radius*2, corner_radius*2), 0)
-        draw_corner = ImageDraw.Draw(corner)
-        draw_corner.ellipse((0, 0, corner_radius*2, corner_radius*2), fill=255)
-        mask.paste(
-            corner.crop((0, corner_radius, corner_radius, corner_radius*2)),
-            (0, pfp.height - corner_radius)
-        )
-        pfp.putalpha(mask)
-
-        # Horizontal gradient fade
-        grad_width, grad_height = pfp.size
-        gradient = Image.new("L", (grad_width, grad_height))
-        for x in range(grad_width):
-            opacity = int(255 * (1 - x / grad_width))
-            gradient.paste(opacity, (x, 0, x+1, grad_height))
-
-        alpha = pfp.getchannel("A")
-        alpha = ImageChops.multiply(alpha, gradient)
-        alpha = alpha.point(lambda x: int(x * 0.2))  # 20% opacity
-        pfp.putalpha(alpha)
-
-        # Paste to box area
-        inner_x, inner_y = 30, 156
-        image.paste(pfp, (inner_x, inner_y), pfp)
-
-    # Text box settings
-    box_x, box_y = 45, 145
-    box_width, box_height = 1200, 440
-    line_spacing = 10
-    emoji_size = 48
-    emoji_padding = 4
-
     # normalize mentions
     text = await normalize_mentions(text, interaction.guild, interaction.client)
-    render_text, font_file = get_render_text_and_font(text)
-    tokens = tokenize_message_for_wrap(render_text)
+    render_text, font_file, layout = get_render_text_and_font(text)
 
-    for font_size in range(56, 24, -2):
-        font = ImageFont.truetype(font_file, font_size)
-        ascent, descent = font.getmetrics()
-        line_height = max(emoji_size, ascent + descent)
-        lines = build_wrapped_lines(tokens, font, box_width, draw, emoji_size, emoji_padding)
-        total_height = len(lines) * line_height + line_spacing * (len(lines) - 1)
-        if total_height <= box_height:
-            break
-
-    # Vertical centering
-    y = box_y + (box_height - total_height) // 2 + 50
-
-    # Center single-line emoji messages perfectly
-    total_emoji_count = sum(
-        1 for t in tokens
-        if discord_emoji_pattern.fullmatch(t) or emoji.is_emoji(t.strip())
+    # Same inputs → same PNG, so identical cards are rendered once
+    cache_key = RenderCache.key(
+        "text", render_text, font_file, layout, base_img,
+        author_user.display_avatar.key if unveiled else None,
+    )
+    img_bytes = await text_card_cache.get_or_render(
+        cache_key,
+        lambda: render_queue.run(
+            interaction.guild.id,
+            RENDER_UNVEIL if unveiled or return_file else RENDER_VEIL,
+            paint_text_card,
+            render_text, font_file, layout, base_img, color, author_user if unveiled else None,
+        ),
     )
-    if len(lines) == 1 and total_emoji_count == len(tokens):
-        y = box_y + (box_height - emoji_size) // 2
-
-    # Render each line centered
-    for line_tokens in lines:
-        line_width = sum(
-            emoji_size + emoji_padding if (
-                discord_emoji_pattern.fullmatch(t) or emoji.is_emoji(t.strip())
-            ) else draw.textlength(t, font=font)
-            for t in line_tokens
-        )
-        x_start = box_x + (box_width - line_width) // 2
-        line_y = calculate_line_y(line_tokens, font, y)
-        await render_emojis(draw, image, line_tokens, x_start, line_y, font, emoji_size, emoji_padding, color)
-        y += line_height + line_spacing
-
-    # Save buffer
-    buffer = io.BytesIO()
-    image.save(buffer, format="PNG")
-    img_bytes = buffer.getvalue()
 
     # If we're only returning a file (preview/export), stop here.
     if return_file:
@@ -2549,43 +4021,343 @@ async def send_veil_message(
                     VALUES (%s, %s)
                     ON CONFLICT (channel_id) DO UPDATE SET message_id = EXCLUDED.message_id
                 """, (channel_obj.id, msg.id))
+                touch_recent_author(cur, channel_obj.id, interaction.user.id)
+                bump_veil_sent(cur, interaction.guild.id, interaction.user.id)
                 conn.commit()
     except Exception as e:
         print(f"❌ DB insert failed (text veil): {e}")
+    note_veil_posted(interaction.guild, channel_obj.id, interaction.user.id)
+
+    # elite admin copy, delivered in the background
+    admin_logs.enqueue(interaction.guild, interaction.user.id, img_bytes)
 
-    # ─────────────────────────────────────────────────────────────────────────
-    # ADMIN LOGS (same as before)
+    return msg
+
+# ===================== ADMIN LOG DELIVERY =====================
+# Elite guilds get a copy of every veil in their admin-log channel. That copy is
+# queued here and sent in the background, so /veil returns as soon as the veil
+# itself is posted. Busy guilds get periodic digests instead of one post per veil.
+ADMIN_LOG_THUMB_WIDTH      = int(os.getenv("ADMIN_LOG_THUMB_WIDTH", "640"))   # 0 = full-size card
+ADMIN_LOG_RETRIES          = 4
+ADMIN_LOG_CHANNEL_TTL      = 300   # seconds a guild's (elite, channel) lookup is cached
+ADMIN_LOG_DIGEST_THRESHOLD = 6     # logs within the window that switch a guild to digests
+ADMIN_LOG_DIGEST_WINDOW    = 60
+ADMIN_LOG_DIGEST_INTERVAL  = 60    # how often a busy guild's digest is flushed
+ADMIN_LOG_DIGEST_MAX       = 10    # Discord: max embeds/attachments per message
+
+client.admin_log_channels = {}   # guild_id -> (loaded_at, channel_id or None)
+
+def load_admin_log_channel_id(guild_id: int) -> int | None:
     with get_safe_cursor() as cur:
-        cur.execute("SELECT tier FROM veil_subscriptions WHERE guild_id = %s", (interaction.guild.id,))
-        tier_row = cur.fetchone()
-    if tier_row and tier_row[0] == "elite":
-        with get_safe_cursor() as cur:
-            cur.execute("SELECT channel_id FROM veil_admin_channels WHERE guild_id = %s", (interaction.guild.id,))
-            log_row = cur.fetchone()
-
-        if log_row:
-            log_chan = interaction.guild.get_channel(log_row[0])
-            if log_chan:
-                author_member = interaction.guild.get_member(interaction.user.id)
-                display_name = get_display_name_safe(author_member).capitalize()
-
-                embed = discord.Embed(title="🗃️ New Veil Submitted")
-                embed.set_image(url="attachment://veil.png")
-
-                admin_view = discord.ui.View(timeout=None)
-                submitted_btn = discord.ui.Button(
-                    label=f"Submitted by {display_name}",
-                    style=discord.ButtonStyle.secondary,
-                    custom_id="submitted_by_admin",
-                    disabled=True
-                )
-                admin_view.add_item(submitted_btn)
+        cur.execute("""
+            SELECT a.channel_id
+            FROM veil_admin_channels a
+            JOIN veil_subscriptions s ON s.guild_id = a.guild_id
+            WHERE a.guild_id = %s AND s.tier = 'elite'
+        """, (guild_id,))
+        row = cur.fetchone()
+    return row[0] if row else None
 
-                file_log = discord.File(io.BytesIO(img_bytes), filename="veil.png")
-                await log_chan.send(embed=embed, file=file_log, view=admin_view)
-    # ─────────────────────────────────────────────────────────────────────────
+def forget_admin_log_channel(guild_id: int):
+    client.admin_log_channels.pop(guild_id, None)
 
-    return msg
+def make_log_thumbnail(png: bytes, width: int) -> bytes:
+    img = Image.open(io.BytesIO(png))
+    if img.width <= width:
+        return png
+    img.thumbnail((width, img.height), Image.LANCZOS)
+    return encode_png(img)
+
+class AdminLogEntry:
+    __slots__ = ("author_name", "png", "queued_at")
+
+    def __init__(self, author_name: str, png: bytes):
+        self.author_name = author_name
+        self.png = png
+        self.queued_at = time.monotonic()
+
+class AdminLogSender:
+    def __init__(self):
+        self.pending = {}    # guild_id -> [AdminLogEntry]
+        self.recent = {}     # guild_id -> deque of enqueue times (digest detection)
+        self.wakeup = None
+        self.task = None
+        self.deliveries = set()   # running _deliver tasks
+        self.sent = self.failed = self.digests = 0
+
+    def enqueue(self, guild: discord.Guild, author_id: int, png: bytes):
+        cached = client.admin_log_channels.get(guild.id)
+        if cached and cached[1] is None and time.monotonic() - cached[0] < ADMIN_LOG_CHANNEL_TTL:
+            return   # known: not elite or no log channel
+        if self.task is None:
+            self.wakeup = asyncio.Event()
+            self.task = asyncio.create_task(self._run())
+
+        member = guild.get_member(author_id)
+        name = get_display_name_safe(member).capitalize() if member else f"user:{author_id}"
+        self.pending.setdefault(guild.id, []).append(AdminLogEntry(name, png))
+
+        now = time.monotonic()
+        recent = self.recent.setdefault(guild.id, deque(maxlen=ADMIN_LOG_DIGEST_THRESHOLD))
+        recent.append(now)
+        if not self._busy(guild.id, now):
+            self.wakeup.set()
+
+    def _busy(self, guild_id: int, now: float) -> bool:
+        recent = self.recent.get(guild_id)
+        return bool(recent) and len(recent) == ADMIN_LOG_DIGEST_THRESHOLD and now - recent[0] < ADMIN_LOG_DIGEST_WINDOW
+
+    def stats(self) -> dict:
+        return {"queued": sum(map(len, self.pending.values())), "sent": self.sent,
+                "failed": self.failed, "digests": self.digests}
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=ADMIN_LOG_DIGEST_INTERVAL / 4)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            try:
+                now = time.monotonic()
+                for guild_id in list(self.pending):
+                    entries = self.pending[guild_id]
+                    digest = self._busy(guild_id, now)
+                    if digest and now - entries[0].queued_at < ADMIN_LOG_DIGEST_INTERVAL:
+                        continue   # keep collecting
+                    del self.pending[guild_id]
+                    task = asyncio.create_task(self._deliver(guild_id, entries, digest))
+                    self.deliveries.add(task)
+                    task.add_done_callback(self._delivered)
+                # forget guilds that have gone quiet
+                for guild_id in [g for g, r in self.recent.items() if now - r[-1] > ADMIN_LOG_DIGEST_WINDOW]:
+                    del self.recent[guild_id]
+            except Exception as e:
+                print(f"❌ Admin log sender error: {e}")
+
+    def _delivered(self, task: asyncio.Task):
+        self.deliveries.discard(task)
+        if not task.cancelled() and task.exception():
+            print(f"❌ Admin log delivery failed: {task.exception()}")
+
+    async def _channel(self, guild_id: int):
+        cached = client.admin_log_channels.get(guild_id)
+        if cached and time.monotonic() - cached[0] < ADMIN_LOG_CHANNEL_TTL:
+            channel_id = cached[1]
+        else:
+            channel_id = await asyncio.to_thread(load_admin_log_channel_id, guild_id)
+            client.admin_log_channels[guild_id] = (time.monotonic(), channel_id)
+        guild = client.get_guild(guild_id)
+        return guild.get_channel(channel_id) if guild and channel_id else None
+
+    async def _deliver(self, guild_id: int, entries: list[AdminLogEntry], digest: bool):
+        try:
+            channel = await self._channel(guild_id)
+        except Exception as e:
+            print(f"⚠️ Admin log channel lookup failed for guild {guild_id}: {e}")
+            self.failed += len(entries)
+            return
+        if not channel:
+            return
+
+        if ADMIN_LOG_THUMB_WIDTH:
+            for entry in entries:
+                try:
+                    entry.png = await render_queue.run(
+                        guild_id, RENDER_ADMIN_LOG, make_log_thumbnail, entry.png, ADMIN_LOG_THUMB_WIDTH
+                    )
+                except Exception as e:
+                    print(f"⚠️ Admin log thumbnail failed for guild {guild_id}: {e}")   # send the full card
+
+        if not digest:
+            for entry in entries:
+                await self._send(channel, [entry], self._single_message)
+            return
+        self.digests += 1
+        for i in range(0, len(entries), ADMIN_LOG_DIGEST_MAX):
+            await self._send(channel, entries[i:i + ADMIN_LOG_DIGEST_MAX], self._digest_message)
+
+    def _single_message(self, entries: list[AdminLogEntry]) -> dict:
+        embed = discord.Embed(title="🗃️ New Veil Submitted")
+        embed.set_image(url="attachment://veil.png")
+        admin_view = discord.ui.View(timeout=None)
+        admin_view.add_item(discord.ui.Button(
+            label=f"Submitted by {entries[0].author_name}",
+            style=discord.ButtonStyle.secondary,
+            custom_id="submitted_by_admin",
+            disabled=True
+        ))
+        return {"embed": embed, "file": discord.File(io.BytesIO(entries[0].png), filename="veil.png"),
+                "view": admin_view}
+
+    def _digest_message(self, entries: list[AdminLogEntry]) -> dict:
+        embeds, files = [], []
+        for i, entry in enumerate(entries):
+            embed = discord.Embed(
+                title="🗃️ Veil Digest" if i == 0 else None,
+                description=f"Submitted by **{entry.author_name}**",
+            )
+            embed.set_image(url=f"attachment://veil_{i}.png")
+            embeds.append(embed)
+            files.append(discord.File(io.BytesIO(entry.png), filename=f"veil_{i}.png"))
+        return {"embeds": embeds, "files": files}
+
+    async def _send(self, channel, entries: list[AdminLogEntry], build):
+        delay = 2
+        for attempt in range(ADMIN_LOG_RETRIES):
+            try:
+                await channel.send(**build(entries))   # fresh Files each attempt
+                self.sent += len(entries)
+                return
+            except (discord.Forbidden, discord.NotFound) as e:
+                print(f"⚠️ Admin log channel unusable in guild {channel.guild.id}: {e}")
+                forget_admin_log_channel(channel.guild.id)
+                break
+            except (discord.HTTPException, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == ADMIN_LOG_RETRIES - 1:
+                    print(f"⚠️ Admin log failed in guild {channel.guild.id} after {ADMIN_LOG_RETRIES} tries: {e}")
+                    break
+                await asyncio.sleep(delay)
+                delay *= 2
+        self.failed += len(entries)
+
+admin_logs = AdminLogSender()
+
+# ===================== VEIL RATE LIMITS =====================
+# Token buckets checked before any rendering or DB writes. Per tier:
+# (burst, veils per minute) for each user and for the guild as a whole.
+# veil_subscriptions.veil_rate_user / veil_rate_guild override the per-minute
+# rate for one guild (NULL = tier default).
+VEIL_RATE_LIMITS = {
+    "free":    {"user": (3, 2), "guild": (20, 10)},
+    "basic":   {"user": (4, 3), "guild": (30, 20)},
+    "premium": {"user": (5, 4), "guild": (60, 40)},
+    "elite":   {"user": (8, 6), "guild": (120, 80)},
+}
+RATE_LIMIT_QUEUE_MAX = 2.0   # wait up to this long for a token before rejecting
+RATE_LIMIT_TTL       = 60    # seconds a guild's limits are cached
+# guilds live on one cluster, so their buckets are always local; a user's bucket
+# spans clusters and is kept in Postgres when there is more than one
+RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "postgres" if CLUSTER_COUNT > 1 else "local")
+
+class LocalBucketStore:
+    MAX_BUCKETS = 50_000
+
+    def __init__(self):
+        self.buckets = {}   # key -> [tokens, updated_at, burst, per_sec]
+
+    def _level(self, b, now) -> float:
+        return min(b[2], b[0] + (now - b[1]) * b[3])
+
+    async def take(self, key: str, burst: int, per_sec: float) -> float:
+        """0 if a token was taken, else seconds until one is available."""
+        now = time.monotonic()
+        b = self.buckets.get(key)
+        tokens = self._level(b, now) if b else burst
+        if tokens >= 1:
+            self.buckets[key] = [tokens - 1, now, burst, per_sec]
+            if len(self.buckets) > self.MAX_BUCKETS:
+                # full buckets carry no state worth keeping
+                self.buckets = {k: v for k, v in self.buckets.items() if self._level(v, now) < v[2]}
+            return 0.0
+        self.buckets[key] = [tokens, now, burst, per_sec]
+        return (1 - tokens) / per_sec
+
+    async def refund(self, key: str, burst: int):
+        b = self.buckets.get(key)
+        if b:
+            b[0] = min(burst, b[0] + 1)
+
+class PostgresBucketStore:
+    def _take(self, key: str, burst: int, per_sec: float) -> float:
+        level = """LEAST(%(burst)s, b.tokens
+                   + EXTRACT(EPOCH FROM clock_timestamp() - b.updated_at)::float8 * %(rate)s)"""
+        args = {"key": key, "burst": burst, "rate": per_sec}
+        with pooled_cursor() as cur:
+            cur.execute(f"""
+                INSERT INTO veil_rate_buckets AS b (bucket, tokens, updated_at)
+                VALUES (%(key)s, %(burst)s - 1, clock_timestamp())
+                ON CONFLICT (bucket) DO UPDATE
+                   SET tokens = {level} - 1, updated_at = clock_timestamp()
+                 WHERE {level} >= 1
+                RETURNING 1
+            """, args)
+            if cur.fetchone():
+                return 0.0
+            cur.execute(f"SELECT {level} FROM veil_rate_buckets b WHERE bucket = %(key)s", args)
+            row = cur.fetchone()
+        tokens = float(row[0]) if row else 0.0
+        return max(0.0, (1 - tokens) / per_sec)
+
+    def _refund(self, key: str, burst: int):
+        with pooled_cursor() as cur:
+            cur.execute(
+                "UPDATE veil_rate_buckets SET tokens = LEAST(%s, tokens + 1) WHERE bucket = %s", (burst, key)
+            )
+
+    async def take(self, key: str, burst: int, per_sec: float) -> float:
+        return await asyncio.to_thread(self._take, key, burst, per_sec)
+
+    async def refund(self, key: str, burst: int):
+        await asyncio.to_thread(self._refund, key, burst)
+
+guild_buckets = LocalBucketStore()
+user_buckets = PostgresBucketStore() if RATE_LIMIT_STORE == "postgres" else guild_buckets
+client.rate_limits = {}   # guild_id -> (loaded_at, {"user": (burst, per_min), "guild": (...)})
+
+def load_rate_limits(guild_id: int) -> dict:
+    with pooled_cursor() as cur:
+        cur.execute("""
+            SELECT tier, veil_rate_user, veil_rate_guild FROM veil_subscriptions WHERE guild_id = %s
+        """, (guild_id,))
+        row = cur.fetchone()
+    tier, user_rate, guild_rate = row if row else ("free", None, None)
+    limits = dict(VEIL_RATE_LIMITS.get((tier or "free").lower(), VEIL_RATE_LIMITS["free"]))
+    if user_rate:
+        limits["user"] = (limits["user"][0], user_rate)
+    if guild_rate:
+        limits["guild"] = (limits["guild"][0], guild_rate)
+    return limits
+
+async def get_rate_limits(guild_id: int) -> dict:
+    cached = client.rate_limits.get(guild_id)
+    if cached and time.monotonic() - cached[0] < RATE_LIMIT_TTL:
+        return cached[1]
+    try:
+        limits = await asyncio.to_thread(load_rate_limits, guild_id)
+    except Exception as e:
+        print(f"⚠️ rate limit lookup failed for guild {guild_id}: {e}")
+        limits = VEIL_RATE_LIMITS["free"]
+    client.rate_limits[guild_id] = (time.monotonic(), limits)
+    return limits
+
+async def take_veil_token(guild_id: int, user_id: int) -> float:
+    """
+    Spend one veil from the user's and the guild's buckets. Waits briefly when
+    a token is close; returns 0 when allowed, else seconds until retry.
+    """
+    limits = await get_rate_limits(guild_id)
+    (user_burst, user_rate), (guild_burst, guild_rate) = limits["user"], limits["guild"]
+    user_key, guild_key = f"veil:u:{guild_id}:{user_id}", f"veil:g:{guild_id}"
+
+    while True:
+        wait = await user_buckets.take(user_key, user_burst, user_rate / 60)
+        if not wait:
+            wait = await guild_buckets.take(guild_key, guild_burst, guild_rate / 60)
+            if not wait:
+                return 0.0
+            await user_buckets.refund(user_key, user_burst)   # the guild said no; don't charge the user
+        if wait > RATE_LIMIT_QUEUE_MAX:
+            return wait
+        await asyncio.sleep(wait)
+
+def rate_limited_embed(retry_after: float) -> discord.Embed:
+    incorrectmoji = str(client.app_emojis["veilincorrect"])
+    return discord.Embed(
+        title=f"{incorrectmoji} Slow Down",
+        description=f"Too many veils right now. Try again in **{max(1, round(retry_after))}s**.",
+        color=0x992d22
+    )
 
 # 🔶 MODAL
 class VeilModal(Modal, title="New Veil"):
@@ -2605,9 +4377,10 @@ class VeilModal(Modal, title="New Veil"):
         await interaction.response.defer(ephemeral=True, thinking=True)
 
         text = self.message.value
+        analysis = analyze_text(text)
 
         # 🚫 Emoji limit (custom + unicode/Twemoji)
-        total_emojis = count_emojis_all(text)
+        total_emojis = analysis.emoji_count
         if total_emojis > EMOJI_LIMIT:
             return await interaction.followup.send(
                 embed=discord.Embed(
@@ -2622,7 +4395,7 @@ class VeilModal(Modal, title="New Veil"):
             )
 
         # 🚫 Visual-length limit (grapheme-aware, emojis count as 1)
-        vlen = visual_length(text)
+        vlen = analysis.visual_length
         if vlen > MAX_VISUAL:
             return await interaction.followup.send(
                 embed=discord.Embed(
@@ -2649,6 +4422,11 @@ class VeilModal(Modal, title="New Veil"):
                 ephemeral=True
             )
 
+        # only charge a token for a veil that can actually be posted
+        retry_after = await take_veil_token(interaction.guild.id, interaction.user.id)
+        if retry_after:
+            return await interaction.followup.send(embed=rate_limited_embed(retry_after), ephemeral=True)
+
         # 🖼️ Send the actual veil
         await send_veil_message(interaction, text, channel)
 
@@ -2704,18 +4482,50 @@ def compose_from_prepared(prepared_png: bytes, frame_key: str, *, unveiled: bool
     return out
 
 # ===================== UNVEIL DROPDOWN =====================
+client.guesses_inflight = {}   # (message_id, guesser_id) -> future of the outcome embed
+
 class UnveilDropdown(discord.ui.Select):
     def __init__(self, message_id: int, author_id: int, options: list[discord.SelectOption]):
         super().__init__(
             placeholder="Guess who wrote this...",
             min_values=1,
             max_values=1,
-            options=options
+            options=options,
+            # unique per dropdown: ephemeral views all register under message_id None,
+            # so a shared id would let one user's view evict (or time out) everyone's
+            custom_id=f"unveil_pick:{message_id}:{os.urandom(8).hex()}",
         )
         self.message_id = message_id
         self.author_id = author_id
 
     async def callback(self, interaction: discord.Interaction):
+        # Double-clicks / laggy clients: one attempt per (veil, guesser). Duplicates
+        # wait for it and show its outcome instead of charging + refunding again.
+        key = (self.message_id, interaction.user.id)
+        pending = client.guesses_inflight.get(key)
+        if pending is not None:
+            await defer_once(interaction)
+            outcome = await asyncio.shield(pending)
+            if outcome is not None:
+                await reply_edit(interaction, embed=outcome, view=None)
+            return
+
+        done = asyncio.get_running_loop().create_future()
+        client.guesses_inflight[key] = done
+        outcome = None
+
+        async def respond(**kwargs):
+            nonlocal outcome
+            outcome = kwargs.get("embed", outcome)
+            return await interaction.edit_original_response(**kwargs)
+
+        try:
+            await self._guess(interaction, respond)
+        finally:
+            client.guesses_inflight.pop(key, None)
+            done.set_result(outcome)
+
+    async def _guess(self, interaction: discord.Interaction, respond):
         incorrectmoji = str(client.app_emojis["veilincorrect"])
         veilcoinemoji = str(client.app_emojis["veilcoin"])
         maskemoji     = str(client.app_emojis["veilemoji"])
@@ -2723,13 +4533,11 @@ class UnveilDropdown(discord.ui.Select):
         guesser_id = interaction.user.id
         guessed_user_id = int(self.values[0])
         guild_id = interaction.guild.id
-        tier = get_subscription_tier(guild_id)
-        is_elite = (tier == "elite")
 
-        cap = get_max_guesses(guild_id)
-        # 1) Quick ACK
+        # 1) Quick ACK (before any DB work)
         try:
-            await interaction.response.edit_message(
+            await reply_edit(
+                interaction,
                 embed=discord.Embed(
                     title="Checking Guess",
                     description="Checking your guess and updating the veil…",
@@ -2740,6 +4548,9 @@ class UnveilDropdown(discord.ui.Select):
         except Exception:
             pass
 
+        tier, cap = await asyncio.to_thread(lambda: (get_subscription_tier(guild_id), get_max_guesses(guild_id)))
+        is_elite = (tier == "elite")
+
         # 2) Coins (skip for Elite)
         if not is_elite:
             ensure_user_entry(guesser_id, guild_id)
@@ -2747,7 +4558,7 @@ class UnveilDropdown(discord.ui.Select):
             if get_user_coins(guesser_id, guild_id) < 5:
                 view = discord.ui.View()
                 view.add_item(StoreButton())
-                return await interaction.edit_original_response(
+                return await respond(
                     embed=discord.Embed(
                         title=f"{incorrectmoji} Not Enough Coins",
                         description=(f"You need **5** {veilcoinemoji} per guess.\n"
@@ -2757,7 +4568,7 @@ class UnveilDropdown(discord.ui.Select):
                     view=view
                 )
             if not deduct_user_coins(guesser_id, guild_id, 5):
-                return await interaction.edit_original_response(
+                return await respond(
                     embed=discord.Embed(
                         title=f"{incorrectmoji} Transaction Failed",
                         description="Couldn’t charge Veil Coins. Try again later.",
@@ -2774,7 +4585,7 @@ class UnveilDropdown(discord.ui.Select):
             )
             row = cur.fetchone()
             if not row:
-                return await interaction.edit_original_response(
+                return await respond(
                     embed=discord.Embed(
                         title=f"{incorrectmoji} Message Not Found",
                         description="That veil no longer exists.",
@@ -2785,7 +4596,7 @@ class UnveilDropdown(discord.ui.Select):
 
             guess_count, real_author_id, is_unveiled = row
             if is_unveiled or guess_count >= cap:
-                return await interaction.edit_original_response(
+                return await respond(
                     embed=discord.Embed(
                         title=f"{incorrectmoji} No More Guesses",
                         description=f"This veil is already unveiled or has {cap} guesses.",
@@ -2809,7 +4620,7 @@ class UnveilDropdown(discord.ui.Select):
                 if not is_elite:
                     add_user_coins(guesser_id, guild_id, 5)  # refund
                 conn.commit()
-                return await interaction.edit_original_response(
+                return await respond(
                     embed=discord.Embed(
                         title=f"{incorrectmoji} You Already Guessed",
                         description="You’ve already guessed on this veil.",
@@ -2829,9 +4640,7 @@ class UnveilDropdown(discord.ui.Select):
                     RETURNING 1
                 """, (guess_count, self.message_id))
                 won = (cur.fetchone() is not None)
-                if won:
-                    increment_unveiled_count(guesser_id, guild_id)
-                else:
+                if not won:
                     # lost the race; mark their guess as incorrect and just bump count
                     cur.execute("""
                         UPDATE veil_guesses
@@ -2850,7 +4659,14 @@ class UnveilDropdown(discord.ui.Select):
                     WHERE message_id = %s
                 """, (guess_count, self.message_id))
 
+            bump_guess(cur, guild_id, guesser_id, unveiled=(is_correct and won))
+            # after the bump: this commits the shared connection, and the guess and its
+            # counters must land together (see compute_guild_stats_deltas)
+            if is_correct and won:
+                increment_unveiled_count(guesser_id, guild_id)
             conn.commit()
+        if is_correct and won:
+            note_leaderboard_unveil(guild_id, guesser_id)
 
         # 4) Update the public message view
         msg = await interaction.channel.fetch_message(self.message_id)
@@ -2895,7 +4711,7 @@ class UnveilDropdown(discord.ui.Select):
                 key  = row[3] if row else None
 
                 if not blob:
-                    await interaction.edit_original_response(
+                    await respond(
                         embed=discord.Embed(title="Uh-oh", description="Missing stored image data.", color=0x992d22),
                         view=None
                     )
@@ -2907,7 +4723,7 @@ class UnveilDropdown(discord.ui.Select):
                     pack = packs.get(key) or packs.get("gold")
                     skin = (pack.unveil if pack and pack.unveil else pack.veil) if pack else None
                     if not skin:
-                        await interaction.edit_original_response(
+                        await respond(
                             embed=discord.Embed(title="Uh-oh", description="Unveil skin not available.", color=0x992d22),
                             view=None
                         )
@@ -2915,21 +4731,24 @@ class UnveilDropdown(discord.ui.Select):
                     try:
                         user_img = Image.open(io.BytesIO(blob)).convert("RGBA")
                     except Exception:
-                        await interaction.edit_original_response(
+                        await respond(
                             embed=discord.Embed(title="Uh-oh", description="Couldn’t decode stored image.", color=0x992d22),
                             view=None
                         )
                         return
 
-                    unveiled_img = compose_around_photo(user_img, skin)
-                    buf = io.BytesIO(); unveiled_img.save(buf, format="PNG"); buf.seek(0)
-                    file = discord.File(buf, filename="veil.png")
+                    png = await render_queue.run(
+                        guild_id, RENDER_UNVEIL, lambda: encode_png(compose_around_photo(user_img, skin))
+                    )
+                    file = discord.File(io.BytesIO(png), filename="veil.png")
 
                 else:
                     # OLD MODE (fixed PNG frames): frame_key is landscape/portrait/square and blob is prepared window
-                    unveiled_img = compose_from_prepared(blob, key or "square", unveiled=True)
-                    buf = io.BytesIO(); unveiled_img.save(buf, format="PNG"); buf.seek(0)
-                    file = discord.File(buf, filename="veil.png")
+                    png = await render_queue.run(
+                        guild_id, RENDER_UNVEIL,
+                        lambda: encode_png(compose_from_prepared(blob, key or "square", unveiled=True))
+                    )
+                    file = discord.File(io.BytesIO(png), filename="veil.png")
 
             else:
                 # 🔧 TEXT VEIL: render the unveiled TEXT card without posting (export/preview path)
@@ -2970,7 +4789,7 @@ class UnveilDropdown(discord.ui.Select):
                     add_user_coins(guesser_id, guild_id, reward)
                     reward_line = f"\n\n**{reward} Veil Coins** added. {veilcoinemoji}"
 
-            return await interaction.edit_original_response(
+            return await respond(
                 embed=discord.Embed(
                     title=f"{maskemoji} Veil Removed",
                     description=f"The veil has been removed!{reward_line}",
@@ -2981,7 +4800,7 @@ class UnveilDropdown(discord.ui.Select):
 
         if is_correct and not won:
             await msg.edit(view=view)
-            return await interaction.edit_original_response(
+            return await respond(
                 embed=discord.Embed(
                     title=f"{incorrectmoji} Too Late",
                     description="Someone else unveiled this veil just before you.",
@@ -2992,7 +4811,7 @@ class UnveilDropdown(discord.ui.Select):
 
         if guess_count >= cap:
             await msg.edit(view=view)
-            return await interaction.edit_original_response(
+            return await respond(
                 embed=discord.Embed(
                     title=f"{incorrectmoji} {cap} Guesses Used",
                     description="The veil remains on this message.",
@@ -3003,7 +4822,7 @@ class UnveilDropdown(discord.ui.Select):
 
         # incorrect guess, attempts remain
         await msg.edit(view=view)
-        return await interaction.edit_original_response(
+        return await respond(
             embed=discord.Embed(
                 title=f"{incorrectmoji} Incorrect Guess",
                 description="That guess isn’t correct.",
@@ -3012,58 +4831,210 @@ class UnveilDropdown(discord.ui.Select):
             view=None
         )
 
+# ===================== GUESS CANDIDATE INDEX =====================
+RECENT_POSTERS_LIMIT = 50   # ring size per channel
+
+class GuildCandidateIndex:
+    """
+    Per-guild pool for the Unveil dropdown, kept current by member events and
+    new veils so a click never walks guild.members or aggregates veil history.
+    - ids: sorted array('Q') of non-bot member ids (8 bytes each, O(log n) lookup)
+    - recent: channel_id -> deque of recent veil authors, newest first
+    """
+    __slots__ = ("ids", "recent", "complete")
+
+    def __init__(self, guild: discord.Guild):
+        self.recent: dict[int, deque] = {}
+        self.rebuild(guild)
+
+    def rebuild(self, guild: discord.Guild):
+        self.ids = array("Q", sorted(m.id for m in guild.members if not m.bot))
+        self.complete = guild.chunked   # False → rebuild once the chunk lands
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, user_id: int) -> bool:
+        i = bisect.bisect_left(self.ids, user_id)
+        return i < len(self.ids) and self.ids[i] == user_id
+
+    def add(self, user_id: int):
+        i = bisect.bisect_left(self.ids, user_id)
+        if i == len(self.ids) or self.ids[i] != user_id:
+            self.ids.insert(i, user_id)
+
+    def remove(self, user_id: int):
+        i = bisect.bisect_left(self.ids, user_id)
+        if i < len(self.ids) and self.ids[i] == user_id:
+            del self.ids[i]
+
+    def sample(self, k: int, exclude: set[int]) -> list[int]:
+        """Up to k random ids not in `exclude` — O(k), not O(members)."""
+        n = len(self.ids)
+        if not n or k <= 0:
+            return []
+        picks = random.sample(range(n), min(n, k + len(exclude)))
+        return [self.ids[i] for i in picks if self.ids[i] not in exclude][:k]
+
+    def note_post(self, channel_id: int, author_id: int):
+        ring = self.recent.get(channel_id)
+        if ring is None:
+            return  # not seeded yet; the first lookup reads the DB
+        with contextlib.suppress(ValueError):
+            ring.remove(author_id)
+        ring.appendleft(author_id)
+
+client.candidate_index = {}   # guild_id -> GuildCandidateIndex
+
+def get_candidate_index(guild: discord.Guild) -> GuildCandidateIndex:
+    idx = client.candidate_index.get(guild.id)
+    if idx is None:
+        idx = client.candidate_index[guild.id] = GuildCandidateIndex(guild)
+    elif not idx.complete and guild.chunked:
+        idx.rebuild(guild)
+    return idx
+
+def fetch_recent_poster_ids(channel_id: int, limit: int = RECENT_POSTERS_LIMIT) -> list[int]:
+    with get_safe_cursor() as cur:
+        cur.execute("""
+            SELECT author_id
+            FROM channel_recent_authors
+            WHERE channel_id = %s
+            ORDER BY last_posted_at DESC
+            LIMIT %s
+        """, (channel_id, limit))
+        return [row[0] for row in cur.fetchall()]
+
+def touch_recent_author(cur, channel_id: int, author_id: int):
+    """Call inside the veil insert's transaction."""
+    cur.execute("""
+        INSERT INTO channel_recent_authors (channel_id, author_id, last_posted_at)
+        VALUES (%s, %s, NOW())
+        ON CONFLICT (channel_id, author_id) DO UPDATE SET last_posted_at = EXCLUDED.last_posted_at
+    """, (channel_id, author_id))
+
+def get_recent_posters(guild: discord.Guild, channel_id: int) -> deque:
+    idx = get_candidate_index(guild)
+    ring = idx.recent.get(channel_id)
+    if ring is None:
+        # first Unveil in this channel since startup: seed once from the DB
+        ring = idx.recent[channel_id] = deque(fetch_recent_poster_ids(channel_id), maxlen=RECENT_POSTERS_LIMIT)
+    return ring
+
+def seed_recent_posters(guild: discord.Guild, channel_id: int, author_ids: list[int]):
+    """Seed a channel's ring from ids the caller already fetched (no-op if seeded)."""
+    idx = get_candidate_index(guild)
+    if channel_id not in idx.recent:
+        idx.recent[channel_id] = deque(author_ids, maxlen=RECENT_POSTERS_LIMIT)
+
+def needs_recent_seed(guild: discord.Guild, channel_id: int) -> bool:
+    idx = client.candidate_index.get(guild.id)
+    return idx is None or channel_id not in idx.recent
+
+def load_guess_context(message_id: int, guild_id: int, user_id: int, with_recent: bool):
+    """
+    Everything the Unveil button needs in one round-trip:
+    (content, author_id, is_unveiled, guess_count, cap, already_guessed, recent_ids)
+    recent_ids is None unless with_recent. Returns None if the veil is unknown.
+    """
+    with get_safe_cursor() as cur:
+        cur.execute("""
+            SELECT vm.content,
+                   vm.author_id,
+                   vm.is_unveiled,
+                   vm.guess_count,
+                   vs.max_guesses,
+                   EXISTS (
+                       SELECT 1 FROM veil_guesses vg
+                       WHERE vg.message_id = vm.message_id AND vg.guesser_id = %s
+                   ),
+                   CASE WHEN %s THEN ARRAY(
+                       SELECT cra.author_id
+                       FROM channel_recent_authors cra
+                       WHERE cra.channel_id = vm.channel_id
+                       ORDER BY cra.last_posted_at DESC
+                       LIMIT %s
+                   ) END
+            FROM veil_messages vm
+            LEFT JOIN veil_settings vs ON vs.guild_id = %s
+            WHERE vm.message_id = %s
+        """, (user_id, with_recent, RECENT_POSTERS_LIMIT, guild_id, message_id))
+        row = cur.fetchone()
+    if not row:
+        return None
+    content, author_id, is_unveiled, guess_count, cap, already_guessed, recent_ids = row
+    # same clamp as get_max_guesses (missing row → default 3)
+    cap = 3 if cap is None or not 1 <= int(cap) <= 3 else int(cap)
+    return content, author_id, bool(is_unveiled), int(guess_count or 0), cap, already_guessed, recent_ids
+
+def note_veil_posted(guild: discord.Guild, channel_id: int, author_id: int):
+    idx = client.candidate_index.get(guild.id)
+    if idx:
+        idx.note_post(channel_id, author_id)
+
+@client.event
+async def on_member_join(member: discord.Member):
+    idx = client.candidate_index.get(member.guild.id)
+    if idx and not member.bot:
+        idx.add(member.id)
+
+@client.event
+async def on_member_update(before: discord.Member, after: discord.Member):
+    # e.g. a member we hadn't cached when the index was built
+    idx = client.candidate_index.get(after.guild.id)
+    if idx and not after.bot:
+        idx.add(after.id)
+
+@client.event
+async def on_raw_member_remove(payload: discord.RawMemberRemoveEvent):
+    idx = client.candidate_index.get(payload.guild_id)
+    if idx:
+        idx.remove(payload.user.id)
+
+@client.event
+async def on_guild_remove(guild: discord.Guild):
+    client.candidate_index.pop(guild.id, None)
+
 class UnveilView(discord.ui.View):
-    def __init__(self, message_id: int, author_id: int, interaction: discord.Interaction):
+    def __init__(self, message_id: int, author: discord.abc.User, interaction: discord.Interaction):
         super().__init__(timeout=None)
 
+        author_id = author.id
         guild = interaction.guild
         channel_id = interaction.channel.id
 
-        # --- Build candidate pools ---
-        # Everyone except bots & the real author
-        all_members = [m for m in guild.members if not m.bot and m.id != author_id]
+        # --- Build candidate pools (from the incremental index) ---
+        idx = get_candidate_index(guild)
 
         # Recent posters in THIS channel (ids only -> members)
-        with get_safe_cursor() as cur:
-            cur.execute("""
-                SELECT author_id
-                FROM veil_messages
-                WHERE channel_id = %s
-                GROUP BY author_id
-                ORDER BY MAX(timestamp) DESC
-                LIMIT 50
-            """, (channel_id,))
-            recent_ids = [row[0] for row in cur.fetchall() if row[0] != author_id]
-
-        recent_members = [guild.get_member(uid) for uid in recent_ids]
+        recent_members = [guild.get_member(uid) for uid in get_recent_posters(guild, channel_id) if uid != author_id]
         recent_members = [m for m in recent_members if m and not m.bot and m.id != author_id]
 
         # --- Random selection logic ---
-        import random
-
         # Cap how many we *try* to take from "recent" to keep variety
         RECENT_CAP = 12
         take_recent = min(RECENT_CAP, len(recent_members))
         recent_pick = random.sample(recent_members, k=take_recent) if take_recent else []
 
-        # Fill the rest from everyone else (excluding the ones we already took)
+        # Fill the rest from everyone else (excluding the author + the ones we already took)
         remaining_slots = max(0, 24 - len(recent_pick))  # 24 + author = 25 max
-        excluded_ids = {m.id for m in recent_pick}
-        others_pool = [m for m in all_members if m.id not in excluded_ids]
-
-        if remaining_slots and others_pool:
-            others_pick = random.sample(others_pool, k=min(remaining_slots, len(others_pool)))
-        else:
-            others_pick = []
-
-        # Combine + guarantee the real author is present
+        excluded_ids = {m.id for m in recent_pick} | {author_id}
+
+        others_pick = []
+        # oversample a little: some ids may have dropped out of the member cache
+        for uid in idx.sample(remaining_slots + 8, excluded_ids):
+            m = guild.get_member(uid)
+            if m and not m.bot:
+                others_pick.append(m)
+                if len(others_pick) >= remaining_slots:
+                    break
+
+        # Combine + guarantee the real author is present (resolved by the caller, cached or not)
         final_members = recent_pick + others_pick
-        author_member = guild.get_member(author_id)
-        if author_member and not author_member.bot:
-            # If we somehow ran out of space, bump one random entry to ensure author presence
-            if len(final_members) >= 24:
-                final_members.pop(random.randrange(len(final_members)))
-            final_members.append(author_member)
+        # If we somehow ran out of space, bump one random entry to ensure author presence
+        if len(final_members) >= 25:
+            final_members.pop(random.randrange(len(final_members)))
+        final_members.append(author)
 
         # De-dupe just in case, then hard-cap to 25
         seen = set()
@@ -3337,6 +5308,7 @@ class CreateAdminChannelButton(Button):
                 with get_safe_cursor() as cur:
                     cur.execute("DELETE FROM veil_admin_channels WHERE guild_id = %s", (guild.id,))
                     conn.commit()
+                forget_admin_log_channel(guild.id)
 
         # ✅ Create the new channel
         overwrites = {
@@ -3777,127 +5749,287 @@ class HelpView(View):
         self.add_item(StoreButton())
         self.add_item(LeaderboardButton())
 
-        # Admin-only helpers (reuse YOUR Configure and Upgrade flows)
-        if invoker.guild_permissions.administrator:
-            self.add_item(ConfigureButton())
-            self.add_item(HelpUpgradeButton())
+        # Admin-only helpers (reuse YOUR Configure and Upgrade flows)
+        if invoker.guild_permissions.administrator:
+            self.add_item(ConfigureButton())
+            self.add_item(HelpUpgradeButton())
+
+class StoreButton(Button):
+    def __init__(self):
+        super().__init__(label="Open Store", style=discord.ButtonStyle.secondary, emoji="🏪")
+
+    async def callback(self, interaction: discord.Interaction):
+        embed = build_store_embed()
+        view = StoreView()
+        file = discord.File("veilstore.png", filename="veilstore.png")
+        await interaction.response.send_message(embed=embed, view=view, file=file, ephemeral=True)
+
+# ===================== LEADERBOARD =====================
+LEADERBOARD_TOP_N = 100     # rows materialized per guild
+LEADERBOARD_PAGE  = 10
+LEADERBOARD_TTL   = 120     # seconds; correct guesses also update it in place
+
+client.leaderboards = {}    # (guild_id, board, period) -> (loaded_at, [[user_id, n], ...]) sorted desc
+
+PERIOD_LABELS = {"week": "This Week", "month": "This Month", "all": "All Time"}
+
+def get_leaderboard_rows(guild_id: int, board: str = "unveils", period: str = "all") -> list[list[int]]:
+    key = (guild_id, board, period)
+    cached = client.leaderboards.get(key)
+    if cached and time.monotonic() - cached[0] < LEADERBOARD_TTL:
+        return cached[1]
+    rows = [list(r) for r in fetch_leaderboard(guild_id, board, period, limit=LEADERBOARD_TOP_N)]
+    client.leaderboards[key] = (time.monotonic(), rows)
+    return rows
+
+async def load_leaderboard_rows(guild_id: int, board: str = "unveils", period: str = "all") -> list[list[int]]:
+    """get_leaderboard_rows with the query in a worker thread; the cache itself is only touched on the loop."""
+    key = (guild_id, board, period)
+    cached = client.leaderboards.get(key)
+    if cached and time.monotonic() - cached[0] < LEADERBOARD_TTL:
+        return cached[1]
+    fetched = await asyncio.to_thread(fetch_leaderboard, guild_id, board, period, LEADERBOARD_TOP_N)
+    rows = [list(r) for r in fetched]
+    client.leaderboards[key] = (time.monotonic(), rows)
+    return rows
+
+def note_leaderboard_unveil(guild_id: int, user_id: int):
+    """Apply one winning guess to every cached unveil board (today is in every window)."""
+    for period in PERIOD_LABELS:
+        key = (guild_id, "unveils", period)
+        cached = client.leaderboards.get(key)
+        if not cached:
+            continue
+        rows = cached[1]
+        for row in rows:
+            if row[0] == user_id:
+                row[1] += 1
+                break
+        else:
+            if len(rows) >= LEADERBOARD_TOP_N:
+                # outside the materialized window — their total is unknown here
+                client.leaderboards.pop(key, None)
+                continue
+            rows.append([user_id, 1])
+        rows.sort(key=lambda r: r[1], reverse=True)
+
+def ranked_members(guild: discord.Guild, board: str = "unveils", period: str = "all") -> list[tuple[discord.Member, int]]:
+    # members who left are skipped at read time
+    return [(m, n) for uid, n in get_leaderboard_rows(guild.id, board, period) if (m := guild.get_member(uid))]
+
+LEADERBOARD_BADGES = ("1st", "2nd", "3rd", "4th", "5th", "6th", "7th", "8th", "9th", "10th")
+
+def leaderboard_page(guild: discord.Guild, page: int = 0, board: str = "unveils", period: str = "all") -> tuple[list[tuple[int, Optional[str], str, str]], str, int, int]:
+    """(rows, heading, page, page_count) straight from ranked_members; rows are (rank, badge, name, value)."""
+    noun = "unveils" if board == "unveils" else "votes"
+    ranked = ranked_members(guild, board, period)
+    if not ranked:
+        return [], "", 0, 0
+
+    pages = (len(ranked) + LEADERBOARD_PAGE - 1) // LEADERBOARD_PAGE
+    page = max(0, min(page, pages - 1))
+    start = page * LEADERBOARD_PAGE
+
+    who = "Unveilers" if board == "unveils" else "Voters"
+    if start == 0:
+        heading = f"**Top 10 {who}**"
+    else:
+        heading = f"**{who} #{start + 1}–{min(start + LEADERBOARD_PAGE, len(ranked))}**"
+    if period != "all":
+        heading += f" · {PERIOD_LABELS[period]}"
+
+    # Badges: 1–10 are custom emojis; past that the rank number stands in (badge None)
+    rows = []
+    for idx, (member, n) in enumerate(ranked[start:start + LEADERBOARD_PAGE], start=start + 1):
+        badge = str(client.app_emojis[LEADERBOARD_BADGES[idx - 1]]) if idx <= len(LEADERBOARD_BADGES) else None
+        rows.append((idx, badge, get_display_name_safe(member).title(), f"{n:,} {noun}"))
+    return rows, heading, page, pages
+
+def leaderboard_embed_for(board: str, period: str, rows: list, heading: str, page: int, pages: int) -> discord.Embed:
+    if pages == 0:
+        empty = "unveiled any messages" if board == "unveils" else "voted for Veil"
+        when = "" if period == "all" else f" {PERIOD_LABELS[period].lower()}"
+        return discord.Embed(
+            title="Veil Leaderboard",
+            description=f"No users in this server have {empty}{when} yet.",
+            color=0xeeac00
+        )
 
-class StoreButton(Button):
-    def __init__(self):
-        super().__init__(label="Open Store", style=discord.ButtonStyle.secondary, emoji="🏪")
+    embed = discord.Embed(title="Veil Leaderboard", description=heading, color=0xeeac00)
+    embed.set_thumbnail(url="https://i.imgur.com/E2jxHuj.png")
+    for rank, badge, name, value in rows:
+        embed.add_field(name=f"{badge or f'`#{rank}`'} {name}", value=value, inline=False)
+    if pages > 1:
+        embed.set_footer(text=f"Page {page + 1}/{pages}")
+    return embed
 
-    async def callback(self, interaction: discord.Interaction):
-        embed = build_store_embed()
-        view = StoreView()
-        file = discord.File("veilstore.png", filename="veilstore.png")
-        await interaction.response.send_message(embed=embed, view=view, file=file, ephemeral=True)
+def build_leaderboard_embed(guild: discord.Guild, page: int = 0, board: str = "unveils", period: str = "all") -> tuple[discord.Embed, int]:
+    """(embed, page_count); page_count == 0 means the board is empty."""
+    rows, heading, page, pages = leaderboard_page(guild, page, board, period)
+    return leaderboard_embed_for(board, period, rows, heading, page, pages), pages
 
-class LeaderboardButton(Button):
-    def __init__(self):
-        super().__init__(label="Leaderboard", style=discord.ButtonStyle.secondary, emoji="🏆")
+# --- rendered card ---
+LEADERBOARD_CARD_W = 900
+LEADERBOARD_ROW_H  = 72
 
-    async def callback(self, interaction: discord.Interaction):
-        guild = interaction.guild
-        guild_id = guild.id
-        tier = get_subscription_tier(guild_id)
+# content-addressed like the text cards: same heading + rows → same PNG
+leaderboard_card_cache = RenderCache(max_bytes=int(os.getenv("LEADERBOARD_CACHE_MB", "16")) * 1024 * 1024)
 
-        if tier not in ("premium", "elite"):
-            incorrectmoji = str(client.app_emojis["veilincorrect"])
-            return await interaction.response.send_message(
-                embed=discord.Embed(
-                    title=f"{incorrectmoji} Premium Feature",
-                    description="The leaderboard is only available for **Premium** and **Elite** tiers.",
-                    color=0x992d22
-                ),
-                ephemeral=True
+def _card_font(font_file: str, size: int):
+    try:
+        return ImageFont.truetype(font_file, size)
+    except OSError:
+        return ImageFont.truetype(FONT_MAP["latin"], size)
+
+def render_leaderboard_card(rows: list[tuple[int, Optional[str], str, str]], heading: str) -> bytes:
+    """Blocking (badge emojis + Pillow) — run on the render queue."""
+    pad, top = 40, 128
+    height = top + LEADERBOARD_ROW_H * len(rows) + pad // 2
+    image = Image.new("RGBA", (LEADERBOARD_CARD_W, height), (30, 31, 34, 255))
+    draw = ImageDraw.Draw(image)
+    gold = (238, 172, 0, 255)
+
+    draw_text_with_shadow(image, (pad, 26), "VEIL LEADERBOARD", _card_font(FONT_MAP["latin"], 44), fill=gold)
+    draw.text((pad, 84), heading.replace("**", ""), font=_card_font(FONT_MAP["latin"], 22), fill=(185, 187, 190, 255))
+
+    value_font = _card_font(FONT_MAP["latin"], 26)
+    emoji_size = 40
+    for i, (rank, badge, name, value) in enumerate(rows):
+        y = top + i * LEADERBOARD_ROW_H
+        if i % 2 == 0:
+            draw.rounded_rectangle(
+                (pad - 16, y, LEADERBOARD_CARD_W - pad + 16, y + LEADERBOARD_ROW_H - 8),
+                radius=14, fill=(43, 45, 49, 255)
             )
+        text_y = y + 12
+
+        # rank badge (custom emoji, fetched once and cached by load_custom_emoji)
+        x = render_emojis(draw, image, [badge or f"#{rank}"], pad, text_y + 4, value_font, emoji_size, 4, gold, emoji_offset=-6)
+
+        # value, right-aligned
+        value_w = draw.textlength(value, font=value_font)
+        draw.text((LEADERBOARD_CARD_W - pad - value_w, text_y + 4), value, font=value_font, fill=(220, 221, 222, 255))
+
+        # name: one wrapped line, ellipsized if it doesn't fit
+        render_text, font_file, layout = get_render_text_and_font(name)
+        font = card_font(font_file, 30, layout)
+        name_x = max(x + 16, pad + 72)   # names line up whatever the badge width
+        box_w = int(LEADERBOARD_CARD_W - pad - value_w - 48 - name_x)
+        lines = build_wrapped_lines(tokenize_message_for_wrap(render_text), font, box_w, draw, 32, 4)
+        line = lines[0] if lines else []
+        if len(lines) > 1:
+            line = line + ["…"]
+        render_emojis(draw, image, line, name_x, text_y, font, 32, 4, (255, 255, 255, 255), emoji_offset=2)
 
-        channel_ids = tuple(c.id for c in guild.text_channels)
-        if not channel_ids:
-            return await interaction.response.send_message(
-                embed=discord.Embed(
-                    title="Veil Leaderboard",
-                    description="No text channels found for this server.",
-                    color=0xeeac00
-                ),
-                ephemeral=True
-            )
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
 
-        # Top 10 unveilers in this guild
-        with get_safe_cursor() as cur:
-            cur.execute("""
-                SELECT vg.guesser_id, COUNT(*) AS unveils
-                FROM veil_guesses vg
-                JOIN veil_messages vm ON vm.message_id = vg.message_id
-                WHERE vg.is_correct = TRUE
-                  AND vm.channel_id IN %s
-                GROUP BY vg.guesser_id
-                ORDER BY unveils DESC
-                LIMIT 50
-            """, (channel_ids,))
-            rows = cur.fetchall()
-
-        # Resolve members; filter users no longer in guild
-        ranked = []
-        for user_id, unveils in rows:
-            m = guild.get_member(user_id)
-            if m:
-                ranked.append((m, unveils))
-
-        ranked = ranked[:10]
-
-        if not ranked:
-            return await interaction.response.send_message(
-                embed=discord.Embed(
-                    title="Veil Leaderboard",
-                    description="No users in this server have unveiled any messages yet.",
-                    color=0xeeac00
-                ),
-                ephemeral=True
-            )
+async def build_leaderboard_message(guild: discord.Guild, page: int = 0, board: str = "unveils", period: str = "all") -> tuple[discord.Embed, Optional[discord.File], int]:
+    """(embed, card file, page_count). Falls back to the field embed if rendering fails."""
+    await load_leaderboard_rows(guild.id, board, period)
+    rows, heading, page, pages = leaderboard_page(guild, page, board, period)
+    embed = leaderboard_embed_for(board, period, rows, heading, page, pages)
+    if pages == 0:
+        return embed, None, 0
 
-        # Badges: 1–3 = medals, 4–10 = your custom emojis (fallback -> 🏅)
-        badge = {
-            1: str(client.app_emojis["1st"]),
-            2: str(client.app_emojis["2nd"]),
-            3: str(client.app_emojis["3rd"]),
-            4: str(client.app_emojis["4th"]),
-            5: str(client.app_emojis["5th"]),
-            6: str(client.app_emojis["6th"]),
-            7: str(client.app_emojis["7th"]),
-            8: str(client.app_emojis["8th"]),
-            9: str(client.app_emojis["9th"]),
-            10: str(client.app_emojis["10th"])
-        }
+    # re-render only when what this page shows actually changed
+    try:
+        png = await leaderboard_card_cache.get_or_render(
+            RenderCache.key("leaderboard", heading, rows),
+            lambda: render_queue.run(guild.id, RENDER_LEADERBOARD, render_leaderboard_card, rows, heading),
+        )
+    except Exception as e:
+        print(f"⚠️ leaderboard card render failed for {guild.id}: {e}")
+        return embed, None, pages
 
+    embed.clear_fields()
+    embed.set_thumbnail(url=None)
+    embed.set_image(url="attachment://leaderboard.png")
+    return embed, discord.File(io.BytesIO(png), filename="leaderboard.png"), pages
 
-        def fmt(n):
-            try: return f"{int(n):,}"
-            except: return str(n)
+class LeaderboardPageView(View):
+    def __init__(self, guild_id: int, page: int, pages: int, board: str = "unveils", period: str = "all"):
+        super().__init__(timeout=300)
+        self.guild_id = guild_id
+        self.board = board
+        self.period = period
+        self.page = page
+        self.pages = pages
+        self.prev_btn.disabled = page <= 0
+        self.next_btn.disabled = page >= pages - 1
+
+    async def _show(self, interaction: discord.Interaction, page: int):
+        await interaction.response.defer()
+        embed, file, pages = await build_leaderboard_message(interaction.guild, page, self.board, self.period)
+        self.page = max(0, min(page, pages - 1))
+        self.pages = pages
+        self.prev_btn.disabled = self.page <= 0
+        self.next_btn.disabled = self.page >= pages - 1
+        await interaction.edit_original_response(embed=embed, attachments=[file] if file else [], view=self)
+
+    @discord.ui.button(emoji="◀️", style=discord.ButtonStyle.secondary)
+    async def prev_btn(self, interaction: discord.Interaction, button: Button):
+        await self._show(interaction, self.page - 1)
+
+    @discord.ui.button(emoji="▶️", style=discord.ButtonStyle.secondary)
+    async def next_btn(self, interaction: discord.Interaction, button: Button):
+        await self._show(interaction, self.page + 1)
+
+async def send_leaderboard(interaction: discord.Interaction, *, ephemeral: bool, board: str = "unveils", period: str = "all"):
+    """Shared by /leaderboard and the Info view's button."""
+    guild = interaction.guild
 
-        embed = discord.Embed(
-            title="Veil Leaderboard",
-            description="**Top 10 Unveilers**",
-            color=0xeeac00
+    # Gate to Premium/Elite
+    tier = await asyncio.to_thread(get_subscription_tier, guild.id)
+    if tier not in ("premium", "elite"):
+        incorrectmoji = str(client.app_emojis["veilincorrect"])
+        return await reply(
+            interaction,
+            embed=discord.Embed(
+                title=f"{incorrectmoji} Premium Feature",
+                description="The leaderboard is only available for **Premium** and **Elite** tiers.",
+                color=0x992d22
+            ),
+            ephemeral=True
         )
-        # keep or change this to your logo
-        embed.set_thumbnail(url="https://i.imgur.com/E2jxHuj.png")
-
-        for idx, (member, unveils) in enumerate(ranked, start=1):
-            name = get_display_name_safe(member).title()
-            icon = badge.get(idx, "🏅")
-            embed.add_field(
-                name=f"{icon} {name}",
-                value=f"{fmt(unveils)} unveils",
-                inline=False
-            )
+    # past the private error path: a watchdog defer may now match our own visibility
+    interaction.extras["ack_policy"] = "ephemeral" if ephemeral else "public"
+
+    # the aggregate may hit the DB; off the loop so the ack watchdog can step in
+    await load_leaderboard_rows(guild.id, board, period)
+    if not ranked_members(guild, board, period):
+        embed, _ = build_leaderboard_embed(guild, 0, board, period)
+        return await reply(interaction, embed=embed, ephemeral=True)
+
+    # a fresh card may take longer than the 3s ack window
+    await defer_once(interaction, ephemeral=ephemeral)
+    embed, file, pages = await build_leaderboard_message(guild, 0, board, period)
+    kwargs = {"embed": embed, "ephemeral": ephemeral}
+    if file:
+        kwargs["file"] = file
+    if pages > 1:
+        kwargs["view"] = LeaderboardPageView(guild.id, 0, pages, board, period)
+    await interaction.followup.send(**kwargs)
 
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+class LeaderboardButton(Button):
+    def __init__(self):
+        super().__init__(label="Leaderboard", style=discord.ButtonStyle.secondary, emoji="🏆", custom_id="leaderboard_btn")
+
+    async def callback(self, interaction: discord.Interaction):
+        await send_leaderboard(interaction, ephemeral=True)
 
 @client.event
 async def on_guild_join(guild):
     ensure_free_subscription(guild.id)
 
+    # startup chunking is off, so fetch members before seeding veil_users
+    if not guild.chunked:
+        try:
+            await guild.chunk(cache=True)
+        except Exception as e:
+            print(f"⚠️ chunk failed for new guild {guild.id}: {e}")
+
     now = datetime.now(timezone.utc)
 
     with get_safe_cursor() as cur:
@@ -3938,6 +6070,10 @@ async def on_guild_join(guild):
 
 @client.event
 async def on_interaction(interaction: discord.Interaction):
+    key = interaction_key(interaction)
+    if key:
+        watch_ack(interaction, key)
+
     if interaction.type != discord.InteractionType.component:
         return
 
@@ -4047,14 +6183,17 @@ async def on_interaction(interaction: discord.Interaction):
 
     elif cid == "guess_btn":
         message_id = interaction.message.id
+        guild = interaction.guild
+        # candidates come from the member cache; start filling it while we hit the DB
+        chunk = ensure_guild_chunked(guild)
 
-        with get_safe_cursor() as cur:
-            cur.execute("SELECT content, author_id FROM veil_messages WHERE message_id = %s", (message_id,))
-            result = cur.fetchone()
+        with_recent = needs_recent_seed(guild, interaction.channel.id)
+        result = await asyncio.to_thread(load_guess_context, message_id, guild.id, interaction.user.id, with_recent)
+        incorrectmoji = str(client.app_emojis["veilincorrect"])
 
         if not result:
-            incorrectmoji = str(client.app_emojis["veilincorrect"]) 
-            return await interaction.response.send_message(
+            return await reply(
+                interaction,
                 embed=discord.Embed(
                     title=f"{incorrectmoji} Message Not Found",
                     description="Veil message not found.",
@@ -4063,12 +6202,12 @@ async def on_interaction(interaction: discord.Interaction):
                 ephemeral=True
             )
 
-        veil_text, author_id = result
+        veil_text, author_id, is_unveiled, guess_count, cap, already_guessed, recent_ids = result
 
         # 🚫 Block guessing your own veil
         if interaction.user.id == author_id:
-            incorrectmoji = str(client.app_emojis["veilincorrect"]) 
-            return await interaction.response.send_message(
+            return await reply(
+                interaction,
                 embed=discord.Embed(
                     title=f"{incorrectmoji} Unveil Error",
                     description="You sent this message, so you cannot unveil it!",
@@ -4077,17 +6216,22 @@ async def on_interaction(interaction: discord.Interaction):
                 ephemeral=True
             )
 
-        # 🚫 Check if this user has already guessed this veil
-        with get_safe_cursor() as cur:
-            cur.execute(
-                "SELECT 1 FROM veil_guesses WHERE message_id = %s AND guesser_id = %s",
-                (message_id, interaction.user.id)
+        # 🚫 Nothing left to guess — don't bother building the dropdown
+        if is_unveiled or guess_count >= cap:
+            return await reply(
+                interaction,
+                embed=discord.Embed(
+                    title=f"{incorrectmoji} No More Guesses",
+                    description=f"This veil is already unveiled or has {cap} guesses.",
+                    color=0x992d22
+                ),
+                ephemeral=True
             )
-            already_guessed = cur.fetchone() is not None
 
+        # 🚫 Check if this user has already guessed this veil
         if already_guessed:
-            incorrectmoji = str(client.app_emojis["veilincorrect"]) 
-            return await interaction.response.send_message(
+            return await reply(
+                interaction,
                 embed=discord.Embed(
                     title=f"{incorrectmoji} Unveil Error",
                     description="You can only guess **once per veil**.",
@@ -4096,8 +6240,31 @@ async def on_interaction(interaction: discord.Interaction):
                 ephemeral=True
             )
 
+        if recent_ids is not None:
+            seed_recent_posters(guild, interaction.channel.id, recent_ids)
+
+        # Cache still filling (startup skips chunking): give the chunk a moment, and
+        # never build the dropdown without the real author in it
+        author = guild.get_member(author_id)
+        if chunk or author is None:
+            await defer_once(interaction, ephemeral=True, thinking=True)
+            if chunk:
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(asyncio.shield(chunk), CHUNK_GUESS_WAIT)
+            author = guild.get_member(author_id) or await resolve_veil_author(guild, author_id)
+        if author is None:
+            return await reply(
+                interaction,
+                embed=discord.Embed(
+                    title=f"{incorrectmoji} Try Again Shortly",
+                    description="Veil is still loading this server's members. Try again in a few seconds.",
+                    color=0x992d22
+                ),
+                ephemeral=True
+            )
+
         # ✅ Proceed with normal guessing
-        view = UnveilView(message_id, author_id, interaction)
+        view = UnveilView(message_id, author, interaction)
         maskemoji = str(client.app_emojis["veilemoji"])
         embed = discord.Embed(
             title=f"{maskemoji} Make a Guess",
@@ -4105,7 +6272,7 @@ async def on_interaction(interaction: discord.Interaction):
             color=0xeeac00
         )
 
-        await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
+        await reply(interaction, embed=embed, view=view, ephemeral=True)
 
     elif cid == "cancel_subscription":
         guild = interaction.guild
@@ -4174,6 +6341,7 @@ async def on_interaction(interaction: discord.Interaction):
             """, (guild_id,))
 
             cur.connection.commit()  # ✅ Commit after the update
+        forget_admin_log_channel(guild_id)
 
         incorrectmoji = str(client.app_emojis["veilincorrect"]) 
         # ✅ Respond to admin
@@ -4265,107 +6433,14 @@ async def fix_tier_guild_error(interaction: discord.Interaction, error: app_comm
         )
 
 @tree.command(name="leaderboard", description="🏆 Show the top unveilers")
-async def leaderboard(interaction: discord.Interaction):
-    guild = interaction.guild
-    guild_id = guild.id
-
-    # Gate to Premium/Elite
-    tier = get_subscription_tier(guild_id)
-    if tier not in ("premium", "elite"):
-        incorrectmoji = str(client.app_emojis["veilincorrect"])
-        return await interaction.response.send_message(
-            embed=discord.Embed(
-                title=f"{incorrectmoji} Premium Feature",
-                description="The leaderboard is only available for **Premium** and **Elite** tiers.",
-                color=0x992d22
-            ),
-            ephemeral=True
-        )
-
-    # All text channels in this guild
-    channel_ids = tuple(c.id for c in guild.text_channels)
-    if not channel_ids:
-        return await interaction.response.send_message(
-            embed=discord.Embed(
-                title="Veil Leaderboard",
-                description="No text channels found for this server.",
-                color=0xeeac00
-            ),
-            ephemeral=True
-        )
-
-    # Top 10 unveilers
-    with get_safe_cursor() as cur:
-        cur.execute("""
-            SELECT vg.guesser_id, COUNT(*) AS unveils
-            FROM veil_guesses vg
-            JOIN veil_messages vm ON vm.message_id = vg.message_id
-            WHERE vg.is_correct = TRUE
-              AND vm.channel_id IN %s
-            GROUP BY vg.guesser_id
-            ORDER BY unveils DESC
-            LIMIT 50
-        """, (channel_ids,))
-        rows = cur.fetchall()
-
-    # Resolve members that are still in the guild
-    ranked = []
-    for user_id, unveils in rows:
-        m = guild.get_member(user_id)
-        if m:
-            ranked.append((m, unveils))
-
-            
-    ranked = ranked[:10]
-
-
-    if not ranked:
-        return await interaction.response.send_message(
-            embed=discord.Embed(
-                title="Veil Leaderboard",
-                description="No users in this server have unveiled any messages yet.",
-                color=0xeeac00
-            ),
-            ephemeral=True
-        )
-
-    # Badges: 1–3 medals, 4–10 your custom participation emojis (fallback 🏅)
-    badge = {
-        1: str(client.app_emojis["1st"]),
-        2: str(client.app_emojis["2nd"]),
-        3: str(client.app_emojis["3rd"]),
-        4: str(client.app_emojis["4th"]),
-        5: str(client.app_emojis["5th"]),
-        6: str(client.app_emojis["6th"]),
-        7: str(client.app_emojis["7th"]),
-        8: str(client.app_emojis["8th"]),
-        9: str(client.app_emojis["9th"]),
-        10: str(client.app_emojis["10th"])
-    }
-
-    def fmt(n):
-        try: return f"{int(n):,}"
-        except: return str(n)
-
-    embed = discord.Embed(
-        title="Veil Leaderboard",
-        description="**Top 10 Unveilers**",
-        color=0xeeac00
-    )
-    # Use server icon if available
-    embed.set_thumbnail(url="https://i.imgur.com/E2jxHuj.png")
-
-    for idx, (member, unveils) in enumerate(ranked, start=1):
-        name = get_display_name_safe(member).title()
-        icon = badge.get(idx, "🏅")
-        embed.add_field(
-            name=f"{icon} {name}",
-            value=f"{fmt(unveils)} unveils",
-            inline=False
-        )
-
+@app_commands.describe(board="What to rank (default: unveils)", period="Time window (default: all time)")
+async def leaderboard(
+    interaction: discord.Interaction,
+    board: Literal["unveils", "votes"] = "unveils",
+    period: Literal["week", "month", "all"] = "all",
+):
     # Public message (change to ephemeral=True if you prefer)
-    await interaction.response.send_message(embed=embed)
+    await send_leaderboard(interaction, ephemeral=False, board=board, period=period)
     
 @tree.command(name="user", description="👤 Check Veil User Stats")
 @app_commands.describe(user="The user to check (optional)")
@@ -4407,7 +6482,8 @@ async def veil_command(
 
     # Validate text-only constraints
     if message:
-        total_emojis = count_emojis_all(message)
+        analysis = analyze_text(message)
+        total_emojis = analysis.emoji_count
         if total_emojis > EMOJI_LIMIT:
             return await interaction.response.send_message(
                 embed=discord.Embed(
@@ -4421,7 +6497,7 @@ async def veil_command(
                 ephemeral=True
             )
 
-        visual_count = visual_length(message)
+        visual_count = analysis.visual_length
         if visual_count > MAX_VISUAL:
             return await interaction.response.send_message(
                 embed=discord.Embed(
@@ -4449,6 +6525,11 @@ async def veil_command(
         ephemeral=True
     )
 
+    # rate limit after the ack (a short wait for a token must not eat the 3s window)
+    retry_after = await take_veil_token(interaction.guild.id, interaction.user.id)
+    if retry_after:
+        return await interaction.edit_original_response(embed=rate_limited_embed(retry_after))
+
     # Dispatch (text may be None if image mode)
     await send_veil_message(
         interaction,
@@ -4743,8 +6824,17 @@ async def guilds_cmd(inter: discord.Interaction):
             ephemeral=True
         )
 
+    # Defer: peer clusters answer over local IPC, which can take a moment
+    await inter.response.defer(ephemeral=True)
+    clusters = await gather_cluster_stats()
+    offline = [c["cluster_id"] for c in clusters if c.get("offline")]
+
     # Collect & sort guilds (by member count desc, fallback to 0)
-    guilds = sorted(client.guilds, key=lambda g: (g.member_count or 0), reverse=True)
+    guilds = sorted(
+        (tuple(g) for c in clusters for g in c["guilds"]),   # (id, name, member_count)
+        key=lambda g: (g[2] or 0),
+        reverse=True
+    )
 
     # Build lines
     def fmt(n):
@@ -4752,8 +6842,8 @@ async def guilds_cmd(inter: discord.Interaction):
         except: return str(n)
 
     lines = [
-        f"{idx:>2}. {g.name} — `{g.id}` ({fmt(getattr(g, 'member_count', 0) or 0)} members)"
-        for idx, g in enumerate(guilds, start=1)
+        f"{idx:>2}. {name} — `{gid}` ({fmt(count or 0)} members)"
+        for idx, (gid, name, count) in enumerate(guilds, start=1)
     ]
 
     # First chunk fits under Discord 2000-char message limit (keep some headroom)
@@ -4765,8 +6855,10 @@ async def guilds_cmd(inter: discord.Interaction):
         total += len(line) + 1
 
     header = f"**Guilds:** {len(guilds)}"
+    if offline:
+        header += f" (clusters offline: {', '.join(map(str, offline))})"
     body = "```" + ("\n".join(out) if out else "No guilds") + "```"
-    await inter.response.send_message(f"{header}\n{body}", ephemeral=True)
+    await inter.followup.send(f"{header}\n{body}", ephemeral=True)
 
     # If truncated, also send a full text file as an ephemeral follow-up
     if len(out) < len(lines):
@@ -4796,47 +6888,66 @@ async def shards_cmd(inter: discord.Interaction):
             ephemeral=True
         )
 
-    # Shard latencies and counts
-    rows = []
-    shard_info = getattr(client, "shards", {}) or {}
-
-    # Guilds per shard
-    per_shard_guilds = Counter(g.shard_id for g in client.guilds)
-
-    # Members per shard (sums member_count across guilds on that shard)
-    per_shard_members = Counter()
-    for g in client.guilds:
-        sid = g.shard_id if g.shard_id is not None else 0
-        per_shard_members[sid] += (getattr(g, "member_count", 0) or 0)
-
-    total_guilds = len(client.guilds)
-    total_members = sum(per_shard_members.values())
+    # Defer: peer clusters answer over local IPC, which can take a moment
+    await inter.response.defer(ephemeral=True)
+    clusters = await gather_cluster_stats()
 
-    if shard_info:
-        for sid, info in sorted(shard_info.items()):
-            ms = int((getattr(info, "latency", client.latency) or 0) * 1000)
+    rows = []
+    total_guilds = 0
+    total_members = 0
+    total_rss = 0
+    cache_lookups = cache_hits = 0
+    queue_depth, queue_wait = Counter(), Counter()
+    log_stats = Counter()
+    acks = Counter()
+    slowest = {}   # interaction key -> worst p95 across clusters
+    shard_count = 1
+    for c in clusters:
+        if c.get("offline"):
+            rows.append(f"-- cluster {c['cluster_id']}: 🔴 offline")
+            continue
+        shard_count = max(shard_count, c.get("shard_count") or 1)
+        total_rss += c.get("rss_mb", 0)
+        cache_lookups += c.get("render_cache", {}).get("lookups", 0)
+        cache_hits += c.get("render_cache", {}).get("hits", 0)
+        log_stats.update(c.get("admin_logs", {}))
+        rq = c.get("render_queue", {})
+        queue_depth.update(rq.get("depth", {}))
+        for name, ms in rq.get("wait_p95_ms", {}).items():
+            queue_wait[name] = max(queue_wait[name], ms)
+        for key, st in c.get("acks", {}).items():
+            acks.update({k: st[k] for k in ("count", "late", "auto_deferred", "expired")})
+            slowest[key] = max(slowest.get(key, 0), st["p95_ms"])
+        if CLUSTER_COUNT > 1:
+            rows.append(f"-- cluster {c['cluster_id']} • {c.get('rss_mb', 0)} MB RSS")
+        for sh in c["shards"]:
+            ms = sh["latency_ms"]
             dot = "🟢" if ms < 250 else ("🟡" if ms < 600 else "🔴")
-            gcount = per_shard_guilds.get(sid, 0)
-            mcount = per_shard_members.get(sid, 0)
-            rows.append(f"{sid:>2}: {dot} {ms} ms • {gcount} guilds • {fmt(mcount)} members")
-        shard_count = client.shard_count or len(shard_info)
-    else:
-        # Unsharded fallback
-        ms = int(client.latency * 1000)
-        dot = "🟢" if ms < 250 else ("🟡" if ms < 600 else "🔴")
-        rows.append(f" 0: {dot} {ms} ms • {total_guilds} guilds • {fmt(total_members)} members")
-        shard_count = 1
+            rows.append(f"{sh['id']:>2}: {dot} {ms} ms • {sh['guilds']} guilds • {fmt(sh['members'])} members")
+        total_guilds += len(c["guilds"])
+        total_members += sum(count or 0 for _, _, count in c["guilds"])
 
     header = (
-        f"**Shards:** {shard_count}\n"
+        f"**Shards:** {shard_count}"
+        + (f" across {CLUSTER_COUNT} clusters" if CLUSTER_COUNT > 1 else "") + "\n"
         f"**Total Guilds:** {fmt(total_guilds)}\n"
         f"**Total Members:** {fmt(total_members)}\n"
-        "```"
+        f"**Memory (RSS):** {fmt(total_rss)} MB\n"
+        f"**Render Cache:** {(cache_hits / cache_lookups if cache_lookups else 0):.1%} hits ({fmt(cache_lookups)} lookups)\n"
+        f"**Render Queue:** " + " • ".join(
+            f"{name} {queue_depth[name]} queued, p95 wait {queue_wait[name]} ms" for name in RENDER_PRIORITY_NAMES
+        ) + "\n"
+        f"**Admin Logs:** {fmt(log_stats['sent'])} sent • {fmt(log_stats['queued'])} queued • "
+        f"{fmt(log_stats['failed'])} failed • {fmt(log_stats['digests'])} digests\n"
+        f"**Interaction Acks:** {fmt(acks['count'])} • {fmt(acks['late'])} late • "
+        f"{fmt(acks['auto_deferred'])} auto-deferred • {fmt(acks['expired'])} expired\n"
+        + "".join(f"  slow p95 `{k}` {ms} ms\n" for k, ms in sorted(slowest.items(), key=lambda kv: -kv[1])[:3] if ms >= 1000)
+        + "```"
         + ("\n".join(rows) if rows else "no shard data")
         + "```"
     )
 
-    await inter.response.send_message(header, ephemeral=True)
+    await inter.followup.send(header, ephemeral=True)
 
 @tree.command(name="vote", description="Earn 15 Veil Coins every 12 hours by voting on top.gg")
 async def vote_cmd(interaction: discord.Interaction):
@@ -4965,6 +7076,216 @@ async def fixdupes_globalonly(inter: discord.Interaction):
         except Exception:
             pass
 
+# ────────────────────────── PAYMENT EVENTS ──────────────────────────
+# Coin top-ups and tier upgrades arrive either as signed JSON POSTs to the
+# embedded receiver (WEBHOOK_PORT) or, legacy, as text in the relay channel.
+# Both paths end in the same two handlers.
+async def handle_coin_topup(session_id: str, user_id: int, guild_id: int, coins: int) -> bool:
+    # look up the stored interaction info (as you already do)
+    with get_safe_cursor() as cur:
+        cur.execute("""
+            SELECT interaction_token, application_id, user_id, guild_id, coins
+            FROM coin_checkout_sessions
+            WHERE stripe_session_id = %s
+        """, (session_id,))
+        row = cur.fetchone()
+
+    if not row:
+        print(f"[coin] no session {session_id} found; ignoring")
+        return False
+
+    interaction_token, application_id, u_saved, g_saved, coins_saved = row
+    if u_saved != user_id or g_saved != guild_id:
+        print(f"[coin] id mismatch for {session_id}; ignoring")
+        return False
+    # ... after verifying row matches ...
+    new_balance = get_user_coins(user_id, guild_id) or 0
+    veilcoinemoji = str(client.app_emojis.get("veilcoin", "🪙"))
+
+    # format numbers
+    coins_str = fmt(coins_saved)
+    bal_str   = fmt(new_balance)
+
+    payload = {
+        "embeds": [{
+            "title": f"{veilcoinemoji} +{coins_str} Veil Coins Added",
+            "description": f"Thanks for your support! Your new balance is **{bal_str}**.",
+            "color": 0xeeac00,
+            "fields": [
+                {"name": "Amount",  "value": f"{veilcoinemoji} `{coins_str}`", "inline": True},
+                {"name": "Balance", "value": f"`{bal_str}`",                   "inline": True},
+            ],
+            "footer": {"text": "Tip: use /user any time to see your balance."}
+        }],
+        "components": []
+    }
+
+    url = f"{DISCORD_API_BASE}/webhooks/{int(application_id)}/{interaction_token}/messages/@original"
+    try:
+        r = await asyncio.to_thread(requests.patch, url, json=payload, timeout=6)
+        print(f"[coin] PATCH @original -> {r.status_code} {r.text[:150]}")
+    except Exception as e:
+        print(f"[coin] PATCH failed: {e}")
+    return True
+
+async def handle_guild_upgrade(guild_id: int, tier: str) -> bool:
+    guild = client.get_guild(guild_id)
+    if not guild:
+        print(f"[upgrade] guild {guild_id} not in cache")
+        return False
+
+    with get_safe_cursor() as cur:
+        cur.execute("SELECT channel_id FROM veil_channels WHERE guild_id=%s", (guild_id,))
+        row = cur.fetchone()
+    if not row:
+        print(f"[upgrade] no configured veil channel for guild {guild_id}")
+        return False
+
+    channel_id = row[0]
+    channel = guild.get_channel(channel_id) or client.get_channel(channel_id)
+    if not channel or not channel.permissions_for(guild.me).send_messages:
+        print(f"[upgrade] cannot send in channel {channel_id} (guild {guild_id})")
+        return False
+
+    tiers_display = {"basic": "Basic 🌟", "premium": "Premium 💎", "elite": "Elite 🧠"}
+    if tier not in tiers_display:
+        print(f"[upgrade] unknown tier {tier} for guild {guild_id}")
+        return False
+
+    veilcoinemoji = str(client.app_emojis.get("veilcoin", "🪙"))
+    perks = {
+        "basic":   [f"{veilcoinemoji} • **250** coins/mo",   "🔄 • Monthly refills", "🔍 • Earn by unveiling"],
+        "premium": [f"{veilcoinemoji} • **1,000** coins/mo", "🔄 • Monthly refills", "🔍 • Earn by unveiling", "🥇 • Leaderboard"],
+        "elite":   [f"{veilcoinemoji} • Unlimited coins",    "🗃️ • Admin logs",      "🥇 • Leaderboard",       "💎 • Early features"],
+    }
+
+    embed = discord.Embed(
+        title=f"🎉 {guild.name} Upgraded!",
+        description=f"This server has been upgraded to **{tiers_display[tier]}**.\n\nYour members now get:\n" + "\n".join(perks[tier]),
+        color=0xeeac00
+    )
+    if guild.icon:
+        embed.set_footer(text="VeilBot • Every message wears a mask", icon_url=guild.icon.url)
+    else:
+        embed.set_footer(text="VeilBot • Every message wears a mask")
+
+    view = AdminLog() if tier == "elite" else None
+    try:
+        await channel.send(embed=embed, view=view)
+        print(f"✅ upgrade embed sent to {guild.name} ({guild_id}) tier={tier}")
+    except Exception as e:
+        print(f"❌ failed to send upgrade embed in {guild.name}: {e}")
+    return True
+
+async def handle_payment_event(event: dict) -> bool | None:
+    """
+    Dispatch a decoded webhook event. Raises ValueError on a malformed one.
+    None = the guild isn't in any cluster's cache yet; the sender should retry.
+    """
+    kind = event.get("type")
+    if kind == "coin_topup":
+        return await handle_coin_topup(
+            str(event["session_id"]), int(event["user_id"]), int(event["guild_id"]), int(event["coins"])
+        )
+    if kind == "guild_upgrade":
+        guild_id = int(event["guild_id"])
+        tier = str(event["tier"]).lower()
+        # the upgrade embed needs the guild cache — hand off to the owning cluster
+        if not client.get_guild(guild_id):
+            return await forward_upgrade_to_peers(guild_id, tier) if CLUSTER_COUNT > 1 else None
+        return await handle_guild_upgrade(guild_id, tier)
+    raise ValueError(f"unknown event type {kind!r}")
+
+def sign_webhook_payload(body: bytes, timestamp: int, secret: str = WEBHOOK_SECRET) -> str:
+    """Value for the X-Veil-Signature header: HMAC-SHA256 over '<timestamp>.<body>'."""
+    mac = hmac.new(secret.encode("utf-8"), f"{timestamp}.".encode("utf-8") + body, hashlib.sha256)
+    return f"t={timestamp},v1={mac.hexdigest()}"
+
+def verify_webhook_signature(body: bytes, header: str, secret: str = WEBHOOK_SECRET, now: int | None = None) -> bool:
+    if not secret or not header:
+        return False
+    parts = dict(p.strip().split("=", 1) for p in header.split(",") if "=" in p)
+    try:
+        ts = int(parts.get("t", ""))
+    except ValueError:
+        return False
+    now = int(datetime.now(timezone.utc).timestamp()) if now is None else now
+    if abs(now - ts) > WEBHOOK_TOLERANCE:
+        return False  # stale or replayed
+    expected = sign_webhook_payload(body, ts, secret).split("v1=", 1)[1]
+    return hmac.compare_digest(expected, parts.get("v1", ""))
+
+def claim_webhook_event(event_id: str, kind: str | None) -> str:
+    """Take the idempotency key while we handle the event: "new", "done" (already processed) or "busy"."""
+    # own connection, so the key commits (or not) independently of the loop thread's work
+    with pooled_cursor() as cur:
+        cur.execute("""
+            INSERT INTO payment_webhook_events (event_id, kind)
+            VALUES (%s, %s)
+            ON CONFLICT (event_id) DO UPDATE
+               SET received_at = NOW(), kind = EXCLUDED.kind
+             WHERE payment_webhook_events.processed_at IS NULL
+               AND payment_webhook_events.received_at < NOW() - make_interval(secs => %s)
+            RETURNING 1
+        """, (event_id, kind, WEBHOOK_LEASE))
+        if cur.fetchone():
+            return "new"
+        cur.execute("SELECT processed_at FROM payment_webhook_events WHERE event_id = %s", (event_id,))
+        row = cur.fetchone()
+        return "done" if row and row[0] else "busy"
+
+def complete_webhook_event(event_id: str):
+    # only now is the event "seen": retries after this are acknowledged as duplicates
+    with pooled_cursor() as cur:
+        cur.execute("UPDATE payment_webhook_events SET processed_at = NOW() WHERE event_id = %s", (event_id,))
+
+def release_webhook_event(event_id: str):
+    # not processed (rejected or crashed) — let the sender's retry through
+    with pooled_cursor() as cur:
+        cur.execute("DELETE FROM payment_webhook_events WHERE event_id = %s AND processed_at IS NULL", (event_id,))
+
+async def _webhook_payment(request: web.Request) -> web.Response:
+    body = await request.read()
+    if not verify_webhook_signature(body, request.headers.get("X-Veil-Signature", "")):
+        return web.json_response({"ok": False, "error": "bad signature"}, status=401)
+
+    try:
+        event = json.loads(body)
+        event_id = str(event.get("id") or request.headers["Idempotency-Key"])
+    except (ValueError, KeyError, AttributeError):
+        return web.json_response({"ok": False, "error": "bad payload"}, status=400)
+
+    claim = await asyncio.to_thread(claim_webhook_event, event_id, event.get("type"))
+    if claim == "done":
+        return web.json_response({"ok": True, "duplicate": True})
+    if claim == "busy":
+        # a concurrent delivery of the same event is still being handled
+        return web.json_response({"ok": False, "error": "in progress"}, status=409)
+
+    try:
+        handled = await handle_payment_event(event)
+    except (ValueError, KeyError, TypeError) as e:
+        await asyncio.to_thread(release_webhook_event, event_id)
+        return web.json_response({"ok": False, "error": str(e)}, status=400)
+    except Exception as e:
+        print(f"❌ webhook {event_id} failed: {e}")
+        await asyncio.to_thread(release_webhook_event, event_id)
+        return web.json_response({"ok": False, "error": "internal"}, status=500)
+    if handled is None:
+        # guild not cached yet (startup, or its cluster is restarting)
+        await asyncio.to_thread(release_webhook_event, event_id)
+        return web.json_response({"ok": False, "error": "guild not ready"}, status=503)
+    await asyncio.to_thread(complete_webhook_event, event_id)
+    return web.json_response({"ok": True, "handled": handled})
+
+async def start_webhook_server():
+    app = web.Application(client_max_size=64 * 1024)
+    app.router.add_post("/webhooks/payment", _webhook_payment)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "0.0.0.0", WEBHOOK_PORT).start()
+    client.webhook_runner = runner
+
 @client.event
 async def on_message(message: discord.Message):
     # Only parse the single relay channel
@@ -4984,116 +7305,21 @@ async def on_message(message: discord.Message):
     # --- A) COIN TOP-UP ------------------------------------------------------
     m_coin = COIN_RE.match(txt)
     if m_coin:
-        session_id = m_coin.group(1)
-        user_id    = int(m_coin.group(2))
-        guild_id   = int(m_coin.group(3))
-        coins      = int(m_coin.group(4))
-
-        # look up the stored interaction info (as you already do)
-        with get_safe_cursor() as cur:
-            cur.execute("""
-                SELECT interaction_token, application_id, user_id, guild_id, coins
-                FROM coin_checkout_sessions
-                WHERE stripe_session_id = %s
-            """, (session_id,))
-            row = cur.fetchone()
-
-        if not row:
-            print(f"[coin] no session {session_id} found; ignoring")
-            return
-
-        interaction_token, application_id, u_saved, g_saved, coins_saved = row
-        if u_saved != user_id or g_saved != guild_id:
-            print(f"[coin] id mismatch for {session_id}; ignoring")
-            return
-        # ... after verifying row matches ...
-        new_balance = get_user_coins(user_id, guild_id) or 0
-        veilcoinemoji = str(client.app_emojis.get("veilcoin", "🪙"))
-        
-        # format numbers
-        coins_str = fmt(coins_saved)
-        bal_str   = fmt(new_balance)
-        
-        payload = {
-            "embeds": [{
-                "title": f"{veilcoinemoji} +{coins_str} Veil Coins Added",
-                "description": f"Thanks for your support! Your new balance is **{bal_str}**.",
-                "color": 0xeeac00,
-                "fields": [
-                    {"name": "Amount",  "value": f"{veilcoinemoji} `{coins_str}`", "inline": True},
-                    {"name": "Balance", "value": f"`{bal_str}`",                   "inline": True},
-                ],
-                "footer": {"text": "Tip: use /user any time to see your balance."}
-            }],
-            "components": []
-        }
-
-        url = f"{DISCORD_API_BASE}/webhooks/{int(application_id)}/{interaction_token}/messages/@original"
-        try:
-            r = requests.patch(url, json=payload, timeout=6)
-            print(f"[coin] PATCH @original -> {r.status_code} {r.text[:150]}")
-        except Exception as e:
-            print(f"[coin] PATCH failed: {e}")
-
-        # Clean up relay post
-        try:
-            await message.delete()
-        except Exception:
-            pass
+        handled = await handle_coin_topup(
+            m_coin.group(1), int(m_coin.group(2)), int(m_coin.group(3)), int(m_coin.group(4))
+        )
+        if handled:
+            # Clean up relay post
+            try:
+                await message.delete()
+            except Exception:
+                pass
         return
 
     # --- B) GUILD UPGRADE ----------------------------------------------------
     m_up = UPGRADE_RE.search(txt)
     if m_up:
-        guild_id = int(m_up.group(1))
-        tier     = m_up.group(2).lower()  # "basic"|"premium"|"elite"
-
-        guild = client.get_guild(guild_id)
-        if not guild:
-            print(f"[upgrade] guild {guild_id} not in cache")
-            return
-
-        with get_safe_cursor() as cur:
-            cur.execute("SELECT channel_id FROM veil_channels WHERE guild_id=%s", (guild_id,))
-            row = cur.fetchone()
-        if not row:
-            print(f"[upgrade] no configured veil channel for guild {guild_id}")
-            return
-
-        channel_id = row[0]
-        channel = guild.get_channel(channel_id) or client.get_channel(channel_id)
-        if not channel or not channel.permissions_for(guild.me).send_messages:
-            print(f"[upgrade] cannot send in channel {channel_id} (guild {guild_id})")
-            return
-
-        tiers_display = {"basic": "Basic 🌟", "premium": "Premium 💎", "elite": "Elite 🧠"}
-        if tier not in tiers_display:
-            print(f"[upgrade] unknown tier {tier} for guild {guild_id}")
-            return
-
-        veilcoinemoji = str(client.app_emojis.get("veilcoin", "🪙"))
-        perks = {
-            "basic":   [f"{veilcoinemoji} • **250** coins/mo",   "🔄 • Monthly refills", "🔍 • Earn by unveiling"],
-            "premium": [f"{veilcoinemoji} • **1,000** coins/mo", "🔄 • Monthly refills", "🔍 • Earn by unveiling", "🥇 • Leaderboard"],
-            "elite":   [f"{veilcoinemoji} • Unlimited coins",    "🗃️ • Admin logs",      "🥇 • Leaderboard",       "💎 • Early features"],
-        }
-
-        embed = discord.Embed(
-            title=f"🎉 {guild.name} Upgraded!",
-            description=f"This server has been upgraded to **{tiers_display[tier]}**.\n\nYour members now get:\n" + "\n".join(perks[tier]),
-            color=0xeeac00
-        )
-        if guild.icon:
-            embed.set_footer(text="VeilBot • Every message wears a mask", icon_url=guild.icon.url)
-        else:
-            embed.set_footer(text="VeilBot • Every message wears a mask")
-
-        view = AdminLog() if tier == "elite" else None
-        try:
-            await channel.send(embed=embed, view=view)
-            print(f"✅ upgrade embed sent to {guild.name} ({guild_id}) tier={tier}")
-        except Exception as e:
-            print(f"❌ failed to send upgrade embed in {guild.name}: {e}")
+        await handle_guild_upgrade(int(m_up.group(1)), m_up.group(2).lower())  # "basic"|"premium"|"elite"
         return
 
 if __name__ == "__main__":
@@ -0,0 +1,62 @@
+"""
+Local stand-in for the Stripe webhook service: signs a payment event the same
+way the real sender must and POSTs it to the bot's embedded receiver.
+
+  python webhook_sender.py coin --session cs_test_123 --user 1 --guild 2 --coins 250
+  python webhook_sender.py upgrade --guild 2 --tier premium --repeat 2
+
+Env: VEIL_WEBHOOK_SECRET (shared secret), WEBHOOK_PORT (default 8080).
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import time
+import uuid
+
+import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+def sign(body: bytes, secret: str, timestamp: int) -> str:
+    mac = hmac.new(secret.encode("utf-8"), f"{timestamp}.".encode("utf-8") + body, hashlib.sha256)
+    return f"t={timestamp},v1={mac.hexdigest()}"
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("kind", choices=["coin", "upgrade"])
+    ap.add_argument("--guild", type=int, required=True)
+    ap.add_argument("--user", type=int)
+    ap.add_argument("--session")
+    ap.add_argument("--coins", type=int)
+    ap.add_argument("--tier", choices=["basic", "premium", "elite"])
+    ap.add_argument("--id", help="event id / idempotency key (default: random)")
+    ap.add_argument("--repeat", type=int, default=1, help="send the same event N times")
+    ap.add_argument("--url", default=f"http://127.0.0.1:{os.getenv('WEBHOOK_PORT', '8080')}/webhooks/payment")
+    args = ap.parse_args()
+
+    if args.kind == "coin":
+        if not (args.user and args.session and args.coins):
+            ap.error("coin needs --user, --session and --coins")
+        event = {"type": "coin_topup", "session_id": args.session, "user_id": args.user,
+                 "guild_id": args.guild, "coins": args.coins}
+    else:
+        if not args.tier:
+            ap.error("upgrade needs --tier")
+        event = {"type": "guild_upgrade", "guild_id": args.guild, "tier": args.tier}
+    event["id"] = args.id or f"evt_local_{uuid.uuid4().hex[:16]}"
+
+    secret = os.getenv("VEIL_WEBHOOK_SECRET", "")
+    if not secret:
+        raise SystemExit("VEIL_WEBHOOK_SECRET is not set")
+
+    body = json.dumps(event).encode("utf-8")
+    for _ in range(args.repeat):
+        headers = {"Content-Type": "application/json", "X-Veil-Signature": sign(body, secret, int(time.time()))}
+        r = requests.post(args.url, data=body, headers=headers, timeout=10)
+        print(r.status_code, r.text)
+
+if __name__ == "__main__":
+    main()